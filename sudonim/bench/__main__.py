@@ -1,33 +1,59 @@
 """MLC LLM benchmark main entrance"""
 
+import contextlib
 import functools
 import json
 import random
-from typing import Any, Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
 
 import numpy as np
 import requests
-from transformers import AutoTokenizer  # pylint: disable=import-error
 
 import mlc_llm
 
-from sudonim.bench.api_endpoint import SUPPORTED_BACKENDS, create_api_endpoint
-from sudonim.bench.dataset import SUPPORTED_DATASET, Dataset, create_dataset
+from sudonim.bench.api_endpoint import (
+    SUPPORTED_BACKENDS,
+    SUPPORTED_ENDPOINT_POLICIES,
+    APIEndPoint,
+    create_api_endpoint,
+)
+from sudonim.bench.capacity_search import (
+    SUPPORTED_SEARCH_MODES,
+    check_slos,
+    parse_slos,
+    search_capacity,
+)
+from sudonim.bench.dataset import (
+    SUPPORTED_DATASET,
+    SUPPORTED_LENGTH_DISTRIBUTIONS,
+    Dataset,
+    create_dataset,
+)
+from sudonim.bench.distributed import AUTHKEY_ENV, create_coordinator, distribute_pipeline
+from sudonim.bench.parallel_tokenizer import ParallelTokenizer
 from sudonim.bench.request_processor import (
+    SUPPORTED_THINK_TIME_DISTRIBUTIONS,
     MetricAnalyzer,
     RequestProcessor,
+    create_fixed_concurrency_pipeline,
+    create_fixed_request_rate_pipeline,
     create_pipelines,
 )
 from sudonim.bench.request_record import (
     RequestRecord,
     convert_reports_to_df,
     generate_metrics_summary,
+    get_steady_state_window,
     pretty_print_report,
+    select_requests_in_window,
 )
 from mlc_llm.cli.serve import EngineConfigOverride
 from mlc_llm.serve import EngineConfig
 from mlc_llm.support import argparse, logging
 
+if TYPE_CHECKING:
+    from transformers import AutoTokenizer  # pylint: disable=import-error
+
 logging.enable_logging()
 logger = logging.getLogger(__name__)
 
@@ -54,6 +80,18 @@ def _parse_request_rate(request_rate_str: Optional[str]) -> Optional[List[np.flo
     return results
 
 
+def _parse_endpoints(endpoints_str: Optional[str]) -> Optional[List[Tuple[str, int]]]:
+    if endpoints_str is None:
+        return None
+    endpoints = []
+    for endpoint_str in endpoints_str.split(","):
+        host, sep, port = endpoint_str.strip().rpartition(":")
+        if not sep or not host or not port.isdigit():
+            raise ValueError(f'Unrecognized endpoint "{endpoint_str}". Expecting "host:port".')
+        endpoints.append((host, int(port)))
+    return endpoints
+
+
 def _parse_mlc_engine_config(config_str: Optional[str]) -> EngineConfig:
     if config_str is None:
         return None
@@ -89,8 +127,9 @@ def _launch_mlc_server(args: argparse.argparse.Namespace):
 def run_pipeline(
     pipeline: RequestProcessor,
     dataset: Dataset,
-    tokenizer: AutoTokenizer,
+    tokenizer: Optional["AutoTokenizer"],
     args: argparse.argparse.Namespace,
+    parallel_tokenizer: Optional[ParallelTokenizer] = None,
 ) -> Tuple[Dict[str, Any], List[RequestRecord]]:
     """Run the pipeline with the given dataset and args. Return the benchmark report dict."""
     random.seed(args.seed)
@@ -102,21 +141,119 @@ def run_pipeline(
         args.output_len_std,
     )
     request_records = pipeline(request_records)
-    num_total_requests = (
-        args.num_requests if not args.per_gpu_workload else args.num_requests * args.num_gpus
-    )
-    assert len(request_records) == num_total_requests
-    sorted_requests: List[RequestRecord] = [None] * num_total_requests
-    for request_record in request_records:
-        assert request_record.request_id is not None
-        assert sorted_requests[request_record.request_id] is None
-        sorted_requests[request_record.request_id] = request_record
-
-    request_records = MetricAnalyzer(tokenizer)(request_records)
-    report = generate_metrics_summary(request_records, num_total_requests, args.num_gpus)
+    if args.duration is None:
+        num_total_requests = (
+            args.num_requests if not args.per_gpu_workload else args.num_requests * args.num_gpus
+        )
+        assert len(request_records) == num_total_requests
+        sorted_requests: List[RequestRecord] = [None] * num_total_requests
+        for request_record in request_records:
+            assert request_record.request_id is not None
+            assert sorted_requests[request_record.request_id] is None
+            sorted_requests[request_record.request_id] = request_record
+    else:
+        # The number of requests sent within the duration is not known in advance and
+        # requests can be sent more than once, so they are renumbered in sending order.
+        num_total_requests = len(request_records)
+        sorted_requests = sorted(
+            request_records, key=lambda request_record: request_record.metrics.start_time
+        )
+        for i, request_record in enumerate(sorted_requests):
+            request_record.request_id = i
+
+    window = None
+    if args.trim_start > 0 or args.trim_end > 0 or args.steady_state_in_flight:
+        exec_feature = request_records[0].metrics.exec_feature or {}
+        window = get_steady_state_window(
+            request_records,
+            args.trim_start,
+            args.trim_end,
+            exec_feature["num_concurrent_requests"] if args.steady_state_in_flight else None,
+        )
+        request_records = select_requests_in_window(request_records, window)
+        num_total_requests = len(request_records)
+        logger.info(
+            "Reporting the %d requests sent in the %.1fs steady-state window",
+            num_total_requests,
+            window[1] - window[0],
+        )
+
+    cancelled_records = [
+        request_record for request_record in request_records if request_record.metrics.cancelled
+    ]
+    request_records = MetricAnalyzer(tokenizer, parallel_tokenizer, args.decode_stall_factor)(
+        request_records
+    )
+    report = generate_metrics_summary(
+        request_records,
+        num_total_requests,
+        args.num_gpus,
+        window,
+        cancelled_records,
+        args.cancel_rate_window,
+    )
     return report, sorted_requests
 
 
+def run_capacity_search(
+    args: argparse.argparse.Namespace,
+    f_create_api_endpoint: Callable[[], APIEndPoint],
+    dataset: Dataset,
+    f_run: Callable[[RequestProcessor], Dict[str, Any]],
+) -> Optional[float]:
+    """Search the highest concurrency or request rate that meets the SLOs.
+    Every step runs a pipeline on the same server and dataset through `f_run`.
+    """
+    if args.num_concurrent_requests is not None or args.request_rate is not None:
+        raise ValueError(
+            '"--search" searches the load itself. Please do not specify '
+            '"--num-concurrent-requests" or "--request-rate".'
+        )
+    if dataset.has_timestamps:
+        raise ValueError(f'Dataset "{args.dataset}" does not support "--search".')
+    if args.slo is None:
+        raise ValueError('Please specify the SLOs to search the capacity under via "--slo".')
+    slos = parse_slos(args.slo)
+
+    if args.search == "concurrency":
+        best_load, results = search_capacity(
+            lambda load: f_run(
+                create_fixed_concurrency_pipeline(args, f_create_api_endpoint, dataset, int(load))
+            ),
+            slos,
+            start=max(int(args.search_start), 1),
+            max_load=int(args.search_max),
+            integer=True,
+        )
+    else:
+        best_load, results = search_capacity(
+            lambda load: f_run(
+                create_fixed_request_rate_pipeline(
+                    args, f_create_api_endpoint, dataset, np.float32(load)
+                )
+            ),
+            slos,
+            start=args.search_start,
+            max_load=args.search_max,
+            integer=False,
+            tolerance=args.search_tolerance,
+        )
+
+    slos_str = ", ".join(str(slo) for slo in slos)
+    # Record the outcome in the report of every step, so that it is also in the CSV.
+    for _, report in results:
+        report["capacity_search"] = {
+            "slos": slos_str,
+            "meets_slos": not check_slos(report, slos),
+            f"max_{args.search.replace('-', '_')}": best_load,
+        }
+    if best_load is None:
+        print(f"No {args.search} of at least {args.search_start:g} meets the SLOs {slos_str}")
+    else:
+        print(f"Max sustainable {args.search} under the SLOs {slos_str}: {best_load:g}")
+    return best_load
+
+
 def query_mlc_server_metrics(host: str, port: int):
     """Try to get the MLC server metrics whenever it exists."""
     try:
@@ -129,31 +266,85 @@ def query_mlc_server_metrics(host: str, port: int):
 
 def main(args: argparse.argparse.Namespace):
     """Main benchmark entrance."""
+    if args.host is None or args.port is None:
+        if args.endpoints is None:
+            raise ValueError('Please specify the server via "--host" and "--port".')
+        args.host, args.port = args.endpoints[0]
     mlc_server = None
     if args.mlc_model_lib:
         mlc_server = _launch_mlc_server(args)
     if args.num_requests <= 0:
         raise ValueError("Number of requests to benchmark must be positive.")
+    if args.duration is not None and args.duration <= 0:
+        raise ValueError("The benchmark duration must be positive.")
+    if args.steady_state_in_flight and (
+        args.num_concurrent_requests is None and args.search != "concurrency"
+    ):
+        raise ValueError(
+            '"--steady-state-in-flight" only works when fixing the number of concurrent requests.'
+        )
+
+    if args.session and args.multi_round:
+        raise ValueError('"--session" and "--multi-round" cannot be used together.')
+    if args.session and args.api_endpoint != "openai-chat":
+        raise ValueError(
+            'The user sessions send the history as chat messages, which requires "openai-chat" '
+            'for "--api-endpoint".'
+        )
+    if args.session and args.steady_state_in_flight and args.session_think_time > 0:
+        raise ValueError(
+            'The users of "--session" are not in flight while thinking, so the in-flight '
+            'requests never reach "--steady-state-in-flight". Please use "--session-think-time 0".'
+        )
+
+    if args.tokenizer is None and args.model_name is None:
+        raise ValueError('Please specify the model name via "--model-name" without a tokenizer.')
 
     def _main():
-        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+        tokenizer = None
+        if args.tokenizer is not None:
+            # Only import transformers when needed, as importing it takes seconds.
+            from transformers import (  # pylint: disable=import-outside-toplevel,import-error
+                AutoTokenizer,
+            )
+
+            tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
         dataset = create_dataset(args, tokenizer)
+        # The tokenizer workers that count the output tokens are reused across all the runs.
+        parallel_tokenizer = (
+            stack.enter_context(ParallelTokenizer(tokenizer, args.tokenize_workers))
+            if tokenizer is not None
+            else None
+        )
         f_create_api_endpoint = functools.partial(create_api_endpoint, args)
-        pipelines = create_pipelines(args, f_create_api_endpoint, dataset)
         reports = []
         alltime_records = {}
-        for i, pipeline in enumerate(pipelines):
-            report, request_records = run_pipeline(pipeline, dataset, tokenizer, args)
+
+        def _run(pipeline: RequestProcessor) -> Dict[str, Any]:
+            if coordinator is not None:
+                distribute_pipeline(pipeline, coordinator)
+            report, request_records = run_pipeline(
+                pipeline, dataset, tokenizer, args, parallel_tokenizer
+            )
             exec_feature = (
                 json.dumps(report["exec_feature"])
                 if report["exec_feature"] is not None
-                else f"pipeline{i}"
+                else f"pipeline{len(reports)}"
             )
             alltime_records[exec_feature] = [
                 request_record.model_dump() for request_record in request_records
             ]
             reports.append(report)
             pretty_print_report(report)
+            return report
+
+        if args.search is not None:
+            run_capacity_search(args, f_create_api_endpoint, dataset, _run)
+            # Report the benchmarked loads in ascending order as the load curve.
+            reports.sort(key=lambda report: list((report["exec_feature"] or {}).values()))
+        else:
+            for pipeline in create_pipelines(args, f_create_api_endpoint, dataset):
+                _run(pipeline)
         query_mlc_server_metrics(args.host, args.port)
 
         # Construct data frame
@@ -169,10 +360,12 @@ def main(args: argparse.argparse.Namespace):
                 json.dump(alltime_records, file, indent=4)
             logger.info("Debug log dumped to file %s", debug_dump_filepath)
 
-    if mlc_server is not None:
-        with mlc_server:
-            _main()
-    else:
+    coordinator = create_coordinator(args)
+    with contextlib.ExitStack() as stack:
+        if mlc_server is not None:
+            stack.enter_context(mlc_server)
+        if coordinator is not None:
+            stack.enter_context(coordinator)
         _main()
 
 
@@ -188,8 +381,17 @@ if __name__ == "__main__":
     parser.add_argument(
         "--dataset-path",
         type=str,
-        required=True,
-        help="The dataset file path.",
+        help="The dataset file path. "
+        'For the "synthetic" and "shared-prefix" datasets, it is an optional word list file '
+        "to draw the prompts from.",
+    )
+    parser.add_argument(
+        "--dataset-cache",
+        type=str,
+        help="The directory to cache the tokenized dataset in. "
+        "When specified, the tokenized dataset is memory-mapped from the cache on later runs "
+        "with the same dataset file, tokenizer and tokenization options. "
+        "Default to None, which means the dataset is tokenized on every run.",
     )
     parser.add_argument(
         "--api-endpoint",
@@ -201,8 +403,10 @@ if __name__ == "__main__":
     parser.add_argument(
         "--tokenizer",
         type=str,
-        required=True,
-        help="The path of the tokenizer directory.",
+        help="The path of the tokenizer directory. "
+        'It is optional for the "synthetic" and "shared-prefix" datasets. The token counts are always taken '
+        "from the usage reported by the server when present, and the tokenizer only "
+        "counts the tokens of the responses without usage.",
     )
     parser.add_argument(
         "--model-name",
@@ -220,7 +424,9 @@ if __name__ == "__main__":
         "--num-requests",
         type=int,
         required=True,
-        help="The number of requests for benchmark.",
+        help="The number of requests for benchmark. With \"--duration\", it is the number "
+        "of requests to cycle through when fixing the number of concurrent requests, "
+        "and the minimum number of requests to sample when fixing the request rate.",
     )
     parser.add_argument(
         "--num-warmup-requests",
@@ -245,6 +451,56 @@ if __name__ == "__main__":
         "When specified, for each integer, the benchmark keeps these many consistent "
         "number of concurrently running requests.",
     )
+    parser.add_argument(
+        "--arrival-process",
+        type=str,
+        default="poisson",
+        help="The arrival process of the requests when fixing request rate, in the format of "
+        '"<kind>[:<key>=<value>,...]". The kinds are "poisson", "gamma" (option "burstiness", '
+        'the squared coefficient of variation of the inter-arrival times), "onoff" (options '
+        '"on" and "off" in seconds), "diurnal" (options "period" in seconds and "amplitude") '
+        'and "schedule" (option "path" to a file of "<duration>,<relative rate>" lines, '
+        'normalized to the mean of "--request-rate"). '
+        'All kinds take the option "fanout", the number of requests that arrive at once. '
+        'For example, "gamma:burstiness=4,fanout=20". Default to "poisson".',
+    )
+    parser.add_argument(
+        "--search",
+        type=str,
+        choices=SUPPORTED_SEARCH_MODES,
+        help="Search the highest concurrency or request rate that meets the SLOs given by "
+        '"--slo", instead of benchmarking fixed loads. The load is doubled from '
+        '"--search-start" until the SLOs break, and then binary searched. '
+        "All the benchmarked loads are reported as the load curve.",
+    )
+    parser.add_argument(
+        "--slo",
+        type=str,
+        help='The comma-separated SLOs for "--search", e.g., "ttft_p99<500ms,tpot_p90<=50ms". '
+        'The metrics are "ttft", "tpot", "itl" and "e2e", and the statistics are '
+        '"p25/p50/p75/p90/p95/p99", "mean" and "max". "itl" is the latency between '
+        "consecutive output tokens of streamed requests. A load with failed requests "
+        "never meets the SLOs.",
+    )
+    parser.add_argument(
+        "--search-start",
+        type=float,
+        default=1,
+        help='The concurrency or request rate to start "--search" from. Default to 1.',
+    )
+    parser.add_argument(
+        "--search-max",
+        type=float,
+        default=1024,
+        help='The highest concurrency or request rate that "--search" tries. Default to 1024.',
+    )
+    parser.add_argument(
+        "--search-tolerance",
+        type=float,
+        default=0.05,
+        help='The relative precision that "--search" finds the highest request rate with. '
+        "Default to 0.05.",
+    )
     parser.add_argument(
         "--request-rate",
         type=_parse_request_rate,
@@ -297,14 +553,31 @@ if __name__ == "__main__":
     parser.add_argument(
         "--host",
         type=str,
-        required=True,
-        help="The host address of the backend API.",
+        help="The host address of the backend API. "
+        'Default to the host of the first endpoint in "--endpoints".',
     )
     parser.add_argument(
         "--port",
         type=int,
-        required=True,
-        help="The port of the backend API.",
+        help="The port of the backend API. "
+        'Default to the port of the first endpoint in "--endpoints".',
+    )
+    parser.add_argument(
+        "--endpoints",
+        type=_parse_endpoints,
+        help='The comma-separated "host:port" list of the server replicas to dispatch the '
+        'requests across, e.g., "node0:8000,node0:8001,node1:8000", in place of '
+        '"--host" and "--port". The report shows the results of each endpoint '
+        "besides the aggregate results.",
+    )
+    parser.add_argument(
+        "--endpoint-policy",
+        type=str,
+        choices=SUPPORTED_ENDPOINT_POLICIES,
+        default="round-robin",
+        help="The policy to dispatch the requests across the endpoints. "
+        '"least-outstanding" counts the in-flight requests of each process worker, and '
+        '"session-hash" keeps the requests of the same conversation on the same endpoint.',
     )
     parser.add_argument(
         "--timeout",
@@ -346,18 +619,192 @@ if __name__ == "__main__":
     parser.add_argument(
         "--num-process-workers",
         type=int,
-        help="The number of parallel process workers to send the requests.",
+        help="The number of parallel process workers to send the requests. "
+        "0 sends the requests from the benchmark process with a single event loop. "
+        "By default, the requests are sent in-process (except for concurrency over 64) "
+        "and worker processes are used once the event loop lag shows saturation, "
+        "rerunning the benchmark if it was saturated.",
+    )
+    parser.add_argument(
+        "--synthetic-length-dist",
+        type=str,
+        choices=SUPPORTED_LENGTH_DISTRIBUTIONS,
+        default="normal",
+        help='The distribution of the input and output lengths of the "synthetic" dataset, '
+        'with mean "--input-len"/"--output-len" and standard deviation '
+        '"--input-len-std"/"--output-len-std". Default to "normal".',
+    )
+    parser.add_argument(
+        "--shared-prefix-num",
+        type=int,
+        default=8,
+        help='The number of shared system prompts of the "shared-prefix" dataset. Default to 8.',
+    )
+    parser.add_argument(
+        "--shared-prefix-len",
+        type=int,
+        default=1024,
+        help='The number of words (roughly tokens) of the system prompts of the "shared-prefix" '
+        'dataset. The user messages after the system prompts follow "--input-len". '
+        "Default to 1024.",
+    )
+    parser.add_argument(
+        "--shared-prefix-ratio",
+        type=float,
+        default=1.0,
+        help='The fraction of the requests of the "shared-prefix" dataset that use a shared '
+        "system prompt, while the others have system prompts of their own. Default to 1.0.",
+    )
+    parser.add_argument(
+        "--shared-prefix-reuse-distance",
+        type=str,
+        default="uniform",
+        help='The distribution of the reuse distance of the shared system prompts of the '
+        '"shared-prefix" dataset, which is the number of other system prompts used since one '
+        'was last used. Supporting "uniform", "geometric:mean=<mean>" and "zipf:s=<exponent>". '
+        'Default to "uniform".',
+    )
+    parser.add_argument(
+        "--cancel-fraction",
+        type=float,
+        default=0.0,
+        help="The fraction of the requests that the client cancels by closing the connection "
+        'after "--cancel-after-tokens" output tokens or "--cancel-after-seconds" seconds, '
+        "to measure how promptly the server stops decoding the abandoned requests. "
+        "The cancelled requests are reported separately. Default to 0.",
+    )
+    parser.add_argument(
+        "--cancel-after-tokens",
+        type=int,
+        help="The number of output tokens after which the requests to cancel are cancelled.",
+    )
+    parser.add_argument(
+        "--cancel-after-seconds",
+        type=float,
+        help="The number of seconds after sending which the requests to cancel are cancelled.",
+    )
+    parser.add_argument(
+        "--cancel-rate-window",
+        type=float,
+        default=1.0,
+        help="The number of seconds before and after each cancellation to compare the "
+        "token rate of the other in-flight requests over. Default to 1.",
+    )
+    parser.add_argument(
+        "--flush-prefix-cache",
+        action="store_true",
+        help="Whether to flush the prefix cache of the server after the warmup, via the "
+        '"/flush_cache" route of SGLang or the "/reset_prefix_cache" route of vLLM, '
+        "so that the benchmark starts from a cold cache.",
+    )
+    parser.add_argument(
+        "--replay-time-scale",
+        type=float,
+        default=1.0,
+        help='The factor to scale the inter-arrival times of the "replay" dataset with. '
+        "For example, 0.5 replays the request log twice as fast. "
+        "Default to 1.0, which means replaying with the recorded arrival times.",
+    )
+    parser.add_argument(
+        "--tokenize-workers",
+        type=int,
+        default=1,
+        help="The number of parallel process workers to tokenize the dataset and the "
+        "outputs of the requests with. "
+        "Default to 1, which means tokenizing in the main process.",
+    )
+    parser.add_argument(
+        "--decode-stall-factor",
+        type=float,
+        default=5.0,
+        help="The interval between two streamed output chunks counts as a decode stall "
+        "when it is longer than this factor times the median inter-token latency of all "
+        "the output tokens. Default to 5.",
     )
     parser.add_argument(
         "--disable-tqdm",
         action="store_true",
         help="Whether to disable showing progress bar with tqdm during benchmarking.",
     )
+    parser.add_argument(
+        "--abort-error-rate",
+        type=float,
+        help="Abort the benchmark early when the error rate of the recent requests "
+        "exceeds this rate (e.g., 0.5). The requests that are not sent yet are reported "
+        "as failed. Default to None, which means never aborting.",
+    )
     parser.add_argument(
         "--max-schedule-gap",
         type=float,
         default=0.5,
-        help="The maximum allowed delay between the scheduled time in seconds.",
+        help="The maximum allowed delay between the scheduled time in seconds. "
+        "When requests are sent later than this behind their scheduled time, "
+        "a warning is reported (or the benchmark fails with \"--fail-on-schedule-lag\").",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        help="The number of seconds to keep sending requests for in each benchmark run, "
+        "instead of sending a fixed number of requests. "
+        "The warmup requests are sent before the duration starts.",
+    )
+    parser.add_argument(
+        "--trim-start",
+        type=float,
+        default=0.0,
+        help="The number of seconds at the beginning of each benchmark run to leave out "
+        "of the report as the ramp-up. Only the requests sent within the remaining "
+        "steady-state window are reported, and the throughput is computed over the window.",
+    )
+    parser.add_argument(
+        "--trim-end",
+        type=float,
+        default=0.0,
+        help="The number of seconds at the end of each benchmark run to leave out "
+        'of the report as the drain. See "--trim-start".',
+    )
+    parser.add_argument(
+        "--steady-state-in-flight",
+        action="store_true",
+        help="Whether to only report the window where the number of in-flight requests "
+        "reaches the number of concurrent requests, i.e., leaving out the ramp-up and "
+        "the drain of the load. Only works when fixing the number of concurrent requests.",
+    )
+    parser.add_argument(
+        "--fail-on-schedule-lag",
+        action="store_true",
+        help="Whether to fail the benchmark when requests are sent behind their scheduled "
+        'time by more than "--max-schedule-gap", instead of only reporting a warning.',
+    )
+    parser.add_argument(
+        "--num-agents",
+        type=int,
+        default=0,
+        help="The number of agents on other machines to distribute the load generation to. "
+        'The agents run "python -m sudonim.bench.distributed --coordinator <address>" '
+        'to connect to "--coordinator-address". Each agent sends a shard of the requests '
+        "and the records of all agents are reported together.",
+    )
+    parser.add_argument(
+        "--num-local-agents",
+        type=int,
+        default=0,
+        help="The number of agents to start as local processes, "
+        "in addition to the agents on other machines.",
+    )
+    parser.add_argument(
+        "--coordinator-address",
+        type=str,
+        help='The "host:port" address to listen on for the agents, e.g., "0.0.0.0:29500". '
+        "Default to a free local port when there are only local agents.",
+    )
+    parser.add_argument(
+        "--distributed-authkey",
+        type=str,
+        help="The secret key the agents authenticate with, "
+        f'default to the environment variable "{AUTHKEY_ENV}". Required with "--num-agents", '
+        "as the agents and the coordinator exchange pickled messages. "
+        "The local agents use a random key when not specified.",
     )
     parser.add_argument(
         "--mlc-model-lib",
@@ -391,6 +838,35 @@ if __name__ == "__main__":
         "Only enabled when benchmarked with fixed concurrent request mode."
         "The --num-concurrent-requests should be provided when enabling this option.",
     )
+    parser.add_argument(
+        "--session",
+        default=False,
+        action="store_true",
+        help="Whether to simulate user sessions, where each of the concurrent users follows "
+        "the turns of a conversation of the dataset with the history of the session, and "
+        'leaves after the last turn. Only supported for the "sharegpt" dataset, and the '
+        "number of users is given by --num-concurrent-requests.",
+    )
+    parser.add_argument(
+        "--session-max-turns",
+        type=int,
+        help="The maximum number of turns of a user session. "
+        "Default to None, which means all the turns of the conversation.",
+    )
+    parser.add_argument(
+        "--session-think-time",
+        type=float,
+        default=5.0,
+        help="The mean think time in seconds of the users between the turns of a session. "
+        "Default to 5.",
+    )
+    parser.add_argument(
+        "--session-think-time-dist",
+        type=str,
+        choices=SUPPORTED_THINK_TIME_DISTRIBUTIONS,
+        default="exponential",
+        help='The distribution of the think time of the users. Default to "exponential".',
+    )
     parser.add_argument(
         "--output",
         "-o",
@@ -1,20 +1,120 @@
 """MLC LLM bench backends"""
 
 import argparse
+import asyncio
+import hashlib
 import json
 import os
 import time
 import traceback
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from typing_extensions import Self
 
-from sudonim.bench.request_record import Metrics, RequestRecord, ServerMetrics
+from sudonim.bench.request_record import (
+    Metrics,
+    RequestRecord,
+    ServerMetrics,
+    pack_chunk_arrivals,
+)
 from mlc_llm.support import logging
 
 logger = logging.getLogger(__name__)
 
 
+class ChunkArrivals:
+    """Records the arrival time of every streamed output chunk of a request, and the
+    number of tokens of each chunk when the server reports the usage with every chunk
+    (e.g., the "continuous_usage_stats" of vLLM).
+    """
+
+    def __init__(self, start_time: float) -> None:
+        self.start_time = start_time
+        self.arrival_times: List[float] = []
+        self.num_tokens: Optional[List[int]] = []
+        self._completion_tokens = 0
+
+    def record(self, usage: Optional[dict]) -> None:
+        """Record a chunk that arrives now, with the usage reported in the chunk."""
+        self.arrival_times.append(time.monotonic())
+        if self.num_tokens is None:
+            return
+        if not usage or usage.get("completion_tokens") is None:
+            self.num_tokens = None
+            return
+        self.num_tokens.append(usage["completion_tokens"] - self._completion_tokens)
+        self._completion_tokens = usage["completion_tokens"]
+
+    @property
+    def num_output_tokens(self) -> int:
+        """The number of output tokens received, counting one token per chunk when the
+        server does not report the tokens of each chunk.
+        """
+        if self.num_tokens is not None:
+            return sum(self.num_tokens)
+        return len(self.arrival_times)
+
+    def pack(self) -> Dict[str, Optional[bytes]]:
+        """The chunk arrays of the metrics."""
+        chunk_intervals, chunk_num_tokens = pack_chunk_arrivals(
+            self.start_time, self.arrival_times, self.num_tokens
+        )
+        return {"chunk_intervals": chunk_intervals, "chunk_num_tokens": chunk_num_tokens}
+
+
+CANCELLED_ERROR_MSG = "The request is cancelled by the client."
+
+
+class RequestCanceller:
+    """Simulates the client abandoning the request, by closing the connection once
+    `cancel_after_tokens` output tokens are received or `cancel_after_s` seconds pass
+    as set in the request record. The timeout cancels the task sending the request,
+    which closes the connection whether the response has started or not.
+    """
+
+    def __init__(self, request_record: RequestRecord) -> None:
+        self.cancel_after_tokens = request_record.cancel_after_tokens
+        self.cancelled = False
+        self._timer_fired = False
+        self._task = asyncio.current_task()
+        self._timer = (
+            asyncio.get_running_loop().call_later(request_record.cancel_after_s, self._cancel_task)
+            if request_record.cancel_after_s is not None
+            else None
+        )
+
+    def _cancel_task(self) -> None:
+        self.cancelled = True
+        self._timer_fired = True
+        self._task.cancel()
+
+    def check(self, response: Any, num_output_tokens: int) -> bool:
+        """Close the response and return True when enough output tokens are received."""
+        if self.cancel_after_tokens is None or num_output_tokens < self.cancel_after_tokens:
+            return False
+        self.cancelled = True
+        response.close()
+        return True
+
+    def handle_cancelled_error(self) -> None:
+        """Swallow the cancellation of the task by the timeout, and re-raise the others
+        (e.g., when the benchmark itself is torn down).
+        """
+        if not self._timer_fired:
+            self.stop()
+            raise asyncio.CancelledError()
+        self._timer_fired = False
+        # Python 3.11+ counts the pending cancellations of the task, which also
+        # tells whether the task is cancelled from outside at the same time.
+        if hasattr(self._task, "uncancel") and self._task.uncancel() > 0:
+            raise asyncio.CancelledError()
+
+    def stop(self) -> None:
+        """Stop the timeout once the request is done."""
+        if self._timer is not None:
+            self._timer.cancel()
+
+
 class APIEndPoint:
     """Manages the sending of requests to a specified API endpoint and gathers
     inference statistics.
@@ -42,8 +142,10 @@ class OpenAIChatEndPoint(APIEndPoint):
         port: int,
         timeout: Optional[float] = None,
         include_server_metrics: bool = False,
+        include_usage: bool = True,
     ) -> None:
         super().__init__(include_server_metrics=include_server_metrics)
+        self.include_usage = include_usage
 
         import aiohttp  # pylint: disable=import-outside-toplevel,import-error
 
@@ -57,7 +159,11 @@ class OpenAIChatEndPoint(APIEndPoint):
     async def __aenter__(self) -> Self:
         import aiohttp  # pylint: disable=import-outside-toplevel,import-error
 
-        self.client = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(self.timeout))
+        # The executor bounds the in-flight requests, so the connection pool does not.
+        self.client = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(self.timeout),
+            connector=aiohttp.TCPConnector(limit=0),
+        )
         return self
 
     async def __aexit__(self, exc_type, exc_value, tb) -> None:
@@ -69,7 +175,7 @@ class OpenAIChatEndPoint(APIEndPoint):
         payload = request_record.chat_cmpl.model_dump()
         if self.timeout is not None and "timeout" not in payload:
             payload["timeout"] = self.timeout
-        if self.include_server_metrics:
+        if self.include_server_metrics or (self.include_usage and payload["stream"]):
             if "stream_options" not in payload or payload["stream_options"] is None:
                 payload["stream_options"] = {"include_usage": True}
             else:
@@ -84,7 +190,10 @@ class OpenAIChatEndPoint(APIEndPoint):
         first_chunk_output_str = ""
         time_to_first_token_s = None
         start_time = time.monotonic()
+        chunk_arrivals = ChunkArrivals(start_time)
+        canceller = RequestCanceller(request_record)
         server_metrics = None
+        usage = None
 
         try:
             async with self.client.post(self.url, json=payload, headers=self.headers) as response:
@@ -99,10 +208,15 @@ class OpenAIChatEndPoint(APIEndPoint):
                         if raw_data == b"[DONE]":
                             continue
                         data = json.loads(raw_data)
+                        # The usage is reported in the last chunk which has no choices.
+                        if data.get("usage"):
+                            usage = data["usage"]
                         if not data["choices"]:
                             continue
                         delta = data["choices"][0]["delta"]
                         content = delta.get("content", None)
+                        if content:
+                            chunk_arrivals.record(data.get("usage"))
                         if content is not None and not time_to_first_token_s:
                             time_to_first_token_s = time.monotonic() - start_time
                             first_chunk_output_str = content
@@ -124,9 +238,12 @@ class OpenAIChatEndPoint(APIEndPoint):
 
                         if content is not None:
                             generated_text += content
+                        if content and canceller.check(response, chunk_arrivals.num_output_tokens):
+                            break
                 else:
                     data = await response.json()
                     generated_text = data["choices"][0]["message"]["content"]
+                    usage = data.get("usage")
                     if self.include_server_metrics and data["usage"] is not None:
                         # fmt: off
                         # pylint: disable=line-too-long
@@ -142,9 +259,12 @@ class OpenAIChatEndPoint(APIEndPoint):
                         )
                         # pylint: enable=line-too-long
                         # fmt: on
+        except asyncio.CancelledError:
+            canceller.handle_cancelled_error()
         except Exception:  # pylint: disable=broad-except
             error_msg = "API endpoint errored when sending request: " + traceback.format_exc()
             logger.info(error_msg)
+            canceller.stop()
             finish_time = time.monotonic()
             request_record.output_str = generated_text
             request_record.first_chunk_output_str = first_chunk_output_str
@@ -156,17 +276,24 @@ class OpenAIChatEndPoint(APIEndPoint):
                 input_tokens=request_record.metrics.input_tokens,
                 time_to_first_token_s=time_to_first_token_s,
                 server_metrics=server_metrics,
+                usage_input_tokens=usage["prompt_tokens"] if usage else None,
+                usage_output_tokens=usage["completion_tokens"] if usage else None,
+                **chunk_arrivals.pack(),
                 exec_feature=request_record.metrics.exec_feature,
             )
             request_record.error_msg = error_msg
             return request_record
 
+        canceller.stop()
         finish_time = time.monotonic()
         request_record.output_str = generated_text
         request_record.first_chunk_output_str = first_chunk_output_str
         success = True
         error_msg = None
-        if len(generated_text) == 0:
+        if canceller.cancelled:
+            success = False
+            error_msg = CANCELLED_ERROR_MSG
+        elif len(generated_text) == 0:
             success = False
             error_msg = "Empty generated text."
         request_record.metrics = Metrics(
@@ -177,6 +304,10 @@ class OpenAIChatEndPoint(APIEndPoint):
             input_tokens=request_record.metrics.input_tokens,
             time_to_first_token_s=time_to_first_token_s,
             server_metrics=server_metrics,
+            usage_input_tokens=usage["prompt_tokens"] if usage else None,
+            usage_output_tokens=usage["completion_tokens"] if usage else None,
+            **chunk_arrivals.pack(),
+            cancelled=canceller.cancelled,
             exec_feature=request_record.metrics.exec_feature,
         )
         request_record.error_msg = error_msg
@@ -193,8 +324,10 @@ class OpenAIEndPoint(APIEndPoint):
         timeout: Optional[float] = None,
         include_server_metrics: bool = False,
         no_debug_config: bool = False,
+        include_usage: bool = True,
     ) -> None:
         super().__init__(include_server_metrics=include_server_metrics)
+        self.include_usage = include_usage
 
         import aiohttp  # pylint: disable=import-outside-toplevel,import-error
 
@@ -212,7 +345,7 @@ class OpenAIEndPoint(APIEndPoint):
     async def __aenter__(self) -> Self:
         import aiohttp  # pylint: disable=import-outside-toplevel,import-error
 
-        self.client = aiohttp.ClientSession()
+        self.client = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
         return self
 
     async def __aexit__(self, exc_type, exc_value, tb) -> None:
@@ -233,6 +366,8 @@ class OpenAIEndPoint(APIEndPoint):
             "max_tokens": request_record.chat_cmpl.max_tokens,
             "stream": True,
         }
+        if self.include_usage:
+            payload["stream_options"] = {"include_usage": True}
         if self.timeout is not None and "timeout" not in payload:
             payload["timeout"] = self.timeout
         if (
@@ -247,6 +382,9 @@ class OpenAIEndPoint(APIEndPoint):
         first_chunk_output_str = ""
         time_to_first_token_s = None
         start_time = time.monotonic()
+        chunk_arrivals = ChunkArrivals(start_time)
+        canceller = RequestCanceller(request_record)
+        usage = None
 
         try:
             async with self.client.post(
@@ -263,20 +401,31 @@ class OpenAIEndPoint(APIEndPoint):
                         if raw_data == b"[DONE]":
                             continue
                         data = json.loads(raw_data)
+                        # The usage is reported in the last chunk which has no choices.
+                        if data.get("usage"):
+                            usage = data["usage"]
                         if not data["choices"]:
                             continue
                         content = data["choices"][0]["text"]
+                        if content:
+                            chunk_arrivals.record(data.get("usage"))
                         if content is not None and not time_to_first_token_s:
                             time_to_first_token_s = time.monotonic() - start_time
                             first_chunk_output_str = content
                         if content is not None:
                             generated_text += content
+                        if content and canceller.check(response, chunk_arrivals.num_output_tokens):
+                            break
                 else:
                     data = await response.json()
                     generated_text = data["choices"][0]["message"]["content"]
+                    usage = data.get("usage")
+        except asyncio.CancelledError:
+            canceller.handle_cancelled_error()
         except Exception:  # pylint: disable=broad-except
             error_msg = "API endpoint errored when sending request: " + traceback.format_exc()
             logger.info(error_msg)
+            canceller.stop()
             finish_time = time.monotonic()
             request_record.output_str = generated_text
             request_record.first_chunk_output_str = first_chunk_output_str
@@ -288,17 +437,24 @@ class OpenAIEndPoint(APIEndPoint):
                 input_tokens=request_record.metrics.input_tokens,
                 time_to_first_token_s=time_to_first_token_s,
                 server_metrics=None,
+                usage_input_tokens=usage["prompt_tokens"] if usage else None,
+                usage_output_tokens=usage["completion_tokens"] if usage else None,
+                **chunk_arrivals.pack(),
                 exec_feature=request_record.metrics.exec_feature,
             )
             request_record.error_msg = error_msg
             return request_record
 
+        canceller.stop()
         finish_time = time.monotonic()
         request_record.output_str = generated_text
         request_record.first_chunk_output_str = first_chunk_output_str
         success = True
         error_msg = None
-        if len(generated_text) == 0:
+        if canceller.cancelled:
+            success = False
+            error_msg = CANCELLED_ERROR_MSG
+        elif len(generated_text) == 0:
             success = False
             error_msg = "Empty generated text."
         request_record.metrics = Metrics(
@@ -309,6 +465,10 @@ class OpenAIEndPoint(APIEndPoint):
             input_tokens=request_record.metrics.input_tokens,
             time_to_first_token_s=time_to_first_token_s,
             server_metrics=None,
+            usage_input_tokens=usage["prompt_tokens"] if usage else None,
+            usage_output_tokens=usage["completion_tokens"] if usage else None,
+            **chunk_arrivals.pack(),
+            cancelled=canceller.cancelled,
             exec_feature=request_record.metrics.exec_feature,
         )
         request_record.error_msg = error_msg
@@ -333,7 +493,7 @@ class TensorRTLLMEndPoint(APIEndPoint):
     async def __aenter__(self) -> Self:
         import aiohttp  # pylint: disable=import-outside-toplevel,import-error
 
-        self.client = aiohttp.ClientSession()
+        self.client = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
         return self
 
     async def __aexit__(self, exc_type, exc_value, tb) -> None:
@@ -369,6 +529,8 @@ class TensorRTLLMEndPoint(APIEndPoint):
         url = self.url_stream if request_record.chat_cmpl.stream else self.url_no_stream
         time_to_first_token_s = None
         start_time = time.monotonic()
+        chunk_arrivals = ChunkArrivals(start_time)
+        canceller = RequestCanceller(request_record)
 
         try:
             async with self.client.post(url, json=payload) as response:
@@ -384,17 +546,24 @@ class TensorRTLLMEndPoint(APIEndPoint):
                         delta = data["text_output"]
                         if delta is None:
                             continue
+                        if delta:
+                            chunk_arrivals.record(None)
 
                         if not time_to_first_token_s:
                             time_to_first_token_s = time.monotonic() - start_time
                             first_chunk_output_str = delta
                         generated_text += delta
+                        if delta and canceller.check(response, chunk_arrivals.num_output_tokens):
+                            break
                 else:
                     data = await response.json()
                     generated_text = data["text_output"]
+        except asyncio.CancelledError:
+            canceller.handle_cancelled_error()
         except Exception:  # pylint: disable=broad-except
             error_msg = "API endpoint errored when sending request: " + traceback.format_exc()
             logger.info(error_msg)
+            canceller.stop()
             finish_time = time.monotonic()
             request_record.output_str = generated_text
             request_record.first_chunk_output_str = first_chunk_output_str
@@ -405,17 +574,22 @@ class TensorRTLLMEndPoint(APIEndPoint):
                 end_to_end_latency_s=finish_time - start_time,
                 input_tokens=request_record.metrics.input_tokens,
                 time_to_first_token_s=time_to_first_token_s,
+                **chunk_arrivals.pack(),
                 exec_feature=request_record.metrics.exec_feature,
             )
             request_record.error_msg = error_msg
             return request_record
 
+        canceller.stop()
         finish_time = time.monotonic()
         request_record.output_str = generated_text
         request_record.first_chunk_output_str = first_chunk_output_str
         success = True
         error_msg = None
-        if len(generated_text) == 0:
+        if canceller.cancelled:
+            success = False
+            error_msg = CANCELLED_ERROR_MSG
+        elif len(generated_text) == 0:
             success = False
             error_msg = "Empty generated text."
         request_record.metrics = Metrics(
@@ -425,12 +599,76 @@ class TensorRTLLMEndPoint(APIEndPoint):
             end_to_end_latency_s=finish_time - start_time,
             input_tokens=request_record.metrics.input_tokens,
             time_to_first_token_s=time_to_first_token_s,
+            **chunk_arrivals.pack(),
+            cancelled=canceller.cancelled,
             exec_feature=request_record.metrics.exec_feature,
         )
         request_record.error_msg = error_msg
         return request_record
 
 
+class MultiEndPoint(APIEndPoint):
+    """The backend that dispatches the requests across the endpoints of several
+    server replicas, and tags each request record with the endpoint it is sent to.
+
+    The dispatch policies are
+    - "round-robin", which sends the requests to the endpoints in turn,
+    - "least-outstanding", which sends each request to the endpoint with the fewest
+      in-flight requests from this client (process),
+    - "session-hash", which sends the requests of the same session, i.e., the same
+      "user" field or otherwise the same first message, to the same endpoint,
+      to keep the prefix cache of the conversation on one replica.
+    """
+
+    def __init__(self, endpoints: List[APIEndPoint], names: List[str], policy: str) -> None:
+        assert len(endpoints) == len(names) and len(endpoints) > 0
+        if policy not in SUPPORTED_ENDPOINT_POLICIES:
+            raise ValueError(
+                f'Unrecognized endpoint policy "{policy}". '
+                f"The supported policies are {SUPPORTED_ENDPOINT_POLICIES}."
+            )
+        super().__init__(include_server_metrics=endpoints[0].include_server_metrics)
+        self.endpoints = endpoints
+        self.names = names
+        self.policy = policy
+        self.num_outstanding = [0] * len(endpoints)
+        self.next_index = 0
+
+    async def __aenter__(self) -> Self:
+        await asyncio.gather(*(endpoint.__aenter__() for endpoint in self.endpoints))
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb) -> None:
+        await asyncio.gather(
+            *(endpoint.__aexit__(exc_type, exc_value, tb) for endpoint in self.endpoints)
+        )
+
+    def _select(self, request_record: RequestRecord) -> int:
+        if self.policy == "round-robin":
+            index = self.next_index
+            self.next_index = (self.next_index + 1) % len(self.endpoints)
+            return index
+        if self.policy == "least-outstanding":
+            return min(range(len(self.endpoints)), key=lambda i: self.num_outstanding[i])
+        # Use a stable hash, as the built-in hash of str differs across processes.
+        chat_cmpl = request_record.chat_cmpl
+        session_key = chat_cmpl.user
+        if session_key is None:
+            session_key = str(chat_cmpl.messages[0].content) if chat_cmpl.messages else ""
+        digest = hashlib.md5(session_key.encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "little") % len(self.endpoints)
+
+    async def __call__(self, request_record: RequestRecord) -> RequestRecord:
+        index = self._select(request_record)
+        self.num_outstanding[index] += 1
+        try:
+            request_record = await self.endpoints[index](request_record)
+        finally:
+            self.num_outstanding[index] -= 1
+        request_record.endpoint = self.names[index]
+        return request_record
+
+
 # Todo: APIEndPoint with AsyncOpenAI Python interface  # pylint: disable=fixme
 # class OpenAIPythonEndPoint(APIEndPoint):
 #     pass
@@ -444,17 +682,43 @@ SUPPORTED_BACKENDS = [
     "vllm",
 ]
 
+SUPPORTED_ENDPOINT_POLICIES = ["round-robin", "least-outstanding", "session-hash"]
+
 
 def create_api_endpoint(args: argparse.Namespace) -> APIEndPoint:
-    """Create an API endpoint instance with regard to the specified endpoint kind."""
+    """Create an API endpoint instance with regard to the specified endpoint kind.
+    With multiple endpoints in "args.endpoints", the requests are dispatched across them.
+    """
+    endpoints: Optional[List[Tuple[str, int]]] = args.endpoints
+    if endpoints is None or len(endpoints) == 1:
+        host, port = endpoints[0] if endpoints is not None else (args.host, args.port)
+        return _create_single_api_endpoint(args, host, port)
+    if os.environ.get("OPENAI_API_BASE"):
+        raise ValueError('"OPENAI_API_BASE" cannot be used with multiple endpoints.')
+    return MultiEndPoint(
+        [_create_single_api_endpoint(args, host, port) for host, port in endpoints],
+        [f"{host}:{port}" for host, port in endpoints],
+        args.endpoint_policy,
+    )
+
+
+def _create_single_api_endpoint(args: argparse.Namespace, host: str, port: int) -> APIEndPoint:
+    # The OpenAI endpoints always request the token usage, whose counts are preferred
+    # over the client tokenizer as they are exact for the server tokenizer.
     if args.api_endpoint in ["openai", "mlc", "sglang"]:
-        return OpenAIEndPoint(args.host, args.port, args.timeout, args.include_server_metrics)
+        return OpenAIEndPoint(host, port, args.timeout, args.include_server_metrics)
     if args.api_endpoint == "vllm":
         return OpenAIEndPoint(
-            args.host, args.port, args.timeout, include_server_metrics=False, no_debug_config=True
+            host,
+            port,
+            args.timeout,
+            include_server_metrics=False,
+            no_debug_config=True,
         )
     if args.api_endpoint == "openai-chat":
-        return OpenAIChatEndPoint(args.host, args.port, args.timeout, args.include_server_metrics)
+        return OpenAIChatEndPoint(host, port, args.timeout, args.include_server_metrics)
     if args.api_endpoint == "tensorrt-llm":
-        return TensorRTLLMEndPoint(args.host, args.port, args.timeout)
+        if args.tokenizer is None:
+            raise ValueError('Endpoint "tensorrt-llm" does not report usage and needs a tokenizer.')
+        return TensorRTLLMEndPoint(host, port, args.timeout)
     raise ValueError(f'Unrecognized endpoint "{args.api_endpoint}"')
@@ -0,0 +1,188 @@
+"""MLC LLM benchmark request arrival processes"""
+
+from typing import Dict, List
+
+import numpy as np
+
+SUPPORTED_ARRIVAL_PROCESSES = ["poisson", "gamma", "onoff", "diurnal", "schedule"]
+
+
+class ArrivalProcess:
+    """The arrival process base class, which generates the request send timestamps.
+
+    Every arrival process has the mean request rate it is generated with. Requests
+    arrive in groups of `fanout` requests at the same timestamp (e.g., an agent that
+    fans out to many requests at once), so the groups arrive `fanout` times less often.
+    """
+
+    def __init__(self, fanout: int = 1) -> None:
+        if fanout < 1:
+            raise ValueError(f"Invalid arrival fanout {fanout}")
+        self.fanout = fanout
+
+    def generate(self, num_requests: int, request_rate: float) -> np.ndarray:
+        """Generate the timestamps in seconds of the requests, starting from 0."""
+        num_groups = -(-num_requests // self.fanout)
+        timestamps = self._generate_groups(num_groups, request_rate / self.fanout)
+        return np.repeat(timestamps, self.fanout)[:num_requests]
+
+    def _generate_groups(self, num_groups: int, group_rate: float) -> np.ndarray:
+        raise NotImplementedError()
+
+
+class PoissonArrival(ArrivalProcess):
+    """The Poisson process, i.e., exponentially distributed inter-arrival times."""
+
+    def _generate_groups(self, num_groups: int, group_rate: float) -> np.ndarray:
+        intervals = np.random.exponential(1.0 / group_rate, size=num_groups)
+        return np.concatenate([np.zeros(1), np.cumsum(intervals[:-1])])
+
+
+class GammaArrival(ArrivalProcess):
+    """The arrival process with gamma distributed inter-arrival times.
+    The squared coefficient of variation of the inter-arrival times is `burstiness`:
+    1 is the Poisson process, and larger values give burstier traffic.
+    """
+
+    def __init__(self, burstiness: float = 1.0, fanout: int = 1) -> None:
+        super().__init__(fanout)
+        if burstiness <= 0:
+            raise ValueError(f"Invalid burstiness {burstiness}")
+        self.burstiness = burstiness
+
+    def _generate_groups(self, num_groups: int, group_rate: float) -> np.ndarray:
+        intervals = np.random.gamma(
+            shape=1.0 / self.burstiness, scale=self.burstiness / group_rate, size=num_groups
+        )
+        return np.concatenate([np.zeros(1), np.cumsum(intervals[:-1])])
+
+
+class PiecewiseRateArrival(ArrivalProcess):
+    """The Poisson process whose rate is piecewise constant over time.
+    The rate of the i-th period of `durations[i]` seconds is `rates[i]` times the
+    request rate, and the periods repeat until all the requests arrive.
+    """
+
+    def __init__(self, durations: List[float], rates: List[float], fanout: int = 1) -> None:
+        super().__init__(fanout)
+        if len(durations) == 0 or len(durations) != len(rates):
+            raise ValueError("The rate schedule should have the same positive number of periods")
+        if any(duration <= 0 for duration in durations) or any(rate < 0 for rate in rates):
+            raise ValueError("The rate schedule should have positive durations and rates")
+        if sum(duration * rate for duration, rate in zip(durations, rates)) <= 0:
+            raise ValueError("The rate schedule never sends any request")
+        self.durations = np.array(durations, dtype=np.float64)
+        self.rates = np.array(rates, dtype=np.float64)
+
+    def _generate_groups(self, num_groups: int, group_rate: float) -> np.ndarray:
+        # Generate a Poisson process of rate 1 and map its timestamps back through
+        # the integral of the rate over time (i.e., time rescaling).
+        expected_arrivals = np.random.exponential(1.0, size=num_groups)
+        expected_arrivals = np.concatenate([np.zeros(1), np.cumsum(expected_arrivals[:-1])])
+        period_ends = np.cumsum(self.durations)
+        cycle_arrivals = np.concatenate([np.zeros(1), np.cumsum(self.durations * self.rates)])
+        cycle_arrivals *= group_rate
+        num_cycles, arrivals = np.divmod(expected_arrivals, cycle_arrivals[-1])
+        period = np.minimum(
+            np.searchsorted(cycle_arrivals, arrivals, side="right") - 1, len(self.durations) - 1
+        )
+        period_begins = period_ends[period] - self.durations[period]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            offsets = (arrivals - cycle_arrivals[period]) / (self.rates[period] * group_rate)
+        return num_cycles * period_ends[-1] + period_begins + np.nan_to_num(offsets)
+
+
+class OnOffArrival(PiecewiseRateArrival):
+    """The arrival process that alternates between Poisson bursts of `on` seconds and
+    `off` seconds of silence. The burst rate is raised to keep the mean request rate.
+    """
+
+    def __init__(self, on: float, off: float, fanout: int = 1) -> None:
+        super().__init__([on, off], [(on + off) / on, 0.0], fanout)
+
+
+class DiurnalArrival(PiecewiseRateArrival):
+    """The arrival process whose rate follows a daily cycle compressed into `period`
+    seconds. The rate starts at the trough of `1 - amplitude` times the request rate,
+    and ramps up to the peak of `1 + amplitude` times the request rate at half period.
+    """
+
+    # The number of constant-rate steps that approximate the cycle with.
+    num_steps: int = 240
+
+    def __init__(self, period: float, amplitude: float = 0.5, fanout: int = 1) -> None:
+        if not 0 <= amplitude <= 1:
+            raise ValueError(f"Invalid diurnal amplitude {amplitude}")
+        phases = (np.arange(self.num_steps) + 0.5) / self.num_steps
+        super().__init__(
+            [period / self.num_steps] * self.num_steps,
+            (1 - amplitude * np.cos(2 * np.pi * phases)).tolist(),
+            fanout,
+        )
+
+
+class ScheduleArrival(PiecewiseRateArrival):
+    """The arrival process that follows the rate schedule of a file.
+    Each line of the file is "<duration in seconds>,<rate>", and the schedule repeats
+    after its last line. Only the relative rates matter: they are normalized by their
+    time-weighted mean, so that the mean request rate is the given request rate.
+    """
+
+    def __init__(self, path: str, fanout: int = 1) -> None:
+        durations, rates = [], []
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                line = line.split("#", 1)[0].strip()
+                if not line:
+                    continue
+                duration, rate = line.split(",")
+                durations.append(float(duration))
+                rates.append(float(rate))
+        super().__init__(durations, rates, fanout)
+        self.rates /= np.sum(self.durations * self.rates) / np.sum(self.durations)
+
+
+def _parse_arrival_options(options_str: str) -> Dict[str, str]:
+    options = {}
+    for option in options_str.split(","):
+        if "=" not in option:
+            raise ValueError(f'Unrecognized arrival process option "{option}"')
+        key, value = option.split("=", 1)
+        options[key.strip()] = value.strip()
+    return options
+
+
+def create_arrival_process(arrival_process_str: str) -> ArrivalProcess:
+    """Create the arrival process from its specification "<kind>[:<key>=<value>,...]",
+    for example, "gamma:burstiness=4", "onoff:on=10,off=50", "diurnal:period=600",
+    or "schedule:path=rates.csv". All kinds take the "fanout" option.
+    """
+    kind, _, options_str = arrival_process_str.partition(":")
+    options = _parse_arrival_options(options_str) if options_str else {}
+    fanout = int(options.pop("fanout", 1))
+
+    def _pop(key: str, *default: str) -> str:
+        if key not in options and not default:
+            raise ValueError(f'Arrival process "{kind}" requires the option "{key}"')
+        return options.pop(key, *default)
+
+    if kind == "poisson":
+        arrival_process: ArrivalProcess = PoissonArrival(fanout)
+    elif kind == "gamma":
+        arrival_process = GammaArrival(float(_pop("burstiness")), fanout)
+    elif kind == "onoff":
+        arrival_process = OnOffArrival(float(_pop("on")), float(_pop("off")), fanout)
+    elif kind == "diurnal":
+        arrival_process = DiurnalArrival(
+            float(_pop("period")), float(_pop("amplitude", "0.5")), fanout
+        )
+    elif kind == "schedule":
+        arrival_process = ScheduleArrival(_pop("path"), fanout)
+    else:
+        raise ValueError(
+            f'Unrecognized arrival process "{kind}". '
+            f"The supported arrival processes are {SUPPORTED_ARRIVAL_PROCESSES}."
+        )
+    if options:
+        raise ValueError(f'Unrecognized options {list(options)} of arrival process "{kind}"')
+    return arrival_process
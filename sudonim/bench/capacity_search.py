@@ -0,0 +1,161 @@
+"""MLC LLM benchmark capacity search"""
+
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from mlc_llm.support import logging
+
+logger = logging.getLogger(__name__)
+
+# The short names of the latency metrics that SLOs can be set on.
+SLO_METRICS = {
+    "ttft": "time_to_first_token_s",
+    "tpot": "time_per_output_token_s",
+    # The latency between consecutive output tokens, from the chunk arrival times.
+    "itl": "token_inter_token_latency_s",
+    "e2e": "end_to_end_latency_s",
+}
+
+SUPPORTED_SEARCH_MODES = ["concurrency", "request-rate"]
+
+_SLO_PATTERN = re.compile(r"^(\w+?)_(p\d+|mean|max)\s*(<=?)\s*([\d.]+)\s*(ms|s)?$")
+
+
+class SLO:  # pylint: disable=too-few-public-methods
+    """A service level objective on a statistic of a latency metric, e.g., "ttft_p99<500ms".
+    With `inclusive`, the statistic may also equal the threshold, e.g., "ttft_p99<=500ms".
+    """
+
+    def __init__(
+        self, metric: str, statistic: str, threshold_s: float, inclusive: bool = False
+    ) -> None:
+        self.metric = metric
+        self.statistic = statistic
+        self.threshold_s = threshold_s
+        self.inclusive = inclusive
+
+    def measure(self, report: Dict[str, Any]) -> Optional[float]:
+        """Get the value of the metric statistic in the benchmark report."""
+        stats = report.get(SLO_METRICS[self.metric])
+        if not stats:
+            return None
+        if self.statistic.startswith("p"):
+            return stats["quantiles"].get(self.statistic)
+        return stats[self.statistic]
+
+    def is_met(self, value: float) -> bool:
+        """Check whether the measured value of the statistic meets the SLO."""
+        return value <= self.threshold_s if self.inclusive else value < self.threshold_s
+
+    def __str__(self) -> str:
+        operator = "<=" if self.inclusive else "<"
+        return f"{self.metric}_{self.statistic}{operator}{self.threshold_s * 1000:g}ms"
+
+
+def parse_slos(slos_str: str) -> List[SLO]:
+    """Parse the comma-separated SLOs, e.g., "ttft_p99<500ms,tpot_p90<=50ms".
+    The thresholds are in seconds unless suffixed with "ms".
+    """
+    slos = []
+    for slo_str in slos_str.split(","):
+        match = _SLO_PATTERN.match(slo_str.strip())
+        if match is None or match.group(1) not in SLO_METRICS:
+            raise ValueError(
+                f'Unrecognized SLO "{slo_str}". Expecting "<metric>_<statistic><<threshold>" '
+                'or "<metric>_<statistic><=<threshold>", '
+                f"where metric is one of {list(SLO_METRICS)}, statistic is one of "
+                '"p25/p50/p75/p90/p95/p99", "mean" and "max", and threshold is in "s" or "ms".'
+            )
+        metric, statistic, operator, threshold, unit = match.groups()
+        if statistic.startswith("p") and statistic not in ["p25", "p50", "p75", "p90", "p95", "p99"]:
+            raise ValueError(f'Unsupported percentile "{statistic}" in SLO "{slo_str}"')
+        threshold_s = float(threshold) / 1000 if unit == "ms" else float(threshold)
+        slos.append(SLO(metric, statistic, threshold_s, inclusive=operator == "<="))
+    return slos
+
+
+def check_slos(report: Dict[str, Any], slos: List[SLO]) -> List[str]:
+    """Check the benchmark report against the SLOs and return the violations.
+    A load with failed requests never meets the SLOs, while the requests cancelled
+    by the client on purpose are not failures.
+    """
+    violations = []
+    num_failed_requests = (
+        report["num_total_requests"]
+        - report["num_completed_requests"]
+        - report.get("num_cancelled_requests", 0)
+    )
+    if num_failed_requests > 0:
+        violations.append(f"{num_failed_requests} request(s) failed")
+    for slo in slos:
+        value = slo.measure(report)
+        if value is None:
+            violations.append(f"{slo} (not measured)")
+        elif not slo.is_met(value):
+            violations.append(f"{slo} (measured {value * 1000:.1f}ms)")
+    return violations
+
+
+def search_capacity(  # pylint: disable=too-many-arguments
+    f_run: Callable[[float], Dict[str, Any]],
+    slos: List[SLO],
+    start: float,
+    max_load: float,
+    integer: bool,
+    tolerance: float = 0.05,
+) -> Tuple[Optional[float], List[Tuple[float, Dict[str, Any]]]]:
+    """Search the highest load that meets all the SLOs.
+
+    The load is doubled from `start` until the SLOs break or `max_load` is reached,
+    and then binary searched between the last passing and the first failing load,
+    until the two are 1 apart for integer loads (i.e., concurrency) or within
+    `tolerance` relative to each other otherwise (i.e., request rate).
+
+    Parameters
+    ----------
+    f_run : Callable[[float], Dict[str, Any]]
+        The function that benchmarks the given load and returns the report.
+
+    Returns
+    -------
+    best_load : Optional[float]
+        The highest load that meets the SLOs, or None if even `start` does not.
+
+    results : List[Tuple[float, Dict[str, Any]]]
+        The load and the report of every benchmarked step, in load ascending order.
+    """
+    results: Dict[float, Dict[str, Any]] = {}
+
+    def _passes(load: float) -> bool:
+        report = f_run(load)
+        results[load] = report
+        violations = check_slos(report, slos)
+        if violations:
+            logger.info("Load %g violates the SLOs: %s", load, "; ".join(violations))
+        else:
+            logger.info("Load %g meets the SLOs", load)
+        return not violations
+
+    # Exponential phase.
+    low: Optional[float] = None
+    high: Optional[float] = None
+    load = start
+    while True:
+        if _passes(load):
+            low = load
+            if load >= max_load:
+                break
+            load = min(load * 2, max_load)
+        else:
+            high = load
+            break
+
+    # Binary search phase.
+    if low is not None and high is not None:
+        while (high - low > 1) if integer else (high - low > tolerance * low):
+            mid = (low + high) // 2 if integer else (low + high) / 2
+            if _passes(mid):
+                low = mid
+            else:
+                high = mid
+    return low, sorted(results.items())
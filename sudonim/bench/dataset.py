@@ -1,21 +1,105 @@
 """MLC LLM benchmark dataset classes"""
 
 import argparse
+import ast
+import csv
+import collections
+import itertools
 import json
-import random
-from typing import Dict, List, Optional, Tuple
+import re
+from datetime import datetime
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import numpy as np
-from datasets import load_dataset  # pylint: disable=import-error
-from transformers import AutoTokenizer  # pylint: disable=import-error
 
-from sudonim.bench.request_record import GroupedRequestRecord, Metrics, RequestRecord
+from sudonim.bench.dataset_cache import TokenizedDatasetCache
+from sudonim.bench.packed_sequences import PackedSequences
+from sudonim.bench.parallel_tokenizer import ParallelTokenizer
+from sudonim.bench.request_record import (
+    GroupedRequestRecord,
+    LazyRequestRecords,
+    Metrics,
+    RequestRecord,
+)
 from mlc_llm.protocol.openai_api_protocol import (
     ChatCompletionMessage,
     ChatCompletionRequest,
     DebugConfig,
 )
 
+if TYPE_CHECKING:
+    from transformers import AutoTokenizer  # pylint: disable=import-error
+
+
+def _batched(iterable: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    """Split the iterable into lists of at most `batch_size` elements."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+_JSON_ARRAY_SEPARATORS = re.compile(r"[\s,]*")
+
+
+def _iter_json_array(path: str, chunk_size: int = 1 << 20) -> Iterator[Any]:
+    """Incrementally parse a JSON file whose top level is an array,
+    yielding the elements one at a time without loading the whole file.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as file:
+        buffer = file.read(chunk_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"Expecting a JSON array in {path}")
+        pos = 1
+        eof = False
+        while True:
+            pos = _JSON_ARRAY_SEPARATORS.match(buffer, pos).end()
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            if pos < len(buffer):
+                try:
+                    element, end = decoder.raw_decode(buffer, pos)
+                    # A number at the end of the buffer may continue in the next chunk.
+                    if end < len(buffer) or eof:
+                        yield element
+                        pos = end
+                        continue
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+            elif eof:
+                raise ValueError(f"Unterminated JSON array in {path}")
+            # The next element is incomplete, so read one more chunk.
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+
+def _parse_qa_pairs(qa_pairs: str) -> List[Dict[str, str]]:
+    """Parse the question-answer pairs of a Loogle document.
+    The pairs are mostly stored as Python literals, so the JSON parser is only
+    the fallback for rows with JSON-only tokens such as `true` or `null`.
+    """
+    try:
+        return ast.literal_eval(qa_pairs)
+    except (ValueError, SyntaxError):
+        return json.loads(qa_pairs)
+
 
 class Dataset:  # pylint: disable=too-few-public-methods
     """The dataset base class."""
@@ -25,6 +109,12 @@ class Dataset:  # pylint: disable=too-few-public-methods
     # For some that datasets (e.g., dataset that has shared common prefix),
     # we need fake warmup requests to avoid prefilling common prefixes to the engine.
     require_fake_warmup: bool = False
+    # For datasets that replay recorded traffic, the request records come
+    # with their own timestamps and are sent in the recorded order.
+    has_timestamps: bool = False
+    # For datasets of user sessions, the turns of each session are sent in order
+    # by one simulated user.
+    has_sessions: bool = False
 
     def generate_request_records(
         self,
@@ -32,133 +122,334 @@ class Dataset:  # pylint: disable=too-few-public-methods
         output_len: Optional[int],
         input_len_std: float = 0.0,
         output_len_std: float = 0.0,
-    ) -> List[RequestRecord]:
-        """Get the raw unprocessed request records of the dataset."""
+    ) -> Union[List[RequestRecord], LazyRequestRecords]:
+        """Get the raw unprocessed request records of the dataset.
+        Datasets may return the records lazily, to be built when they are sampled.
+        """
         raise NotImplementedError()
 
 
 class ShareGPTDataset(Dataset):  # pylint: disable=too-few-public-methods
     """The dataset class for ShareGPT dataset."""
 
-    _tokenized_dataset: List[Tuple[str, List[int], int]]
+    # The number of conversations to tokenize at a time when loading the dataset.
+    tokenize_batch_size: int = 1024
+
+    # The prompts and their token ids are packed into flat buffers.
+    _prompts: PackedSequences
+    _prompt_token_ids: PackedSequences
+    _output_lengths: np.ndarray
     apply_chat_template: bool
 
     def __init__(
-        self, dataset_path: str, tokenizer: AutoTokenizer, apply_chat_template: bool
+        self,
+        dataset_path: str,
+        tokenizer: "AutoTokenizer",
+        apply_chat_template: bool,
+        cache_dir: Optional[str] = None,
+        tokenize_workers: int = 1,
     ) -> None:
         self.apply_chat_template = apply_chat_template
-        with open(dataset_path, encoding="utf-8") as f:
-            raw_dataset = json.load(f)
-        # Filter out the conversations with less than 2 turns.
-        _dataset = [
-            (data["conversations"][0]["value"], data["conversations"][1]["value"])
-            for data in raw_dataset
-            if len(data["conversations"]) >= 2 and data["conversations"][0]["from"] == "human"
-        ]
-        # Tokenize the prompts and completions.
         self.tokenizer = tokenizer
-        prompts = [prompt for prompt, _ in _dataset]
         if apply_chat_template:
             assert (
                 getattr(tokenizer, "chat_template", None) is not None
             ), '"--apply-chat-template" is set but the tokenizer does not have chat template.'
-            prompts = [
-                tokenizer.apply_chat_template(
-                    [{"role": "user", "content": prompt}],
-                    add_generation_prompt=True,
-                    tokenize=False,
-                )
-                for prompt in prompts
-            ]
 
-        prompt_token_ids = list(
-            tokenizer(
-                prompts,
+        cache = (
+            TokenizedDatasetCache(
+                cache_dir,
+                dataset_path,
+                tokenizer,
+                apply_chat_template=apply_chat_template,
+                truncate_length=self.truncate_length,
+            )
+            if cache_dir is not None
+            else None
+        )
+        arrays = cache.load() if cache is not None else None
+        if arrays is None:
+            with ParallelTokenizer(tokenizer, tokenize_workers) as parallel_tokenizer:
+                arrays = self._tokenize(dataset_path, parallel_tokenizer, apply_chat_template)
+            if cache is not None:
+                cache.save(arrays)
+
+        self._prompts = PackedSequences.from_arrays(arrays, "prompt_text")
+        self._prompt_token_ids = PackedSequences.from_arrays(arrays, "prompt_token_ids")
+        self._output_lengths = arrays["output_lengths"]
+
+    def __len__(self) -> int:
+        return len(self._output_lengths)
+
+    @staticmethod
+    def _iter_conversations(dataset_path: str) -> Iterator[Tuple[str, str]]:
+        """Stream the (prompt, completion) pairs of the conversations out of the dataset file."""
+        for data in _iter_json_array(dataset_path):
+            conversations = data["conversations"]
+            # Filter out the conversations with less than 2 turns.
+            if len(conversations) >= 2 and conversations[0]["from"] == "human":
+                yield conversations[0]["value"], conversations[1]["value"]
+
+    def _tokenize(
+        self, dataset_path: str, parallel_tokenizer: ParallelTokenizer, apply_chat_template: bool
+    ) -> Dict[str, np.ndarray]:
+        """Tokenize the dataset and return the flattened arrays of the filtered conversations.
+        The conversations are streamed from the file and tokenized in batches of
+        `tokenize_batch_size` per tokenizer worker, so that the peak memory is bounded
+        by the batch size rather than by the size of the dataset.
+        """
+        tokenizer = parallel_tokenizer.tokenizer
+        batch_size = self.tokenize_batch_size * parallel_tokenizer.num_workers
+        max_length = min(tokenizer.model_max_length, self.truncate_length)
+        texts: List[PackedSequences] = []
+        token_ids: List[PackedSequences] = []
+        output_lengths: List[np.ndarray] = [np.zeros(0, dtype=np.int32)]
+        for batch in _batched(self._iter_conversations(dataset_path), batch_size):
+            # Tokenize the prompts and completions.
+            prompts = [prompt for prompt, _ in batch]
+            if apply_chat_template:
+                prompts = [
+                    tokenizer.apply_chat_template(
+                        [{"role": "user", "content": prompt}],
+                        add_generation_prompt=True,
+                        tokenize=False,
+                    )
+                    for prompt in prompts
+                ]
+            prompt_token_ids = parallel_tokenizer.encode(
+                prompts, truncation=True, max_length=max_length, add_special_tokens=False
+            )
+            completion_token_ids = parallel_tokenizer.encode(
+                [completion for _, completion in batch],
                 truncation=True,
-                max_length=min(tokenizer.model_max_length, self.truncate_length),
+                max_length=max_length,
                 add_special_tokens=False,
-            ).input_ids
-        )
-        completions = [completion for _, completion in _dataset]
-        completion_token_ids = tokenizer(
-            completions,
-            truncation=True,
-            max_length=min(tokenizer.model_max_length, self.truncate_length),
-            add_special_tokens=False,
-        ).input_ids
-        self._tokenized_dataset: List[Tuple[str, List[int], int]] = []
-        for i in range(len(_dataset)):
-            if (
-                len(prompt_token_ids[i]) < 4
-                or len(completion_token_ids[i]) < 4
-                or len(prompt_token_ids[i]) + len(completion_token_ids[i])
-                >= min(tokenizer.model_max_length, 8192)
-            ):
+            )
+            kept = [
+                i
+                for i in range(len(batch))
                 # Filter out sequences that are too short or too long
-                continue
-            self._tokenized_dataset.append(
-                (prompts[i], prompt_token_ids[i], len(completion_token_ids[i]))
+                if len(prompt_token_ids[i]) >= 4
+                and len(completion_token_ids[i]) >= 4
+                and len(prompt_token_ids[i]) + len(completion_token_ids[i])
+                < min(tokenizer.model_max_length, 8192)
+            ]
+            texts.append(PackedSequences.from_texts([prompts[i] for i in kept]))
+            token_ids.append(PackedSequences.from_lists([prompt_token_ids[i] for i in kept]))
+            output_lengths.append(
+                np.array([len(completion_token_ids[i]) for i in kept], dtype=np.int32)
             )
 
+        return {
+            **PackedSequences.concatenate(texts, np.uint8).to_arrays("prompt_text"),
+            **PackedSequences.concatenate(token_ids, np.int32).to_arrays("prompt_token_ids"),
+            "output_lengths": np.concatenate(output_lengths),
+        }
+
     def generate_request_records(
         self,
         input_len: Optional[int],
         output_len: Optional[int],
         input_len_std: float = 0.0,
         output_len_std: float = 0.0,
-    ) -> List[RequestRecord]:
+    ) -> LazyRequestRecords:
         if self.apply_chat_template:
             assert (
                 input_len is None
             ), '"--apply-chat-template" is not supported when "--input-len" is specified.'
 
-        request_records = []
-        for prompt, input_token_ids, output_length in self._tokenized_dataset:
-            input_length = len(input_token_ids)
+        prompt_lengths = self._prompt_token_ids.lengths
+        mask = np.ones(len(self), dtype=bool)
+        if input_len is not None:
             # If the request does not have enough length, discard it.
-            if input_len is not None and input_length < input_len + 4 * input_len_std:
-                continue
+            mask &= prompt_lengths >= input_len + 4 * input_len_std
+        if output_len is None:
+            mask &= self._output_lengths > 1
+        indices = np.flatnonzero(mask)
+
+        # Draw the lengths of all the kept requests at once.
+        if input_len is not None:
+            input_lengths = np.clip(
+                np.round(np.random.normal(loc=input_len, scale=input_len_std, size=len(indices))),
+                1,
+                prompt_lengths[indices],
+            ).astype(np.int64)
+        else:
+            input_lengths = prompt_lengths[indices]
+        if output_len is not None:
+            output_lengths = np.round(
+                np.random.normal(loc=output_len, scale=output_len_std, size=len(indices))
+            ).astype(np.int64)
+        else:
+            output_lengths = self._output_lengths[indices]
 
+        def _build(selected: Sequence[int]) -> List[RequestRecord]:
+            selected = np.asarray(selected, dtype=np.int64)
             if input_len is not None:
-                input_length = round(
-                    float(np.random.normal(loc=input_len, scale=input_len_std, size=1)[0])
+                prompts = self.tokenizer.batch_decode(
+                    [
+                        self._prompt_token_ids[i][:length].tolist()
+                        for i, length in zip(
+                            indices[selected].tolist(), input_lengths[selected].tolist()
+                        )
+                    ]
                 )
-                input_token_ids = input_token_ids[:input_length]
-                input_truncated = True
             else:
-                input_truncated = False
-            if output_len is not None:
-                output_length = round(
-                    float(np.random.normal(loc=output_len, scale=output_len_std, size=1)[0])
+                prompts = [self._prompts.get_text(i) for i in indices[selected].tolist()]
+
+            request_records = []
+            for prompt, input_length, output_length in zip(
+                prompts, input_lengths[selected].tolist(), output_lengths[selected].tolist()
+            ):
+                request_records.append(
+                    RequestRecord(
+                        chat_cmpl=ChatCompletionRequest(
+                            messages=[{"role": "user", "content": prompt}],
+                            model="",
+                            max_tokens=output_length,
+                        ),
+                        metrics=Metrics(
+                            success=False,
+                            start_time=0,
+                            finish_time=0,
+                            end_to_end_latency_s=0,
+                            input_tokens=input_length,
+                        ),
+                    )
                 )
-            elif output_length <= 1:
-                continue
-            request_records.append(
-                RequestRecord(
-                    chat_cmpl=ChatCompletionRequest(
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": (
-                                    self.tokenizer.decode(input_token_ids)
-                                    if input_truncated
-                                    else prompt
-                                ),
-                            }
-                        ],
-                        model="",
-                        max_tokens=output_length,
-                    ),
-                    metrics=Metrics(
-                        success=False,
-                        start_time=0,
-                        finish_time=0,
-                        end_to_end_latency_s=0,
-                        input_tokens=len(input_token_ids),
-                    ),
+            return request_records
+
+        return LazyRequestRecords(len(indices), _build)
+
+
+class ShareGPTSessionDataset(Dataset):  # pylint: disable=too-few-public-methods
+    """The dataset class of the ShareGPT conversations as user sessions.
+
+    Each session follows the user turns of a conversation, up to `max_turns` turns and
+    the context length limit, and each turn generates as many tokens as the assistant
+    reply of the turn in the dataset. The replies are not sent, as the history of a
+    session is made of the actual outputs of the earlier turns.
+    """
+
+    has_sessions: bool = True
+    # The number of conversations to tokenize at a time when loading the dataset.
+    tokenize_batch_size: int = 256
+
+    def __init__(
+        self,
+        dataset_path: str,
+        tokenizer: "AutoTokenizer",
+        max_turns: Optional[int] = None,
+        tokenize_workers: int = 1,
+    ) -> None:
+        self.tokenizer = tokenizer
+        max_length = min(tokenizer.model_max_length, 8192)
+        texts: List[PackedSequences] = []
+        input_lengths: List[np.ndarray] = [np.zeros(0, dtype=np.int32)]
+        output_lengths: List[np.ndarray] = [np.zeros(0, dtype=np.int32)]
+        num_turns: List[int] = []
+        with ParallelTokenizer(tokenizer, tokenize_workers) as parallel_tokenizer:
+            batch_size = self.tokenize_batch_size * parallel_tokenizer.num_workers
+            for batch in _batched(self._iter_sessions(dataset_path, max_turns), batch_size):
+                token_ids = parallel_tokenizer.encode(
+                    list(itertools.chain.from_iterable(itertools.chain.from_iterable(batch))),
+                    add_special_tokens=False,
                 )
-            )
-        return request_records
+                lengths = iter(len(ids) for ids in token_ids)
+                for session in batch:
+                    turn_lengths = [(next(lengths), next(lengths)) for _ in session]
+                    # Keep the turns until the context of the session gets too long.
+                    context_length = 0
+                    kept = 0
+                    for input_length, output_length in turn_lengths:
+                        context_length += input_length + output_length
+                        if input_length < 4 or output_length < 4 or context_length >= max_length:
+                            break
+                        kept += 1
+                    if kept == 0:
+                        continue
+                    num_turns.append(kept)
+                    texts.append(PackedSequences.from_texts([turn for turn, _ in session[:kept]]))
+                    input_lengths.append(
+                        np.array([length for length, _ in turn_lengths[:kept]], dtype=np.int32)
+                    )
+                    output_lengths.append(
+                        np.array([length for _, length in turn_lengths[:kept]], dtype=np.int32)
+                    )
+        self._turns = PackedSequences.concatenate(texts, np.uint8)
+        self._input_lengths = np.concatenate(input_lengths)
+        self._output_lengths = np.concatenate(output_lengths)
+        self._num_turns = np.array(num_turns, dtype=np.int64)
+        self._turn_offsets = np.concatenate(
+            [np.zeros(1, dtype=np.int64), np.cumsum(self._num_turns)]
+        )
+
+    @staticmethod
+    def _iter_sessions(
+        dataset_path: str, max_turns: Optional[int]
+    ) -> Iterator[List[Tuple[str, str]]]:
+        """Stream the (user turn, assistant reply) pairs of the conversations."""
+        for data in _iter_json_array(dataset_path):
+            conversations = data["conversations"]
+            session = []
+            for i in range(0, len(conversations) - 1, 2):
+                if conversations[i]["from"] != "human" or conversations[i + 1]["from"] != "gpt":
+                    break
+                session.append((conversations[i]["value"], conversations[i + 1]["value"]))
+                if max_turns is not None and len(session) == max_turns:
+                    break
+            if session:
+                yield session
+
+    def generate_request_records(
+        self,
+        input_len: Optional[int],
+        output_len: Optional[int],
+        input_len_std: float = 0.0,
+        output_len_std: float = 0.0,
+    ) -> LazyRequestRecords:
+        assert input_len is None, '"--input-len" is not supported for the user sessions.'
+        if output_len is not None:
+            output_lengths = np.maximum(
+                np.round(
+                    np.random.normal(
+                        loc=output_len, scale=output_len_std, size=len(self._output_lengths)
+                    )
+                ),
+                1,
+            ).astype(np.int64)
+        else:
+            output_lengths = self._output_lengths
+
+        def _build(selected: Sequence[int]) -> List[RequestRecord]:
+            request_records = []
+            # The sessions are numbered in the order they are built, so that a session
+            # built twice is two sessions.
+            for session_id, session in enumerate(selected):
+                begin = int(self._turn_offsets[session])
+                for turn_id in range(int(self._num_turns[session])):
+                    turn = begin + turn_id
+                    request_records.append(
+                        RequestRecord(
+                            chat_cmpl=ChatCompletionRequest(
+                                messages=[{"role": "user", "content": self._turns.get_text(turn)}],
+                                model="",
+                                max_tokens=int(output_lengths[turn]),
+                            ),
+                            metrics=Metrics(
+                                success=False,
+                                start_time=0,
+                                finish_time=0,
+                                end_to_end_latency_s=0,
+                                input_tokens=int(self._input_lengths[turn]),
+                            ),
+                            session_id=session_id,
+                            turn_id=turn_id,
+                        )
+                    )
+            return request_records
+
+        return LazyRequestRecords(len(self._num_turns), _build, self._num_turns)
 
 
 class LoogleDataset(Dataset):  # pylint: disable=too-few-public-methods
@@ -174,32 +465,63 @@ class LoogleDataset(Dataset):  # pylint: disable=too-few-public-methods
     # pylint: enable=line-too-long
     require_fake_warmup: bool = True
 
-    def __init__(self, tokenizer: AutoTokenizer, testset_name: str) -> None:
+    def __init__(
+        self, tokenizer: "AutoTokenizer", testset_name: str, tokenize_workers: int = 1
+    ) -> None:
+        from datasets import load_dataset  # pylint: disable=import-outside-toplevel,import-error
+
         raw_dataset = load_dataset("bigainlco/LooGLE", testset_name, split="test")
         self.tokenizer = tokenizer
-        self.dataset = []
         self.prompt_format = self.task2prompt[testset_name]
-        prompts = []
-        generate_lens = []
-        questions = []
+        self.prompts: List[str] = []
+        self.questions: List[List[str]] = []
+        answers: List[List[str]] = []
         for data in raw_dataset:
-            prompt = data["input"]
-            prompts.append(prompt)
-            qa_pairs = eval(data["qa_pairs"])  # pylint: disable=eval-used
-            questions.append([j["Q"] for j in qa_pairs])
-            generate_lens.append(
-                [len(tokenizer.encode(j["A"], add_special_tokens=False)) for j in qa_pairs]
+            self.prompts.append(data["input"])
+            qa_pairs = _parse_qa_pairs(data["qa_pairs"])
+            self.questions.append([j["Q"] for j in qa_pairs])
+            answers.append([j["A"] for j in qa_pairs])
+        with ParallelTokenizer(tokenizer, tokenize_workers) as parallel_tokenizer:
+            self.prompt_token_ids = PackedSequences.from_lists(
+                parallel_tokenizer.encode(
+                    self.prompts,
+                    truncation=True,
+                    max_length=min(tokenizer.model_max_length, self.truncate_length),
+                    add_special_tokens=False,
+                )
             )
-        prompt_token_ids = tokenizer(
-            prompts,
-            truncation=True,
-            max_length=min(tokenizer.model_max_length, self.truncate_length),
-            add_special_tokens=False,
-        ).input_ids
-        for prompt, prompt_token_id, question, generate_len in zip(
-            prompts, prompt_token_ids, questions, generate_lens
-        ):
-            self.dataset.append((prompt, prompt_token_id, question, generate_len))
+            # Tokenize the answers of all documents at once and split them back per document.
+            answer_lengths = iter(
+                len(token_ids)
+                for token_ids in parallel_tokenizer.encode(
+                    list(itertools.chain.from_iterable(answers)), add_special_tokens=False
+                )
+            )
+        self.generate_lens = [[next(answer_lengths) for _ in group] for group in answers]
+        # The truncated documents keyed by (document index, length), shared across pipelines.
+        # The least recently used ones are evicted beyond one truncation per document, so
+        # that the runs of a sweep with different input lengths do not grow it unboundedly.
+        self._truncated_prompts: "collections.OrderedDict[Tuple[int, int], str]" = (
+            collections.OrderedDict()
+        )
+
+    def _get_truncated_prompts(self, indices: List[int], lengths: List[int]) -> List[str]:
+        """Get the documents of the given indices truncated to the given token lengths.
+        The truncations that are not cached yet are decoded in one batch.
+        """
+        keys = list(zip(indices, lengths))
+        missing = [key for key in dict.fromkeys(keys) if key not in self._truncated_prompts]
+        if missing:
+            decoded = self.tokenizer.batch_decode(
+                [self.prompt_token_ids[i][:length].tolist() for i, length in missing]
+            )
+            self._truncated_prompts.update(zip(missing, decoded))
+        for key in dict.fromkeys(keys):
+            self._truncated_prompts.move_to_end(key)
+        truncated_prompts = [self._truncated_prompts[key] for key in keys]
+        while len(self._truncated_prompts) > len(self.prompts):
+            self._truncated_prompts.popitem(last=False)
+        return truncated_prompts
 
     def generate_request_records(  # pylint: disable=too-many-locals
         self,
@@ -208,12 +530,28 @@ class LoogleDataset(Dataset):  # pylint: disable=too-few-public-methods
         input_len_std: float = 0.0,
         output_len_std: float = 0.0,
     ) -> List[RequestRecord]:
+        prompt_lengths = self.prompt_token_ids.lengths
+        if input_len is not None:
+            input_lengths = np.minimum(
+                np.round(
+                    np.random.normal(loc=input_len, scale=input_len_std, size=len(prompt_lengths))
+                ).astype(np.int64),
+                prompt_lengths,
+            )
+        else:
+            input_lengths = prompt_lengths
+        # Only the documents that are longer than the input length are truncated.
+        prompts = list(self.prompts)
+        truncated = np.flatnonzero(input_lengths < prompt_lengths).tolist()
+        for i, prompt in zip(
+            truncated, self._get_truncated_prompts(truncated, input_lengths[truncated].tolist())
+        ):
+            prompts[i] = prompt
+
         request_records = []
-        for prompt, input_token_ids, questions, generate_lens in self.dataset:
-            input_length = round(float(np.random.normal(loc=input_len, scale=input_len_std)))
-            if len(input_token_ids) > input_length:
-                input_token_ids = input_token_ids[:input_length]
-                prompt = self.tokenizer.decode(input_token_ids)
+        for i, (prompt, questions, generate_lens) in enumerate(
+            zip(prompts, self.questions, self.generate_lens)
+        ):
             grouped_request_records = []
             for question, generate_len in zip(questions, generate_lens):
                 json_obj = {"input": prompt, "Q": question}
@@ -241,7 +579,7 @@ class LoogleDataset(Dataset):  # pylint: disable=too-few-public-methods
                             start_time=0,
                             finish_time=0,
                             end_to_end_latency_s=0,
-                            input_tokens=len(input_token_ids),
+                            input_tokens=int(input_lengths[i]),
                         ),
                     )
                 )
@@ -256,25 +594,44 @@ class LoogleDataset(Dataset):  # pylint: disable=too-few-public-methods
 
 
 class LLMPerfDataset(Dataset):  # pylint: disable=too-few-public-methods
-    """The dataset class for LLMPerf dataset."""
+    """The dataset class for LLMPerf dataset.
 
-    def __init__(self, dataset_path: str, num_requests: int, tokenizer: AutoTokenizer) -> None:
+    The tokenized lines of the dataset are concatenated into one token array
+    together with the prefix sums of the line lengths, so that a prompt body of an
+    exact token length is a single slice of the array starting at a random line.
+    """
+
+    def __init__(
+        self,
+        dataset_path: str,
+        num_requests: int,
+        tokenizer: "AutoTokenizer",
+        tokenize_workers: int = 1,
+    ) -> None:
         self.tokenizer = tokenizer
         self.num_requests = num_requests
+        self.tokenize_workers = tokenize_workers
 
         with open(dataset_path, encoding="utf-8") as f:
             untokenized_data = f.readlines()
         # Tokenize the prompts and completions.
-        tokenized_data = tokenizer(
-            untokenized_data,
-            truncation=True,
-            max_length=min(tokenizer.model_max_length, self.truncate_length),
-            add_special_tokens=False,
-        ).input_ids
-        tokenized_data_lengths = [len(tokens) for tokens in tokenized_data]
-        self.dataset: List[Tuple[str, List[int], int]] = list(
-            zip(untokenized_data, tokenized_data, tokenized_data_lengths)
-        )
+        with ParallelTokenizer(tokenizer, tokenize_workers) as parallel_tokenizer:
+            tokenized_data = parallel_tokenizer.encode(
+                untokenized_data,
+                truncation=True,
+                max_length=min(tokenizer.model_max_length, self.truncate_length),
+                add_special_tokens=False,
+            )
+        self.lines = PackedSequences.from_lists(tokenized_data)
+        assert len(self.lines.data) > 0, f"No tokens in the LLMPerf dataset {dataset_path}"
+
+    def _get_body_token_ids(self, begin: int, length: int) -> np.ndarray:
+        """Get `length` tokens of the dataset text starting at the token offset `begin`.
+        A body that runs past the last line wraps around to the first line.
+        """
+        if begin + length <= len(self.lines.data):
+            return self.lines.data[begin : begin + length]
+        return np.take(self.lines.data, np.arange(begin, begin + length), mode="wrap")
 
     def generate_request_records(  # pylint: disable=too-many-arguments,too-many-locals
         self,
@@ -282,78 +639,107 @@ class LLMPerfDataset(Dataset):  # pylint: disable=too-few-public-methods
         output_len: Optional[int] = None,
         input_len_std: float = 250,
         output_len_std: float = 0.0,
-    ) -> List[RequestRecord]:
+    ) -> LazyRequestRecords:
         if input_len is None or input_len < 40:
             input_len = 550
         if output_len is None:
             output_len = 150
 
-        request_records = []
-        for _ in range(self.num_requests):
-            input_length = round(float(np.random.normal(loc=input_len, scale=input_len_std)))
-            output_length = round(float(np.random.normal(loc=output_len, scale=output_len_std)))
-
-            prompt = (
-                "Randomly stream lines from the following text "
-                f"with {output_length} output tokens. "
-                "Don't generate eos tokens:\n\n"
-            )
-
-            remaining_token_length = input_length - len(
-                self.tokenizer.encode(prompt, add_special_tokens=False)
+        input_lengths = np.round(
+            np.random.normal(loc=input_len, scale=input_len_std, size=self.num_requests)
+        ).astype(np.int64)
+        output_lengths = np.round(
+            np.random.normal(loc=output_len, scale=output_len_std, size=self.num_requests)
+        ).astype(np.int64)
+        # Every prompt body starts at the beginning of a random line.
+        begin_lines = np.random.randint(0, len(self.lines), size=self.num_requests)
+        begins = self.lines.offsets[begin_lines]
+
+        # The prompt header only depends on the output length, so encode each header once.
+        headers = {
+            output_length: "Randomly stream lines from the following text "
+            f"with {output_length} output tokens. "
+            "Don't generate eos tokens:\n\n"
+            for output_length in set(output_lengths.tolist())
+        }
+        header_lengths = dict(
+            zip(
+                headers.keys(),
+                (
+                    len(token_ids)
+                    for token_ids in self.tokenizer(
+                        list(headers.values()), add_special_tokens=False
+                    ).input_ids
+                ),
             )
+        )
+        body_lengths = np.maximum(
+            input_lengths - np.array([header_lengths[length] for length in output_lengths.tolist()]),
+            0,
+        )
 
-            random.shuffle(self.dataset)
-
-            while remaining_token_length > 0:
-                for text, tokens, token_length in self.dataset:
-                    if remaining_token_length < token_length:
-                        prompt += self.tokenizer.decode(tokens[:remaining_token_length])
-                    else:
-                        prompt += text
-
-                    remaining_token_length -= token_length
-                    if remaining_token_length < 0:
-                        break
-
-            request_records.append(
-                RequestRecord(
-                    chat_cmpl=ChatCompletionRequest(
-                        messages=[{"role": "user", "content": prompt}],
-                        model="",
-                        max_tokens=output_length,
-                        debug_config=DebugConfig(ignore_eos=True),
-                    ),
-                    metrics=Metrics(
-                        success=False,
-                        start_time=0,
-                        finish_time=0,
-                        end_to_end_latency_s=0,
-                        input_tokens=input_length,
-                    ),
+        def _build(selected: Sequence[int]) -> List[RequestRecord]:
+            selected = np.asarray(selected, dtype=np.int64)
+            # The pool only lives while the sampled prompts are decoded.
+            with ParallelTokenizer(self.tokenizer, self.tokenize_workers) as parallel_tokenizer:
+                bodies = parallel_tokenizer.decode(
+                    [
+                        self._get_body_token_ids(begin, length).tolist()
+                        for begin, length in zip(
+                            begins[selected].tolist(), body_lengths[selected].tolist()
+                        )
+                    ]
                 )
-            )
-        return request_records
+            request_records = []
+            for input_length, output_length, body in zip(
+                input_lengths[selected].tolist(), output_lengths[selected].tolist(), bodies
+            ):
+                request_records.append(
+                    RequestRecord(
+                        chat_cmpl=ChatCompletionRequest(
+                            messages=[{"role": "user", "content": headers[output_length] + body}],
+                            model="",
+                            max_tokens=output_length,
+                            debug_config=DebugConfig(ignore_eos=True),
+                        ),
+                        metrics=Metrics(
+                            success=False,
+                            start_time=0,
+                            finish_time=0,
+                            end_to_end_latency_s=0,
+                            input_tokens=input_length,
+                        ),
+                    )
+                )
+            return request_records
+
+        return LazyRequestRecords(self.num_requests, _build)
 
 
 class JSONModeEvalDataset(Dataset):  # pylint: disable=too-few-public-methods
     """The dataset class for JSON dataset."""
 
-    def __init__(self, tokenizer: AutoTokenizer) -> None:
+    def __init__(self, tokenizer: "AutoTokenizer", tokenize_workers: int = 1) -> None:
+        from datasets import load_dataset  # pylint: disable=import-outside-toplevel,import-error
+
         raw_dataset = load_dataset("NousResearch/json-mode-eval")
         self.tokenizer = tokenizer
         self.dataset = []
-        for data in raw_dataset["train"]:
-            messages = data["prompt"]
+        samples = [(data["prompt"], data["schema"]) for data in raw_dataset["train"]]
+        with ParallelTokenizer(tokenizer, tokenize_workers) as parallel_tokenizer:
+            message_lengths = iter(
+                len(token_ids)
+                for token_ids in parallel_tokenizer.encode(
+                    [message["content"] for messages, _ in samples for message in messages],
+                    add_special_tokens=False,
+                )
+            )
+        for messages, schema in samples:
             schema = {
                 "type": "json_object",
-                "schema": data["schema"],
+                "schema": schema,
             }
-            num_tokens = 0
-            for message in messages:
-                num_tokens += len(
-                    self.tokenizer.encode(message["content"], add_special_tokens=False)
-                )
+            num_tokens = sum(next(message_lengths) for _ in messages)
             self.dataset.append((messages, schema, num_tokens))
 
     def generate_request_records(
@@ -476,7 +862,7 @@ Action 3: Finish[yes]
 
     # pylint: enable=line-too-long
     def __init__(  # pylint: disable=too-many-locals
-        self, dataset_path: str, tokenizer: AutoTokenizer
+        self, dataset_path: str, tokenizer: "AutoTokenizer", tokenize_workers: int = 1
     ) -> None:
         raw_entries: List[Dict] = []
         with open(dataset_path) as fin:  # pylint: disable=unspecified-encoding
@@ -484,48 +870,24 @@ Action 3: Finish[yes]
                 line_content = json.loads(line)
                 raw_entries += list({"question": k, "triplets": v} for k, v in line_content.items())
 
-        self._dataset = []
+        # Collect the outputs and the input sequences of every round,
+        # so that all of them are tokenized in one go.
+        output_texts: List[str] = []
+        input_seqs: List[str] = []
         max_rounds = 0
         for raw_entry in raw_entries:
-            processed_entry = []
             question = raw_entry["question"]
             triplets = raw_entry["triplets"]
             seq = self.prefix + question
             max_rounds = max(max_rounds, len(triplets) + 1)
-            output_lengths: List[int] = []
             for i, triplet in enumerate(triplets):
-                output_lengths.append(
-                    len(
-                        tokenizer(
-                            triplet["thought"]
-                            + "\nAction "
-                            + str(i + 1)
-                            + ": "
-                            + triplet["action"]
-                            + "\n",
-                            truncation=True,
-                            max_length=min(tokenizer.model_max_length, self.truncate_length),
-                            add_special_tokens=False,
-                        ).input_ids
-                    )
+                output_texts.append(
+                    triplet["thought"] + "\nAction " + str(i + 1) + ": " + triplet["action"] + "\n"
                 )
 
             for i in range(1, len(triplets) + 2):
                 seq += "Thought " + str(i) + ":"
-                input_len = len(
-                    tokenizer(
-                        seq,
-                        truncation=True,
-                        max_length=min(tokenizer.model_max_length, self.truncate_length),
-                        add_special_tokens=False,
-                    ).input_ids
-                )
-                output_length = (
-                    output_lengths[i - 1]
-                    if i <= len(triplets)
-                    else int(sum(output_lengths) / len(triplets))
-                )
-                processed_entry.append((seq, input_len, output_length))
+                input_seqs.append(seq)
                 if i != len(triplets) + 1:
                     seq += (
                         triplets[i - 1]["thought"]
@@ -539,6 +901,35 @@ Action 3: Finish[yes]
                         + triplets[i - 1]["observation"]
                         + "\n"
                     )
+
+        with ParallelTokenizer(tokenizer, tokenize_workers) as parallel_tokenizer:
+            tokenize_kwargs = {
+                "truncation": True,
+                "max_length": min(tokenizer.model_max_length, self.truncate_length),
+                "add_special_tokens": False,
+            }
+            all_output_lengths = iter(
+                len(token_ids)
+                for token_ids in parallel_tokenizer.encode(output_texts, **tokenize_kwargs)
+            )
+            all_input_lengths = iter(
+                len(token_ids)
+                for token_ids in parallel_tokenizer.encode(input_seqs, **tokenize_kwargs)
+            )
+
+        self._dataset = []
+        seqs = iter(input_seqs)
+        for raw_entry in raw_entries:
+            triplets = raw_entry["triplets"]
+            output_lengths = [next(all_output_lengths) for _ in triplets]
+            processed_entry = []
+            for i in range(1, len(triplets) + 2):
+                output_length = (
+                    output_lengths[i - 1]
+                    if i <= len(triplets)
+                    else int(sum(output_lengths) / len(triplets))
+                )
+                processed_entry.append((next(seqs), next(all_input_lengths), output_length))
             self._dataset.append(processed_entry)
 
     def generate_request_records(
@@ -581,7 +972,382 @@ Action 3: Finish[yes]
         return request_records
 
 
-# Todo: dataset of log replay  # pylint: disable=fixme
+def _parse_replay_timestamp(value: Any) -> float:
+    """Convert a timestamp of the replay log (seconds or ISO 8601 date) to seconds."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(str(value).strip().replace("Z", "+00:00")).timestamp()
+
+
+def _iter_replay_log(log_path: str) -> Iterator[Dict[str, Any]]:
+    """Stream the entries of a request log in CSV or JSONL format.
+    Each entry is a dict of the request "timestamp" and the request "payload"
+    in OpenAI chat completion format (at least with "messages").
+    """
+    if log_path.endswith(".jsonl"):
+        with open(log_path, encoding="utf-8") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                yield {
+                    "timestamp": _parse_replay_timestamp(row["timestamp"]),
+                    "payload": row.get("payload", row),
+                }
+    elif log_path.endswith(".csv"):
+        with open(log_path, encoding="utf-8", newline="") as file:
+            for row in csv.DictReader(file):
+                # Support both the gateway log columns ("Date", "@request")
+                # and plain columns ("timestamp", "messages", "max_tokens").
+                if "@request" in row:
+                    payload = json.loads(row["@request"])
+                else:
+                    payload = {"messages": json.loads(row["messages"])}
+                    if row.get("max_tokens"):
+                        payload["max_tokens"] = int(row["max_tokens"])
+                yield {
+                    "timestamp": _parse_replay_timestamp(row.get("timestamp", row.get("Date"))),
+                    "payload": payload,
+                }
+    else:
+        raise ValueError("Unsupported replay log format. Please use .csv or .jsonl.")
+
+
+class ReplayDataset(Dataset):  # pylint: disable=too-few-public-methods
+    """The dataset class for replaying a request log with its original arrival times.
+    The log is streamed from disk and only the first requests that are benchmarked
+    are read. The requests are sorted by their timestamps and numbered in that order.
+    The timestamps are relative to the earliest request and scaled by `time_scale`,
+    e.g., 0.5 replays the log twice as fast.
+    """
+
+    require_fake_warmup: bool = True
+    has_timestamps: bool = True
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        log_path: str,
+        num_requests: int,
+        tokenizer: "AutoTokenizer",
+        time_scale: float = 1.0,
+        tokenize_workers: int = 1,
+    ) -> None:
+        if time_scale <= 0:
+            raise ValueError(f"Invalid replay time scale {time_scale}")
+        self.log_path = log_path
+        self.num_requests = num_requests
+        self.tokenizer = tokenizer
+        self.time_scale = time_scale
+        self.tokenize_workers = tokenize_workers
+
+    def generate_request_records(
+        self,
+        input_len: Optional[int],
+        output_len: Optional[int],
+        input_len_std: float = 0.0,
+        output_len_std: float = 0.0,
+    ) -> List[RequestRecord]:
+        if input_len is not None or output_len is not None:
+            raise ValueError("Replay dataset does not support specifying input/output length.")
+
+        entries = list(itertools.islice(_iter_replay_log(self.log_path), self.num_requests))
+        if len(entries) < self.num_requests:
+            raise ValueError(
+                f"The replay log {self.log_path} only has {len(entries)} requests, "
+                f"fewer than the {self.num_requests} requests to benchmark."
+            )
+        # The log is not guaranteed to be sorted, and requests of the same timestamp
+        # keep their order in the log.
+        entries.sort(key=lambda entry: entry["timestamp"])
+        messages_list = [
+            [
+                ChatCompletionMessage(content=message["content"], role=message["role"])
+                for message in entry["payload"]["messages"]
+            ]
+            for entry in entries
+        ]
+        with ParallelTokenizer(self.tokenizer, self.tokenize_workers) as parallel_tokenizer:
+            message_lengths = iter(
+                len(token_ids)
+                for token_ids in parallel_tokenizer.encode(
+                    [
+                        message.content if isinstance(message.content, str) else ""
+                        for messages in messages_list
+                        for message in messages
+                    ],
+                    add_special_tokens=False,
+                )
+            )
+
+        base_timestamp = entries[0]["timestamp"]
+        request_records = []
+        for request_id, (entry, messages) in enumerate(zip(entries, messages_list)):
+            num_tokens = sum(next(message_lengths) for _ in messages)
+            request_records.append(
+                RequestRecord(
+                    request_id=request_id,
+                    chat_cmpl=ChatCompletionRequest(
+                        messages=messages,
+                        model="",
+                        max_tokens=entry["payload"].get("max_tokens"),
+                    ),
+                    timestamp=(entry["timestamp"] - base_timestamp) * self.time_scale,
+                    metrics=Metrics(
+                        success=False,
+                        start_time=0,
+                        finish_time=0,
+                        end_to_end_latency_s=0,
+                        input_tokens=num_tokens,
+                    ),
+                )
+            )
+        return request_records
+
+
+# Common English words that are single tokens for most tokenizers,
+# so that the number of words in a synthetic prompt approximates its token count.
+_SYNTHETIC_WORDS = (
+    "the of and to in is was for on that with as by at from his it an were are which this "
+    "be or has had not first one their its new after but who they have her she two been "
+    "other when there all during into school time may years more most only over city some "
+    "world would where later up such used many can state about national out known university "
+    "united then made while part three high like being film people between both year found "
+    "under team well age back area so work since second early including through way each "
+    "also life water game music north light house power place group number day book river "
+    "road line name best long small great south end old side war west east family good"
+).split()
+
+SUPPORTED_LENGTH_DISTRIBUTIONS = ["normal", "uniform", "lognormal"]
+
+
+def _sample_lengths(mean: float, std: float, size: int, distribution: str) -> np.ndarray:
+    """Sample `size` positive integer lengths of the given mean and standard deviation."""
+    if std <= 0:
+        lengths = np.full(size, mean)
+    elif distribution == "normal":
+        lengths = np.random.normal(loc=mean, scale=std, size=size)
+    elif distribution == "uniform":
+        # The uniform distribution on [a, b] has a standard deviation of (b - a) / sqrt(12).
+        half_width = std * np.sqrt(3)
+        lengths = np.random.uniform(mean - half_width, mean + half_width, size=size)
+    elif distribution == "lognormal":
+        sigma = np.sqrt(np.log1p((std / mean) ** 2))
+        lengths = np.random.lognormal(mean=np.log(mean) - sigma**2 / 2, sigma=sigma, size=size)
+    else:
+        raise ValueError(f'Unrecognized length distribution "{distribution}"')
+    return np.maximum(np.round(lengths), 1).astype(np.int64)
+
+
+class SyntheticDataset(Dataset):  # pylint: disable=too-few-public-methods
+    """The dataset class of synthetic prompts made of random words.
+    The dataset needs neither a dataset file nor a tokenizer. Each word of the word
+    list is roughly one token, and the exact token counts are taken from the usage
+    reported by the server when no tokenizer is given.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        num_requests: int,
+        length_distribution: str = "normal",
+        word_list_path: Optional[str] = None,
+        tokenizer: Optional["AutoTokenizer"] = None,
+        tokenize_workers: int = 1,
+    ) -> None:
+        if length_distribution not in SUPPORTED_LENGTH_DISTRIBUTIONS:
+            raise ValueError(f'Unrecognized length distribution "{length_distribution}"')
+        self.num_requests = num_requests
+        self.length_distribution = length_distribution
+        self.tokenizer = tokenizer
+        self.tokenize_workers = tokenize_workers
+        if word_list_path is not None:
+            with open(word_list_path, encoding="utf-8") as file:
+                words = [word for line in file for word in line.split()]
+            assert len(words) > 0, f"No words in the word list {word_list_path}"
+        else:
+            words = _SYNTHETIC_WORDS
+        self.words = np.array(words, dtype=object)
+
+    def _count_tokens(self, texts: List[str]) -> List[int]:
+        """Count the tokens of each text, or its words when there is no tokenizer."""
+        if self.tokenizer is None:
+            return [len(text.split()) for text in texts]
+        with ParallelTokenizer(self.tokenizer, self.tokenize_workers) as parallel_tokenizer:
+            return [
+                len(token_ids)
+                for token_ids in parallel_tokenizer.encode(texts, add_special_tokens=False)
+            ]
+
+    def generate_request_records(
+        self,
+        input_len: Optional[int],
+        output_len: Optional[int],
+        input_len_std: float = 0.0,
+        output_len_std: float = 0.0,
+    ) -> LazyRequestRecords:
+        if input_len is None:
+            input_len = 550
+        if output_len is None:
+            output_len = 150
+        input_lengths = _sample_lengths(
+            input_len, input_len_std, self.num_requests, self.length_distribution
+        )
+        output_lengths = _sample_lengths(
+            output_len, output_len_std, self.num_requests, self.length_distribution
+        )
+
+        def _build(selected: Sequence[int]) -> List[RequestRecord]:
+            selected = np.asarray(selected, dtype=np.int64)
+            # The words are drawn on every build, so that the same index built
+            # twice (e.g., for warmup and benchmark) does not share a prefix.
+            lengths = input_lengths[selected]
+            words = self.words[np.random.randint(0, len(self.words), size=int(lengths.sum()))]
+            offsets = np.concatenate([np.zeros(1, dtype=np.int64), np.cumsum(lengths)]).tolist()
+            prompts = [" ".join(words[begin:end]) for begin, end in zip(offsets, offsets[1:])]
+            num_tokens = (
+                self._count_tokens(prompts) if self.tokenizer is not None else lengths.tolist()
+            )
+            return [
+                RequestRecord(
+                    chat_cmpl=ChatCompletionRequest(
+                        messages=[{"role": "user", "content": prompt}],
+                        model="",
+                        max_tokens=output_length,
+                        debug_config=DebugConfig(ignore_eos=True),
+                    ),
+                    metrics=Metrics(
+                        success=False,
+                        start_time=0,
+                        finish_time=0,
+                        end_to_end_latency_s=0,
+                        input_tokens=input_tokens,
+                    ),
+                )
+                for prompt, input_tokens, output_length in zip(
+                    prompts, num_tokens, output_lengths[selected].tolist()
+                )
+            ]
+
+        return LazyRequestRecords(self.num_requests, _build)
+
+
+SUPPORTED_REUSE_DISTANCE_DISTRIBUTIONS = ["uniform", "geometric", "zipf"]
+
+
+def _create_reuse_distance_pmf(reuse_distance_str: str, num_prefixes: int) -> np.ndarray:
+    """Create the probabilities of the prefix reuse distances 0 to `num_prefixes - 1`
+    from the specification "<kind>[:<key>=<value>]", which is "uniform",
+    "geometric:mean=<mean distance>" or "zipf:s=<exponent>".
+    """
+    kind, _, option = reuse_distance_str.partition(":")
+    key, _, value = option.partition("=")
+    distances = np.arange(num_prefixes, dtype=np.float64)
+    if kind == "uniform" and not option:
+        pmf = np.ones(num_prefixes)
+    elif kind == "geometric" and key.strip() == "mean":
+        stop_prob = 1.0 / (float(value) + 1.0)
+        pmf = (1.0 - stop_prob) ** distances * stop_prob
+    elif kind == "zipf" and key.strip() == "s":
+        pmf = (distances + 1.0) ** -float(value)
+    else:
+        raise ValueError(
+            f'Unrecognized reuse distance distribution "{reuse_distance_str}". '
+            'Expecting "uniform", "geometric:mean=<mean>" or "zipf:s=<exponent>".'
+        )
+    return pmf / pmf.sum()
+
+
+class SharedPrefixDataset(SyntheticDataset):  # pylint: disable=too-few-public-methods
+    """The dataset class of synthetic requests that share system prompts, to measure
+    how much the prefix (KV) cache of the server saves on the TTFT.
+
+    There are `num_prefixes` system prompts of `prefix_len` random words. A request
+    uses one of them with probability `share_ratio`, and a system prompt of its own
+    otherwise. Each request has a user message of "--input-len" words on average.
+    The shared system prompts are kept in a least-recently-used stack, and each
+    request takes the one at the reuse distance sampled from `reuse_distance`, i.e.,
+    the number of other system prompts used since it was last used. Therefore, a
+    prefix cache of the server that holds k prefixes hits the requests of distance
+    below k. The system prompts are assigned in the order of the built records (i.e.,
+    the order the requests are sent in), and are drawn anew on every build.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        num_requests: int,
+        num_prefixes: int,
+        prefix_len: int,
+        share_ratio: float = 1.0,
+        reuse_distance: str = "uniform",
+        length_distribution: str = "normal",
+        word_list_path: Optional[str] = None,
+        tokenizer: Optional["AutoTokenizer"] = None,
+        tokenize_workers: int = 1,
+    ) -> None:
+        if num_prefixes < 1 or prefix_len < 1:
+            raise ValueError("The number and the length of the shared prefixes should be positive")
+        if not 0 <= share_ratio <= 1:
+            raise ValueError(f"Invalid prefix share ratio {share_ratio}")
+        super().__init__(
+            num_requests, length_distribution, word_list_path, tokenizer, tokenize_workers
+        )
+        self.num_prefixes = num_prefixes
+        self.prefix_len = prefix_len
+        self.share_ratio = share_ratio
+        self.reuse_distance_pmf = _create_reuse_distance_pmf(reuse_distance, num_prefixes)
+
+    def _draw_prefixes(self, num_prefixes: int) -> List[str]:
+        words = self.words[np.random.randint(0, len(self.words), size=num_prefixes * self.prefix_len)]
+        return [
+            " ".join(words[i * self.prefix_len : (i + 1) * self.prefix_len])
+            for i in range(num_prefixes)
+        ]
+
+    def generate_request_records(
+        self,
+        input_len: Optional[int],
+        output_len: Optional[int],
+        input_len_std: float = 0.0,
+        output_len_std: float = 0.0,
+    ) -> LazyRequestRecords:
+        suffix_records = super().generate_request_records(
+            input_len, output_len, input_len_std, output_len_std
+        )
+
+        def _build(selected: Sequence[int]) -> List[RequestRecord]:
+            request_records = suffix_records.build(selected)
+            shared = np.random.random(len(request_records)) < self.share_ratio
+            distances = np.random.choice(
+                self.num_prefixes, size=len(request_records), p=self.reuse_distance_pmf
+            ).tolist()
+            prefixes = self._draw_prefixes(self.num_prefixes)
+            # The shared prefixes are the first ones, followed by the unshared ones.
+            prefixes += self._draw_prefixes(int(np.count_nonzero(~shared)))
+            prefix_tokens = self._count_tokens(prefixes)
+            stack = list(range(self.num_prefixes))
+            used = [False] * self.num_prefixes
+            num_unshared = 0
+            for request_record, is_shared, distance in zip(request_records, shared, distances):
+                if is_shared:
+                    prefix_id = stack.pop(distance)
+                    stack.insert(0, prefix_id)
+                    request_record.prefix_reuse_distance = distance if used[prefix_id] else -1
+                    used[prefix_id] = True
+                else:
+                    prefix_id = self.num_prefixes + num_unshared
+                    num_unshared += 1
+                    request_record.prefix_reuse_distance = -1
+                request_record.chat_cmpl.messages.insert(
+                    0, ChatCompletionMessage(role="system", content=prefixes[prefix_id])
+                )
+                request_record.metrics.input_tokens += prefix_tokens[prefix_id]
+            return request_records
+
+        return LazyRequestRecords(len(suffix_records), _build)
+
+
 # NOTE: moved from the previous "python/mlc_llm/bench/prompts.py"
 # class PromptsGenerator:  # pylint: disable=too-few-public-methods
 #     """
@@ -721,94 +1487,106 @@ Action 3: Finish[yes]
 #         return {"messages": [{"role": "system", "content": result_prompt}]}
 
 
-# def load_replay_log(log_path: str) -> List[Dict]:
-#     """
-#     Load replay log from file
-
-#     Parameters
-#     ----------
-#     log_path : str
-#         The path to the event log CSV or JSONL file containing the events to replay.
-
-#     Returns
-#     -------
-#     res: List[Dict]
-#         A list of preprocessed event data for replay.
-#     """
-#     if log_path.endswith(".csv"):
-#         import pandas as pd  # pylint: disable=import-outside-toplevel,import-error
-
-#         df = pd.read_csv(log_path)
-#         column_names = df.columns.values
-#         assert (
-#             ("Date" in column_names)
-#             and ("@request" in column_names)
-#             and ("Message" in column_names)
-#         )
-#         df["timestamp"] = pd.to_datetime(df["Date"])
-#         df.sort_values("timestamp", inplace=True)
-#         # Get the request params from the loaded CSV
-#         params = []
-#         for _, row in df.iterrows():
-#             request = row["@request"]
-#             payload = json.loads(str(request))
-#             params.append(
-#                 {
-#                     "timestamp": row["timestamp"],
-#                     "payload": payload,
-#                 }
-#             )
-#         return params
-#     if log_path.endswith(".jsonl"):
-#         with open(log_path, "r", encoding="utf-8") as file:
-#             data = [json.loads(line) for line in file]
-#             for row in data:
-#                 row["timestamp"] = datetime.fromisoformat(str(row["timestamp"]))
-#         return data
-#     raise ValueError("Unsupported file format. Please use .csv or .jsonl.")
-
 SUPPORTED_DATASET = [
     "sharegpt",
     "llmperf",
     "json-mode-eval",
     "loogle",
     "react",
+    "replay",
+    "synthetic",
+    "shared-prefix",
 ]
 
 
-def create_dataset(args: argparse.Namespace, tokenizer: AutoTokenizer) -> "Dataset":
+def create_dataset(args: argparse.Namespace, tokenizer: Optional["AutoTokenizer"]) -> "Dataset":
     """Create a dataset instance with regard to the specified dataset kind and file path."""
     if args.dataset is None:
         # Auto-detect the dataset kind by looking into the dataset path.
-        if "sharegpt" in args.dataset_path.lower():
+        if args.dataset_path is not None and "sharegpt" in args.dataset_path.lower():
             args.dataset = "sharegpt"
         else:
             raise ValueError(
                 f"Unable to detect the dataset kind from dataset path {args.dataset_path}. "
                 'Please specify the dataset kind via "--dataset".'
             )
+    if args.dataset == "synthetic":
+        return SyntheticDataset(
+            args.num_requests,
+            args.synthetic_length_dist,
+            args.dataset_path,
+            tokenizer,
+            args.tokenize_workers,
+        )
+    if args.dataset == "shared-prefix":
+        return SharedPrefixDataset(
+            args.num_requests,
+            args.shared_prefix_num,
+            args.shared_prefix_len,
+            args.shared_prefix_ratio,
+            args.shared_prefix_reuse_distance,
+            args.synthetic_length_dist,
+            args.dataset_path,
+            tokenizer,
+            args.tokenize_workers,
+        )
+    if tokenizer is None:
+        raise ValueError(f'Dataset "{args.dataset}" requires a tokenizer via "--tokenizer".')
+    if args.dataset_path is None and args.dataset not in ["json-mode-eval", "loogle"]:
+        raise ValueError(f'Dataset "{args.dataset}" requires a dataset file via "--dataset-path".')
+    if args.session:
+        if args.dataset != "sharegpt":
+            raise ValueError('User sessions are only supported for the "sharegpt" dataset.')
+        assert (
+            args.apply_chat_template is False
+        ), "User sessions do not support applying chat template"
+        return ShareGPTSessionDataset(
+            args.dataset_path, tokenizer, args.session_max_turns, args.tokenize_workers
+        )
     if args.dataset == "sharegpt":
-        return ShareGPTDataset(args.dataset_path, tokenizer, args.apply_chat_template)
+        return ShareGPTDataset(
+            args.dataset_path,
+            tokenizer,
+            args.apply_chat_template,
+            args.dataset_cache,
+            args.tokenize_workers,
+        )
     if args.dataset == "llmperf":
         assert (
             args.apply_chat_template is False
         ), "LLMPerf dataset does not support applying chat template"
         return LLMPerfDataset(
-            args.dataset_path, (args.num_requests + args.num_warmup_requests) * 4, tokenizer
+            args.dataset_path,
+            (args.num_requests + args.num_warmup_requests) * 4,
+            tokenizer,
+            args.tokenize_workers,
         )
     if args.dataset == "json-mode-eval":
         assert (
             args.apply_chat_template is False
         ), "JSON mode evaluation does not support applying chat template"
-        return JSONModeEvalDataset(tokenizer)
+        return JSONModeEvalDataset(tokenizer, args.tokenize_workers)
     if args.dataset == "loogle":
         assert (
             args.apply_chat_template is False
         ), "Loogle dataset does not support applying chat template"
-        return LoogleDataset(tokenizer, testset_name=args.dataset_path)
+        return LoogleDataset(
+            tokenizer, testset_name=args.dataset_path, tokenize_workers=args.tokenize_workers
+        )
     if args.dataset == "react":
         assert (
             args.apply_chat_template is False
         ), "ReAct dataset does not support applying chat template"
-        return ReActDataset(args.dataset_path, tokenizer)
+        return ReActDataset(args.dataset_path, tokenizer, args.tokenize_workers)
+    if args.dataset == "replay":
+        assert (
+            args.apply_chat_template is False
+        ), "Replay dataset does not support applying chat template"
+        return ReplayDataset(
+            args.dataset_path,
+            args.num_requests,
+            tokenizer,
+            args.replay_time_scale,
+            args.tokenize_workers,
+        )
     raise ValueError(f"Unrecognized dataset {args.dataset}")
@@ -0,0 +1,139 @@
+"""MLC LLM benchmark tokenized dataset cache"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+import numpy as np
+
+from mlc_llm.support import logging
+
+if TYPE_CHECKING:
+    from transformers import AutoTokenizer  # pylint: disable=import-error
+
+logger = logging.getLogger(__name__)
+
+# Bump this whenever the layout or the content of the cached arrays changes.
+CACHE_FORMAT_VERSION = 2
+
+
+def file_fingerprint(path: str, index_path: Optional[str] = None) -> str:
+    """Compute the SHA-256 hash of the whole content of a dataset file.
+
+    Hashing a multi-GB file takes a few seconds, so when `index_path` is given the
+    hash is recorded there keyed by the file path, size and modification time, and
+    reused as long as none of them change.
+    """
+    stat = os.stat(path)
+    file_key = f"{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    index: Dict[str, str] = {}
+    if index_path is not None and os.path.isfile(index_path):
+        try:
+            with open(index_path, encoding="utf-8") as file:
+                index = json.load(file)
+        except (OSError, ValueError) as err:
+            logger.warning("Ignoring corrupted file hash index %s: %s", index_path, err)
+        if file_key in index:
+            return index[file_key]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    fingerprint = digest.hexdigest()
+
+    if index_path is not None:
+        index[file_key] = fingerprint
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        # Write to a temporary file first, so that concurrent runs never read a partial index.
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(index_path))
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                json.dump(index, file)
+            os.replace(tmp_path, index_path)
+        except OSError as err:
+            os.unlink(tmp_path)
+            logger.warning("Failed to save file hash index %s: %s", index_path, err)
+    return fingerprint
+
+
+def tokenizer_fingerprint(tokenizer: "AutoTokenizer") -> str:
+    """Compute a fingerprint of the tokenizer vocabulary, merges and chat template."""
+    digest = hashlib.sha256(type(tokenizer).__name__.encode())
+    backend_tokenizer = getattr(tokenizer, "backend_tokenizer", None)
+    if backend_tokenizer is not None:
+        # The truncation and padding states are changed by every tokenizer call, skip them.
+        config = json.loads(backend_tokenizer.to_str())
+        config.pop("truncation", None)
+        config.pop("padding", None)
+        digest.update(json.dumps(config, sort_keys=True).encode())
+    else:
+        digest.update(json.dumps(tokenizer.get_vocab(), sort_keys=True).encode())
+    digest.update(str(getattr(tokenizer, "chat_template", None)).encode())
+    digest.update(str(tokenizer.model_max_length).encode())
+    return digest.hexdigest()
+
+
+class TokenizedDatasetCache:
+    """The on-disk cache of a tokenized dataset.
+
+    Each cache entry is a directory of ".npy" arrays keyed by the dataset file,
+    the tokenizer and the tokenization options, so that the arrays can be
+    memory-mapped back instead of tokenizing the dataset again.
+    """
+
+    def __init__(
+        self, cache_dir: str, dataset_path: str, tokenizer: "AutoTokenizer", **options: Any
+    ) -> None:
+        key = {
+            "version": CACHE_FORMAT_VERSION,
+            "dataset": file_fingerprint(
+                dataset_path, os.path.join(cache_dir, "file-hashes.json")
+            ),
+            "tokenizer": tokenizer_fingerprint(tokenizer),
+            **options,
+        }
+        self.key = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:32]
+        self.path = os.path.join(
+            cache_dir, f"{os.path.basename(dataset_path).rsplit('.', 1)[0]}-{self.key}"
+        )
+
+    def load(self) -> Optional[Dict[str, np.ndarray]]:
+        """Memory-map the cached arrays. Return None if the cache entry does not exist."""
+        if not os.path.isdir(self.path):
+            return None
+        try:
+            arrays = {
+                # Drop the memmap subclass to avoid its overhead when slicing the arrays.
+                filename[: -len(".npy")]: np.load(
+                    os.path.join(self.path, filename), mmap_mode="r", allow_pickle=False
+                ).view(np.ndarray)
+                for filename in os.listdir(self.path)
+                if filename.endswith(".npy")
+            }
+        except (OSError, ValueError) as err:
+            logger.warning("Ignoring corrupted dataset cache %s: %s", self.path, err)
+            return None
+        logger.info("Loaded tokenized dataset from cache %s", self.path)
+        return arrays
+
+    def save(self, arrays: Dict[str, np.ndarray]) -> None:
+        """Save the arrays as a new cache entry.
+        The entry is written to a temporary directory first and then atomically
+        renamed, so that concurrent benchmark runs never observe a partial entry.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix=".tmp-", dir=os.path.dirname(self.path))
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_path, name + ".npy"), array, allow_pickle=False)
+            os.rename(tmp_path, self.path)
+        except OSError as err:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.isdir(self.path):
+                logger.warning("Failed to save dataset cache %s: %s", self.path, err)
+            return
+        logger.info("Saved tokenized dataset to cache %s", self.path)
@@ -0,0 +1,381 @@
+"""MLC LLM benchmark distributed load generation
+
+The coordinator (the benchmark process) listens for agents, which are benchmark
+clients on other machines (or local processes as a stand-in). For every executor
+run, the coordinator sends each agent a shard of the requests together with the
+executor of the shard and a start time, and the agents send the request records
+back once done. The record times are converted to the clock of the coordinator,
+so the records of all agents are reported together as one benchmark.
+
+Run an agent with
+    SUDONIM_BENCH_AUTHKEY=<key> python -m sudonim.bench.distributed --coordinator <host>:<port>
+
+The messages are pickled, so the coordinator and the agents must share a secret
+key, with which any peer without the key is rejected before a message is read.
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import secrets
+import threading
+import time
+import traceback
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, List, Optional, Tuple
+
+from typing_extensions import Self
+
+from sudonim.bench.request_processor import (
+    Executor,
+    RequestProcessor,
+    SequentialProcessor,
+    WarmupAndRun,
+    partition_request_records,
+)
+from sudonim.bench.request_record import RequestRecord
+from mlc_llm.support import logging
+
+logger = logging.getLogger(__name__)
+
+# The environment variable of the key that the coordinator and the agents authenticate with.
+AUTHKEY_ENV = "SUDONIM_BENCH_AUTHKEY"
+
+
+def parse_address(address_str: str) -> Tuple[str, int]:
+    """Parse the "host:port" address."""
+    host, sep, port = address_str.rpartition(":")
+    if not sep or not host or not port.isdigit():
+        raise ValueError(f'Unrecognized address "{address_str}". Expecting "host:port".')
+    return host, int(port)
+
+
+def _connect(address: Tuple[str, int], authkey: str, timeout_s: float) -> Connection:
+    """Connect to the coordinator, retrying until it listens or the timeout passes,
+    so that the agents can be started before the coordinator.
+    """
+    deadline = time.monotonic() + timeout_s
+    while True:
+        try:
+            return Client(address, authkey=authkey.encode("utf-8"))
+        except ConnectionRefusedError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(1.0)
+
+
+def run_agent(address: Tuple[str, int], authkey: str, connect_timeout_s: float = 600.0) -> None:
+    """Connect to the coordinator and run the request shards it sends until it stops."""
+    with _connect(address, authkey, connect_timeout_s) as conn:
+        logger.info("Connected to the coordinator at %s:%d", *address)
+        while True:
+            message = conn.recv()
+            if message[0] == "stop":
+                break
+            if message[0] == "clock":
+                conn.send(time.time())
+                continue
+            assert message[0] == "run"
+            _, executor, request_records, start_time, warmup = message
+            try:
+                # All the agents wait for the same start time as the barrier.
+                time.sleep(max(start_time - time.time(), 0.0))
+                if warmup:
+                    request_records = executor.warmup(request_records)
+                else:
+                    request_records = executor(request_records)
+            except Exception:  # pylint: disable=broad-exception-caught
+                conn.send(("error", traceback.format_exc()))
+                continue
+            for begin in range(0, len(request_records), Coordinator.chunk_size):
+                conn.send(("records", request_records[begin : begin + Coordinator.chunk_size]))
+            # The metrics times are in the monotonic clock of the agent.
+            conn.send(("done", time.time() - time.monotonic()))
+
+
+class Coordinator:
+    """Distributes the requests of the executors to the agents and merges the results.
+
+    The coordinator waits for `num_agents` agents to connect at `address`, and starts
+    `num_local_agents` more agents as local processes. The agents authenticate with
+    `authkey`, which is required for the agents on other machines, and is a random
+    key shared with the local agents otherwise.
+    """
+
+    # The number of request records sent back in one message.
+    chunk_size: int = 256
+    # The number of round trips to estimate the clock offset of an agent with.
+    num_clock_samples: int = 8
+    # The delay in seconds from sending the shards to the start barrier.
+    start_delay_s: float = 1.0
+    # The number of seconds to wait for all the agents to connect.
+    connect_timeout_s: float = 600.0
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        num_agents: int,
+        num_local_agents: int,
+        authkey: Optional[str] = None,
+    ) -> None:
+        if not authkey:
+            if num_agents > 0:
+                raise ValueError(
+                    "The agents on other machines need a shared key to authenticate with, "
+                    f'via "--distributed-authkey" or the environment variable "{AUTHKEY_ENV}".'
+                )
+            authkey = secrets.token_hex(32)
+        self.address = address
+        self.num_agents = num_agents
+        self.num_local_agents = num_local_agents
+        self.authkey = authkey
+        self.listener: Optional[Listener] = None
+        self.conns: List[Connection] = []
+        self.agent_names: List[str] = []
+        self.local_agents: List[Any] = []
+
+    def __enter__(self) -> Self:
+        self.listener = Listener(self.address, authkey=self.authkey.encode("utf-8"))
+        host, port = self.listener.address
+        connect_address = ("127.0.0.1" if host == "0.0.0.0" else host, port)
+        for _ in range(self.num_local_agents):
+            # The agents are not daemonic, as they may start their own worker processes.
+            agent = multiprocessing.Process(target=run_agent, args=(connect_address, self.authkey))
+            agent.start()
+            self.local_agents.append(agent)
+        logger.info(
+            "Waiting for %d agent(s) to connect at %s:%d",
+            self.num_agents + self.num_local_agents,
+            host,
+            port,
+        )
+        try:
+            self._wait_for_agents()
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def _wait_for_agents(self) -> None:
+        """Accept the agents until all of them are connected. Fail when a local agent
+        exits or the agents do not connect within `connect_timeout_s` seconds.
+        """
+        num_total_agents = self.num_agents + self.num_local_agents
+        accepted: "queue.Queue[Tuple[Connection, Any]]" = queue.Queue()
+
+        def _accept() -> None:
+            num_accepted = 0
+            while num_accepted < num_total_agents:
+                try:
+                    conn = self.listener.accept()
+                except multiprocessing.AuthenticationError:
+                    logger.warning("Rejected a connection that failed to authenticate")
+                    continue
+                except OSError:
+                    # The listener is closed as the coordinator gives up.
+                    return
+                accepted.put((conn, self.listener.last_accepted))
+                num_accepted += 1
+
+        threading.Thread(target=_accept, daemon=True).start()
+        deadline = time.monotonic() + self.connect_timeout_s
+        while len(self.conns) < num_total_agents:
+            try:
+                conn, peer_address = accepted.get(timeout=1.0)
+            except queue.Empty:
+                num_missing = num_total_agents - len(self.conns)
+                for agent in self.local_agents:
+                    if agent.exitcode is not None:
+                        raise RuntimeError(
+                            f"A local agent exited with code {agent.exitcode} before connecting, "
+                            f"with {num_missing} agent(s) still missing."
+                        )
+                if time.monotonic() >= deadline:
+                    raise RuntimeError(
+                        f"{num_missing} of the {num_total_agents} agent(s) did not connect "
+                        f"within {self.connect_timeout_s:g}s."
+                    )
+                continue
+            self.conns.append(conn)
+            self.agent_names.append(
+                f"agent {len(self.conns) - 1} at {peer_address[0]}:{peer_address[1]}"
+                if isinstance(peer_address, tuple)
+                else f"agent {len(self.conns) - 1}"
+            )
+
+    def __exit__(self, exc_type, exc_value, tb) -> None:
+        for conn in self.conns:
+            try:
+                conn.send(("stop",))
+            except OSError:
+                pass
+            conn.close()
+        for agent in self.local_agents:
+            agent.join(timeout=10)
+            if agent.is_alive():
+                agent.terminate()
+        self.listener.close()
+
+    def _recv(self, conn: Connection) -> Any:
+        """Receive a message from the agent, failing with the agent name when it disconnects."""
+        try:
+            return conn.recv()
+        except (EOFError, OSError) as err:
+            agent_name = self.agent_names[self.conns.index(conn)]
+            raise RuntimeError(f"The {agent_name} disconnected while running the requests") from err
+
+    def _measure_clock_offset(self, conn: Connection) -> float:
+        """Estimate the offset of the agent clock from the coordinator clock with the
+        round trip of the least delay, assuming the agent reads its clock halfway.
+        """
+        best_rtt, best_offset = float("inf"), 0.0
+        for _ in range(self.num_clock_samples):
+            send_time = time.time()
+            conn.send(("clock",))
+            agent_time = self._recv(conn)
+            recv_time = time.time()
+            if recv_time - send_time < best_rtt:
+                best_rtt = recv_time - send_time
+                best_offset = agent_time - (send_time + recv_time) / 2
+        return best_offset
+
+    def run(
+        self, executor: Executor, request_records: List[RequestRecord], warmup: bool
+    ) -> List[RequestRecord]:
+        """Run the requests over the agents with the given executor."""
+        if all(request_record.timestamp is not None for request_record in request_records):
+            # Interleave the timestamps across the shards.
+            request_records = sorted(
+                request_records, key=lambda request_record: request_record.timestamp
+            )
+        # Use fewer agents when there is not enough load to shard, e.g., the number of
+        # concurrent requests is less than the number of agents.
+        num_shards = min(len(self.conns), len(request_records))
+        while num_shards > 1 and executor.shard(num_shards - 1, num_shards, request_records) is None:
+            num_shards -= 1
+        shards = [
+            (conn, executor.shard(i, num_shards, request_records), shard)
+            for i, (conn, shard) in enumerate(
+                zip(self.conns, partition_request_records(request_records, num_shards))
+            )
+        ]
+        clock_offsets = [self._measure_clock_offset(conn) for conn, _, _ in shards]
+        start_time = time.time() + self.start_delay_s
+        for (conn, shard_executor, shard), clock_offset in zip(shards, clock_offsets):
+            conn.send(("run", shard_executor, shard, start_time + clock_offset, warmup))
+        logger.info("Sent the requests to %d agent(s)", len(shards))
+
+        results: List[RequestRecord] = []
+        errors: List[str] = []
+        for (conn, _, _), clock_offset in zip(shards, clock_offsets):
+            agent_records: List[RequestRecord] = []
+            while True:
+                message = self._recv(conn)
+                if message[0] == "records":
+                    agent_records.extend(message[1])
+                    continue
+                if message[0] == "error":
+                    errors.append(message[1])
+                else:
+                    # Convert the monotonic times of the agent to the coordinator.
+                    time_delta = message[1] - clock_offset - (time.time() - time.monotonic())
+                    for request_record in agent_records:
+                        _shift_metrics_times(request_record, time_delta)
+                    results.extend(agent_records)
+                break
+        if errors:
+            raise RuntimeError("Agent(s) failed to run the requests:\n" + "\n".join(errors))
+        return results
+
+
+def _shift_metrics_times(request_record: RequestRecord, time_delta: float) -> None:
+    metrics = request_record.metrics
+    # The requests that are never sent keep the zero times.
+    if metrics is None or metrics.finish_time <= 0:
+        return
+    metrics.start_time += time_delta
+    metrics.finish_time += time_delta
+    if metrics.scheduled_start_time is not None:
+        metrics.scheduled_start_time += time_delta
+
+
+class DistributedExecutor(Executor):  # pylint: disable=too-few-public-methods
+    """The executor that sends the requests of the given executor from the agents."""
+
+    def __init__(self, coordinator: Coordinator, executor: Executor) -> None:
+        super().__init__(
+            executor.f_create_api_endpoint,
+            executor.num_processes,
+            executor.disable_tqdm,
+            executor.abort_error_rate,
+            duration=executor.duration,
+        )
+        self.coordinator = coordinator
+        self.executor = executor
+
+    def _execute(self, request_records: List[RequestRecord]) -> List[RequestRecord]:
+        return self.coordinator.run(self.executor, request_records, warmup=False)
+
+    def warmup(self, request_records: List[RequestRecord]) -> List[RequestRecord]:
+        return self.coordinator.run(self.executor, request_records, warmup=True)
+
+
+def distribute_pipeline(pipeline: RequestProcessor, coordinator: Coordinator) -> None:
+    """Make the executors in the pipeline send the requests from the agents."""
+    if isinstance(pipeline, SequentialProcessor):
+        for processor in pipeline.processors:
+            distribute_pipeline(processor, coordinator)
+    elif isinstance(pipeline, WarmupAndRun) and not isinstance(
+        pipeline.pipeline, DistributedExecutor
+    ):
+        pipeline.pipeline = DistributedExecutor(coordinator, pipeline.pipeline)
+
+
+def create_coordinator(args: argparse.Namespace) -> Optional[Coordinator]:
+    """Create the coordinator when the benchmark is distributed to agents."""
+    if not args.num_agents and not args.num_local_agents:
+        return None
+    if args.coordinator_address is None:
+        if args.num_agents:
+            raise ValueError(
+                "Please specify the address for the agents to connect to "
+                'via "--coordinator-address".'
+            )
+        address = ("127.0.0.1", 0)
+    else:
+        address = parse_address(args.coordinator_address)
+    return Coordinator(
+        address,
+        args.num_agents,
+        args.num_local_agents,
+        args.distributed_authkey or os.environ.get(AUTHKEY_ENV),
+    )
+
+
+if __name__ == "__main__":
+    logging.enable_logging()
+    parser = argparse.ArgumentParser("MLC LLM benchmark agent")
+    parser.add_argument(
+        "--coordinator",
+        type=parse_address,
+        required=True,
+        help='The "host:port" address of the benchmark coordinator to connect to.',
+    )
+    parser.add_argument(
+        "--authkey",
+        type=str,
+        default=os.environ.get(AUTHKEY_ENV),
+        help="The key to authenticate with the coordinator, "
+        f'default to the environment variable "{AUTHKEY_ENV}". Required.',
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        type=float,
+        default=600.0,
+        help="The number of seconds to keep retrying to connect to the coordinator.",
+    )
+    agent_args = parser.parse_args()
+    if not agent_args.authkey:
+        parser.error(f'Please specify the key via "--authkey" or "{AUTHKEY_ENV}".')
+    run_agent(agent_args.coordinator, agent_args.authkey, agent_args.connect_timeout)
@@ -0,0 +1,63 @@
+"""MLC LLM benchmark event loop utilities"""
+
+import asyncio
+from typing import Any, Coroutine, List, Optional, TypeVar
+
+import numpy as np
+
+from mlc_llm.support import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class EventLoopLagMonitor:
+    """Measures how late the event loop wakes up a periodic timer.
+
+    When the loop is saturated by sending requests and parsing responses, the
+    timer callbacks (and thereby the request timings) are delayed by the lag,
+    which is the signal to spread the requests over more processes.
+    """
+
+    def __init__(self, interval_s: float = 0.01) -> None:
+        self.interval_s = interval_s
+        self.lags_s: List[float] = []
+
+    async def run(self) -> None:
+        """Measure the lag until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval_s
+            await asyncio.sleep(self.interval_s)
+            self.lags_s.append(max(loop.time() - expected, 0.0))
+
+    def percentile(self, q: float) -> float:
+        """The q-th percentile of the measured lags in seconds."""
+        return float(np.percentile(self.lags_s, q)) if self.lags_s else 0.0
+
+
+def run_event_loop(
+    coro: Coroutine[Any, Any, T], lag_monitor: Optional[EventLoopLagMonitor] = None
+) -> T:
+    """Run the coroutine in a new event loop, using uvloop when it is installed.
+    When a lag monitor is given, the loop lag is measured while the coroutine runs.
+    """
+
+    async def _main() -> T:
+        if lag_monitor is None:
+            return await coro
+        lag_task = asyncio.create_task(lag_monitor.run())
+        try:
+            return await coro
+        finally:
+            lag_task.cancel()
+
+    try:
+        import uvloop  # pylint: disable=import-outside-toplevel,import-error
+    except ImportError:
+        return asyncio.run(_main())
+    # "uvloop.run" (uvloop>=0.18) runs a uvloop loop without setting the global event loop policy.
+    if hasattr(uvloop, "run"):
+        return uvloop.run(_main())
+    return asyncio.run(_main())
@@ -0,0 +1,83 @@
+"""MLC LLM benchmark packed sequence storage"""
+
+import itertools
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+
+def _lengths_to_offsets(lengths: np.ndarray) -> np.ndarray:
+    return np.concatenate([np.zeros(1, dtype=np.int64), np.cumsum(lengths, dtype=np.int64)])
+
+
+class PackedSequences:
+    """A list of variable-length sequences packed into one flat buffer.
+
+    The sequences are stored back to back in `data`, and the i-th sequence is
+    `data[offsets[i] : offsets[i + 1]]`. Compared with lists of Python ints, this
+    takes 4 bytes per int32 token instead of 28+, can be memory-mapped from the
+    dataset cache, and is sent to worker processes as a few contiguous buffers.
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray) -> None:
+        assert offsets.ndim == 1 and len(offsets) >= 1 and offsets[0] == 0
+        assert int(offsets[-1]) == len(data)
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_lists(
+        cls, sequences: Sequence[Sequence[int]], dtype: np.dtype = np.int32
+    ) -> "PackedSequences":
+        """Pack the lists of ints (e.g., the token ids of each prompt)."""
+        offsets = _lengths_to_offsets(np.array([len(seq) for seq in sequences], dtype=np.int64))
+        data = np.fromiter(
+            itertools.chain.from_iterable(sequences), dtype=dtype, count=int(offsets[-1])
+        )
+        return cls(data, offsets)
+
+    @classmethod
+    def from_texts(cls, texts: Sequence[str]) -> "PackedSequences":
+        """Pack the texts as utf-8 bytes. Use `get_text` to get a text back."""
+        encoded = [text.encode("utf-8") for text in texts]
+        offsets = _lengths_to_offsets(np.array([len(data) for data in encoded], dtype=np.int64))
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    @classmethod
+    def concatenate(cls, parts: List["PackedSequences"], dtype: np.dtype) -> "PackedSequences":
+        """Concatenate the packed sequences into one."""
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        for part in parts:
+            offsets.append(part.offsets[1:] + base)
+            base += len(part.data)
+        return cls(
+            np.concatenate([np.zeros(0, dtype=dtype)] + [part.data for part in parts]),
+            np.concatenate(offsets),
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], name: str) -> "PackedSequences":
+        """Restore the packed sequences stored by `to_arrays` under the given name."""
+        return cls(arrays[name], arrays[name + "_offsets"])
+
+    def to_arrays(self, name: str) -> Dict[str, np.ndarray]:
+        """Get the arrays to store the packed sequences with, e.g., in the dataset cache."""
+        return {name: self.data, name + "_offsets": self.offsets}
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        """Get the view of the i-th sequence in the flat buffer."""
+        begin, end = self.offsets[i : i + 2]
+        return self.data[begin:end]
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """The length of each sequence."""
+        return np.diff(self.offsets)
+
+    def get_text(self, i: int) -> str:
+        """Decode the i-th sequence of packed texts."""
+        return self[i].tobytes().decode("utf-8")
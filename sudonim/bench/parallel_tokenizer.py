@@ -0,0 +1,88 @@
+"""MLC LLM benchmark parallel tokenizer"""
+
+import atexit
+import concurrent.futures
+import os
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence
+
+from typing_extensions import Self
+
+if TYPE_CHECKING:
+    from transformers import AutoTokenizer  # pylint: disable=import-error
+
+# The tokenizer of each worker process, set once by the pool initializer.
+_worker_tokenizer: Optional["AutoTokenizer"] = None
+
+
+def _init_worker(tokenizer: "AutoTokenizer") -> None:
+    global _worker_tokenizer  # pylint: disable=global-statement
+    # Each worker tokenizes a shard on a single core.
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    _worker_tokenizer = tokenizer
+
+
+def _encode_shard(texts: List[str], kwargs: Dict[str, Any]) -> List[List[int]]:
+    return _worker_tokenizer(texts, **kwargs).input_ids
+
+
+def _decode_shard(token_ids: List[Sequence[int]], kwargs: Dict[str, Any]) -> List[str]:
+    return _worker_tokenizer.batch_decode(token_ids, **kwargs)
+
+
+class ParallelTokenizer:
+    """Tokenizes batches of texts over a pool of worker processes.
+
+    The texts are split into contiguous shards that are fanned out to the workers,
+    each of which holds its own copy of the tokenizer, and the results are merged
+    back in the input order. With a single worker, the tokenizer is called in-process.
+    """
+
+    def __init__(self, tokenizer: "AutoTokenizer", num_workers: int = 1, shard_size: int = 256):
+        self.tokenizer = tokenizer
+        self.num_workers = max(num_workers, 1)
+        self.shard_size = shard_size
+        self._pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Shut down the worker processes."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+            atexit.unregister(self.close)
+
+    def _map(self, func, items: Sequence[Any], kwargs: Dict[str, Any]) -> List[Any]:
+        if self._pool is None:
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                initializer=_init_worker,
+                initargs=(self.tokenizer,),
+            )
+            # Pools kept alive by the datasets are shut down before the interpreter exits.
+            atexit.register(self.close)
+        # Make sure every worker gets a shard even when there are only a few items.
+        shard_size = min(self.shard_size, max(-(-len(items) // self.num_workers), 1))
+        shards = [items[i : i + shard_size] for i in range(0, len(items), shard_size)]
+        results: List[Any] = []
+        for shard_result in self._pool.map(func, shards, [kwargs] * len(shards)):
+            results.extend(shard_result)
+        return results
+
+    def encode(self, texts: Sequence[str], **kwargs: Any) -> List[List[int]]:
+        """Tokenize the texts and return the token ids of each text.
+        The keyword arguments are forwarded to the tokenizer call.
+        """
+        if self.num_workers == 1 or len(texts) <= 1:
+            return list(self.tokenizer(list(texts), **kwargs).input_ids) if texts else []
+        return self._map(_encode_shard, list(texts), kwargs)
+
+    def decode(self, token_ids: Sequence[Sequence[int]], **kwargs: Any) -> List[str]:
+        """Decode each of the token id sequences back into text."""
+        if self.num_workers == 1 or len(token_ids) <= 1:
+            return self.tokenizer.batch_decode(token_ids, **kwargs) if len(token_ids) else []
+        return self._map(_decode_shard, list(token_ids), kwargs)
@@ -0,0 +1,212 @@
+"""MLC LLM benchmark live progress of the executor workers"""
+
+import collections
+import multiprocessing
+import queue
+import threading
+import time
+from typing import Any, Deque, List, Optional, Tuple
+
+import numpy as np
+from tqdm import tqdm
+from typing_extensions import Self
+
+from sudonim.bench.request_record import RequestRecord
+from mlc_llm.support import logging
+
+logger = logging.getLogger(__name__)
+
+# The event queue and the abort flag of the progress monitor, set in each worker process.
+_worker_queue: Optional[Any] = None
+_worker_abort_event: Optional[Any] = None
+
+ABORTED_ERROR_MSG = "The request is not sent because the benchmark is aborted."
+# The event of a request that is not sent due to abort.
+_ABORTED_EVENT = "aborted"
+
+
+def init_worker_progress(event_queue: Any, abort_event: Any) -> None:
+    """The initializer of the executor worker processes to report their progress."""
+    global _worker_queue, _worker_abort_event  # pylint: disable=global-statement
+    _worker_queue = event_queue
+    _worker_abort_event = abort_event
+
+
+def report_request_start() -> None:
+    """Report that a request is sent by the worker."""
+    if _worker_queue is not None:
+        _worker_queue.put_nowait(None)
+
+
+def report_request_finish(request_record: RequestRecord) -> None:
+    """Report that a request is finished by the worker, with its latency metrics.
+    The TPOT is only known when the server reports the number of output tokens.
+    The requests cancelled by the client on purpose are not errors.
+    """
+    if _worker_queue is None:
+        return
+    metrics = request_record.metrics
+    ttft = metrics.time_to_first_token_s
+    tpot = None
+    if ttft is not None and metrics.usage_output_tokens is not None:
+        if metrics.usage_output_tokens > 1:
+            tpot = (metrics.end_to_end_latency_s - ttft) / (metrics.usage_output_tokens - 1)
+    _worker_queue.put_nowait((metrics.success or metrics.cancelled, ttft, tpot))
+
+
+def is_aborted() -> bool:
+    """Whether the benchmark is aborted and the worker should not send more requests."""
+    return _worker_abort_event is not None and _worker_abort_event.is_set()
+
+
+def mark_aborted(request_record: RequestRecord) -> RequestRecord:
+    """Mark the request that is not sent due to abort as failed, and report it to the
+    progress monitor so that the progress matches the number of returned records.
+    """
+    request_record.metrics.success = False
+    request_record.error_msg = ABORTED_ERROR_MSG
+    if _worker_queue is not None:
+        _worker_queue.put_nowait(_ABORTED_EVENT)
+    return request_record
+
+
+class ProgressMonitor:
+    """Shows the live progress of the requests sent by the executor worker processes.
+
+    The workers push an event for every sent and finished request through a queue,
+    from which a background thread updates the progress bar (or the log when tqdm
+    is disabled) with the throughput, the number of in-flight requests and the
+    rolling TTFT/TPOT percentiles. When the error rate of the recent requests exceeds
+    `abort_error_rate`, the workers are signaled to stop sending requests.
+    """
+
+    # The number of recent requests that the rolling metrics are computed over.
+    window_size: int = 256
+    # The minimum number of recent requests to decide on aborting.
+    min_abort_samples: int = 16
+    # The interval in seconds of logging the progress when tqdm is disabled.
+    log_interval_s: float = 10.0
+
+    def __init__(
+        self,
+        num_requests: Optional[int],
+        disable_tqdm: bool,
+        abort_error_rate: Optional[float] = None,
+    ) -> None:
+        self.num_requests = num_requests
+        self.abort_error_rate = abort_error_rate
+        context = multiprocessing.get_context()
+        self.mp_context = context
+        self.queue = context.Queue()
+        self.abort_event = context.Event()
+        self.pbar = None if disable_tqdm else tqdm(total=num_requests)
+        self.num_in_flight = 0
+        self.num_finished = 0
+        self.num_errors = 0
+        self.num_aborted = 0
+        self.recent: Deque[Tuple[bool, Optional[float], Optional[float]]] = collections.deque(
+            maxlen=self.window_size
+        )
+        self._start_time = time.monotonic()
+        self._last_log_time = self._start_time
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def worker_initargs(self) -> Tuple[Any, Any]:
+        """The arguments of `init_worker_progress` for the worker processes."""
+        return (self.queue, self.abort_event)
+
+    @property
+    def aborted(self) -> bool:
+        """Whether the benchmark is aborted due to the high error rate."""
+        return self.abort_event.is_set()
+
+    def __enter__(self) -> Self:
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb) -> None:
+        # Wake the thread up to drain the remaining events and stop.
+        self.queue.put(StopIteration)
+        self._thread.join()
+        self.queue.close()
+        if self.pbar is not None:
+            self.pbar.close()
+        if self.aborted:
+            logger.error(
+                "Benchmark aborted as the error rate of the recent requests exceeded %.2f",
+                self.abort_error_rate,
+            )
+
+    def _run(self) -> None:
+        while True:
+            try:
+                event = self.queue.get(timeout=1.0)
+            except queue.Empty:
+                self._refresh()
+                continue
+            if event is StopIteration:
+                break
+            if event is None:
+                self.num_in_flight += 1
+                continue
+            if event == _ABORTED_EVENT:
+                # The request is never sent, so it is neither in flight nor finished.
+                self.num_aborted += 1
+                self.num_errors += 1
+                self.recent.append((False, None, None))
+                if self.pbar is not None:
+                    self.pbar.update(1)
+                continue
+            success, _, _ = event
+            self.num_in_flight = max(self.num_in_flight - 1, 0)
+            self.num_finished += 1
+            self.num_errors += int(not success)
+            self.recent.append(event)
+            if self.pbar is not None:
+                self.pbar.update(1)
+            self._check_abort()
+            self._refresh()
+        self._refresh(force=True)
+
+    def _check_abort(self) -> None:
+        if self.abort_error_rate is None or self.aborted:
+            return
+        if len(self.recent) < self.min_abort_samples:
+            return
+        error_rate = sum(not success for success, _, _ in self.recent) / len(self.recent)
+        if error_rate > self.abort_error_rate:
+            self.abort_event.set()
+
+    def _summary(self) -> List[str]:
+        elapsed = max(time.monotonic() - self._start_time, 1e-5)
+        summary = [
+            f"{self.num_finished / elapsed:.2f} req/s",
+            f"in-flight {self.num_in_flight}",
+            f"errors {self.num_errors}",
+        ]
+        if self.num_aborted > 0:
+            summary.append(f"aborted {self.num_aborted}")
+        ttfts = [ttft for success, ttft, _ in self.recent if success and ttft is not None]
+        tpots = [tpot for success, _, tpot in self.recent if success and tpot is not None]
+        if ttfts:
+            p50, p99 = np.percentile(ttfts, [50, 99]) * 1000
+            summary.append(f"TTFT p50/p99 {p50:.0f}/{p99:.0f}ms")
+        if tpots:
+            p50, p90 = np.percentile(tpots, [50, 90]) * 1000
+            summary.append(f"TPOT p50/p90 {p50:.1f}/{p90:.1f}ms")
+        return summary
+
+    def _refresh(self, force: bool = False) -> None:
+        if self.pbar is not None:
+            self.pbar.set_postfix_str(", ".join(self._summary()), refresh=False)
+            return
+        now = time.monotonic()
+        if force or now - self._last_log_time >= self.log_interval_s:
+            self._last_log_time = now
+            logger.info(
+                "Finished %d%s requests: %s",
+                self.num_finished + self.num_aborted,
+                f"/{self.num_requests}" if self.num_requests is not None else "",
+                ", ".join(self._summary()),
+            )
@@ -3,20 +3,34 @@
 import argparse
 import asyncio
 import concurrent.futures
-import copy
 import os
 import random
 import time
-from typing import Any, Callable, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
 
 import numpy as np
 import requests
-from tqdm import tqdm
-from transformers import AutoTokenizer  # pylint: disable=import-error
 
 from sudonim.bench.api_endpoint import APIEndPoint
+from sudonim.bench.arrival_process import ArrivalProcess, PoissonArrival, create_arrival_process
 from sudonim.bench.dataset import Dataset
-from sudonim.bench.request_record import GroupedRequestRecord, RequestRecord
+from sudonim.bench.event_loop import EventLoopLagMonitor, run_event_loop
+from sudonim.bench.parallel_tokenizer import ParallelTokenizer
+from sudonim.bench.progress import (
+    ProgressMonitor,
+    init_worker_progress,
+    is_aborted,
+    mark_aborted,
+    report_request_finish,
+    report_request_start,
+)
+from sudonim.bench.request_record import (
+    GroupedRequestRecord,
+    LazyRequestRecords,
+    RequestRecord,
+    get_decode_intervals,
+    get_token_latencies,
+)
 from mlc_llm.protocol.openai_api_protocol import (
     ChatCompletionMessage,
     ChatCompletionRequest,
@@ -24,9 +38,28 @@ from mlc_llm.protocol.openai_api_protocol import (
 )
 from mlc_llm.support import logging
 
+if TYPE_CHECKING:
+    from transformers import AutoTokenizer  # pylint: disable=import-error
+
 logger = logging.getLogger(__name__)
 
 
+def _copy_request_record(request_record: RequestRecord) -> RequestRecord:
+    """Copy the request record for a new request to send.
+    The processors and the endpoints only set the fields of the record, the chat
+    completion request and the metrics, so the three are copied shallowly while
+    the (possibly long) messages are shared with the original record.
+    """
+    return request_record.model_copy(
+        update={
+            "chat_cmpl": request_record.chat_cmpl.model_copy(),
+            "metrics": (
+                request_record.metrics.model_copy() if request_record.metrics is not None else None
+            ),
+        }
+    )
+
+
 class RequestProcessor:  # pylint: disable=too-few-public-methods
     """The request processor base class.
     Each processor can take a list of RequestRecord, applying the process,
@@ -57,6 +90,9 @@ class SampleRequests(RequestProcessor):  # pylint: disable=too-few-public-method
     def __call__(self, request_records: List[RequestRecord]) -> List[RequestRecord]:
         assert len(request_records) > 0, "Empty input request record."
 
+        if isinstance(request_records, LazyRequestRecords):
+            return self._sample_from_lazy_request_records(request_records)
+
         # We expect the input request records to be all grouped or all plain.
         if isinstance(request_records[0], GroupedRequestRecord):
             assert all(isinstance(record, GroupedRequestRecord) for record in request_records)
@@ -68,13 +104,42 @@ class SampleRequests(RequestProcessor):  # pylint: disable=too-few-public-method
     def _sample_from_plain_request_records(
         self, request_records: List[RequestRecord]
     ) -> List[RequestRecord]:
-        samples: List[RequestRecord] = []
-        while len(samples) < self.num_requests:
-            # Create a new list so that the in-place shuffle does not mutate the input list.
-            records = list(request_records)
-            random.shuffle(records)
-            samples += copy.deepcopy(records)
-        samples = samples[: self.num_requests]
+        # Sample the indices the same way as shuffling the records pass by pass,
+        # and only copy the records that are sampled.
+        indices: List[int] = []
+        while len(indices) < self.num_requests:
+            indices += random.sample(
+                range(len(request_records)),
+                min(len(request_records), self.num_requests - len(indices)),
+            )
+        samples = [_copy_request_record(request_records[i]) for i in indices]
+        for i, record in enumerate(samples):
+            record.request_id = i
+        return samples
+
+    def _sample_from_lazy_request_records(
+        self, request_records: LazyRequestRecords
+    ) -> List[RequestRecord]:
+        # Sample the indices the same way as shuffling the records pass by pass,
+        # and only build the records that are sampled.
+        indices: List[int] = []
+        if request_records.group_sizes is not None:
+            # Sample the sessions until they have enough turns, and cut the last one short.
+            num_sampled = 0
+            while num_sampled < self.num_requests:
+                for i in random.sample(range(len(request_records)), len(request_records)):
+                    indices.append(i)
+                    num_sampled += int(request_records.group_sizes[i])
+                    if num_sampled >= self.num_requests:
+                        break
+            samples = request_records.build(indices)[: self.num_requests]
+        else:
+            while len(indices) < self.num_requests:
+                indices += random.sample(
+                    range(len(request_records)),
+                    min(len(request_records), self.num_requests - len(indices)),
+                )
+            samples = request_records.build(indices)
         for i, record in enumerate(samples):
             record.request_id = i
         return samples
@@ -122,17 +187,22 @@ class AttachModelName(RequestProcessor):  # pylint: disable=too-few-public-metho
 
 
 class AttachRequestRateTimestamp(RequestProcessor):  # pylint: disable=too-few-public-methods
-    """The processor that applies timestamps to the requests."""
+    """The processor that applies timestamps to the requests.
+    The timestamps follow the given arrival process at the request rate,
+    which is the Poisson process by default.
+    """
 
-    def __init__(self, request_rate: np.float32) -> None:
+    def __init__(
+        self, request_rate: np.float32, arrival_process: Optional[ArrivalProcess] = None
+    ) -> None:
         self.request_rate = request_rate
+        self.arrival_process = arrival_process if arrival_process is not None else PoissonArrival()
 
     def __call__(self, request_records: List[RequestRecord]) -> List[RequestRecord]:
-        timestamp = 0.0
-        for request_record in request_records:
+        timestamps = self.arrival_process.generate(len(request_records), float(self.request_rate))
+        for request_record, timestamp in zip(request_records, timestamps.tolist()):
             assert request_record.timestamp is None, "The request record already has a timestamp"
             request_record.timestamp = timestamp
-            timestamp += float(np.random.exponential(1.0 / self.request_rate))
         return request_records
 
 
@@ -183,13 +253,92 @@ class AttachSamplingOptions(RequestProcessor):  # pylint: disable=too-few-public
         return request_records
 
 
+class AttachCancellation(RequestProcessor):  # pylint: disable=too-few-public-methods
+    """The processor that marks a random `fraction` of the requests to be cancelled by
+    the client after `after_tokens` output tokens or `after_s` seconds, whichever first.
+    """
+
+    def __init__(
+        self, fraction: float, after_tokens: Optional[int], after_s: Optional[float]
+    ) -> None:
+        if not 0 <= fraction <= 1:
+            raise ValueError(f"Invalid cancellation fraction {fraction}")
+        if fraction > 0 and after_tokens is None and after_s is None:
+            raise ValueError(
+                "Please specify when to cancel the requests via "
+                '"--cancel-after-tokens" or "--cancel-after-seconds".'
+            )
+        self.fraction = fraction
+        self.after_tokens = after_tokens
+        self.after_s = after_s
+
+    def __call__(self, request_records: List[RequestRecord]) -> List[RequestRecord]:
+        if self.fraction == 0:
+            return request_records
+        cancelled = np.random.random(len(request_records)) < self.fraction
+        for request_record, is_cancelled in zip(request_records, cancelled.tolist()):
+            if is_cancelled:
+                request_record.cancel_after_tokens = self.after_tokens
+                request_record.cancel_after_s = self.after_s
+        return request_records
+
+
 class MetricAnalyzer(RequestProcessor):  # pylint: disable=too-few-public-methods
-    """The processor that analyzes the raw benchmark results and computes more detailed metrics."""
+    """The processor that analyzes the raw benchmark results and computes more detailed metrics.
+    The token counts reported by the server in the usage are preferred, which are exact
+    for the server tokenizer, and the outputs without usage are tokenized on the client.
+    The texts are tokenized in batches with `parallel_tokenizer`, which is shared by all
+    the runs so that its worker processes are started only once.
+    From the arrival times of the streamed chunks, an interval between two chunks is a
+    decode stall when it is longer than `decode_stall_factor` times the median latency
+    of all the output tokens of the run (per token of the chunk).
+    """
 
-    def __init__(self, tokenizer: AutoTokenizer) -> None:
+    def __init__(
+        self,
+        tokenizer: Optional["AutoTokenizer"],
+        parallel_tokenizer: Optional[ParallelTokenizer] = None,
+        decode_stall_factor: float = 5.0,
+    ) -> None:
         self.tokenizer = tokenizer
+        self.parallel_tokenizer = parallel_tokenizer
+        if parallel_tokenizer is None and tokenizer is not None:
+            self.parallel_tokenizer = ParallelTokenizer(tokenizer)
+        self.decode_stall_factor = decode_stall_factor
+
+    def _count_tokens(self, texts: List[str]) -> List[int]:
+        """Count the tokens of each text with the tokenizer."""
+        if not texts:
+            return []
+        # The executors disable the parallelism of "tokenizers" before forking the workers.
+        # Re-enable it meanwhile, so that the batch encoding in-process uses all the cores.
+        tokenizers_parallelism = os.environ.get("TOKENIZERS_PARALLELISM")
+        os.environ["TOKENIZERS_PARALLELISM"] = "true"
+        try:
+            token_ids = self.parallel_tokenizer.encode(texts, add_special_tokens=False)
+        finally:
+            if tokenizers_parallelism is None:
+                del os.environ["TOKENIZERS_PARALLELISM"]
+            else:
+                os.environ["TOKENIZERS_PARALLELISM"] = tokenizers_parallelism
+        return [len(ids) for ids in token_ids]
 
     def __call__(self, request_records: List[RequestRecord]) -> List[RequestRecord]:
+        if self.tokenizer is not None:
+            # Tokenize the texts of all the successful requests at once,
+            # in the same order as they are visited below.
+            successful_records = [
+                request_record for request_record in request_records if request_record.metrics.success
+            ]
+            texts = [request_record.first_chunk_output_str for request_record in successful_records]
+            texts += [
+                request_record.output_str
+                for request_record in successful_records
+                if request_record.metrics.usage_output_tokens is None
+            ]
+            token_counts = self._count_tokens(texts)
+            first_chunk_token_counts = iter(token_counts[: len(successful_records)])
+            output_token_counts = iter(token_counts[len(successful_records) :])
         updated_records = []
         for request_record in request_records:
             metrics = request_record.metrics
@@ -197,14 +346,26 @@ class MetricAnalyzer(RequestProcessor):  # pylint: disable=too-few-public-method
                 assert request_record.error_msg is not None
                 continue
 
-            metrics.output_tokens = len(
-                self.tokenizer.encode(request_record.output_str, add_special_tokens=False)
-            )
-            first_chunk_output_tokens = len(
-                self.tokenizer.encode(
-                    request_record.first_chunk_output_str, add_special_tokens=False
+            if metrics.usage_input_tokens is not None:
+                metrics.input_tokens = metrics.usage_input_tokens
+            if self.tokenizer is not None:
+                first_chunk_output_tokens = next(first_chunk_token_counts)
+                metrics.output_tokens = (
+                    metrics.usage_output_tokens
+                    if metrics.usage_output_tokens is not None
+                    else next(output_token_counts)
                 )
-            )
+            else:
+                if metrics.usage_output_tokens is None:
+                    metrics.success = False
+                    request_record.error_msg = (
+                        "The server response has no token usage, "
+                        "which is required when benchmarking without a tokenizer."
+                    )
+                    continue
+                metrics.output_tokens = metrics.usage_output_tokens
+                # Without a tokenizer, the first chunk is assumed to carry one token.
+                first_chunk_output_tokens = 1 if request_record.first_chunk_output_str else 0
             if metrics.output_tokens <= first_chunk_output_tokens:
                 metrics.success = False
                 request_record.error_msg = (
@@ -221,8 +382,66 @@ class MetricAnalyzer(RequestProcessor):  # pylint: disable=too-few-public-method
                 metrics.end_to_end_latency_s - metrics.time_to_first_token_s
             ) / (metrics.output_tokens - first_chunk_output_tokens)
             updated_records.append(request_record)
+        self._analyze_decode_stalls(updated_records)
         return updated_records
 
+    def _analyze_decode_stalls(self, request_records: List[RequestRecord]) -> None:
+        """Set the longest chunk interval and the number of decode stalls of each request."""
+        token_latencies = [
+            get_token_latencies(request_record.metrics) for request_record in request_records
+        ]
+        if not any(len(latencies) > 0 for latencies in token_latencies):
+            return
+        stall_threshold_s = self.decode_stall_factor * float(
+            np.median(np.concatenate(token_latencies))
+        )
+        for request_record in request_records:
+            intervals, num_tokens = get_decode_intervals(request_record.metrics)
+            if len(intervals) == 0:
+                continue
+            request_record.metrics.max_stall_s = float(intervals.max())
+            # The chunks of several tokens are expected to take proportionally longer.
+            request_record.metrics.num_decode_stalls = int(
+                np.count_nonzero(intervals > stall_threshold_s * np.maximum(num_tokens, 1))
+            )
+
+
+# The routes of the servers to flush the prefix cache with, and the server of each.
+PREFIX_CACHE_FLUSH_ROUTES = [("/flush_cache", "SGLang"), ("/reset_prefix_cache", "vLLM")]
+
+
+def flush_prefix_cache(server_urls: List[str]) -> None:
+    """Flush the prefix cache of the servers, so that the requests start from a cold cache.
+    Each server is tried with the flush routes of the servers that support flushing.
+    """
+    for server_url in server_urls:
+        flushed = False
+        for route, server in PREFIX_CACHE_FLUSH_ROUTES:
+            try:
+                response = requests.post(server_url + route, timeout=60)
+            except requests.RequestException:
+                continue
+            if response.status_code == 200:
+                logger.info("Flushed the prefix cache of %s (%s)", server_url, server)
+                flushed = True
+        if not flushed:
+            logger.warning(
+                "Failed to flush the prefix cache of %s, "
+                "which may be warm from the earlier requests",
+                server_url,
+            )
+
+
+def get_flush_cache_urls(args: argparse.Namespace) -> Optional[List[str]]:
+    """The URLs of the servers to flush the prefix cache of before benchmarking."""
+    if not args.flush_prefix_cache:
+        return None
+    if os.environ.get("OPENAI_API_BASE"):
+        api_base = os.environ["OPENAI_API_BASE"].rstrip("/")
+        return [api_base[: -len("/v1")] if api_base.endswith("/v1") else api_base]
+    endpoints = args.endpoints if args.endpoints is not None else [(args.host, args.port)]
+    return [f"http://{host}:{port}" for host, port in endpoints]
+
 
 class WarmupAndRun(RequestProcessor):  # pylint: disable=too-few-public-methods,line-too-long
     """The processor that runs warmup first and then runs the benchmark with the given pipeline."""
@@ -231,22 +450,24 @@ class WarmupAndRun(RequestProcessor):  # pylint: disable=too-few-public-methods,
         self,
         num_warmup_requests: int,
         num_benchmark_requests: int,
-        pipeline: RequestProcessor,
+        pipeline: "Executor",
         cuda_profile_url: Optional[str],
         fake_warmup: bool = False,
+        flush_cache_urls: Optional[List[str]] = None,
     ) -> None:
         self.num_warmup_requests = num_warmup_requests
         self.num_benchmark_requests = num_benchmark_requests
         self.pipeline = pipeline
         self.cuda_profile_url = cuda_profile_url
         self.fake_warmup = fake_warmup
+        self.flush_cache_urls = flush_cache_urls
 
     def generate_fake_warmup_requests(  # pylint: disable=missing-function-docstring
         self, num_warmup_requests: int, example_request: RequestRecord
     ) -> List[RequestRecord]:
         records = []
         for _ in range(num_warmup_requests):
-            record = copy.deepcopy(example_request)
+            record = _copy_request_record(example_request)
             record.chat_cmpl = ChatCompletionRequest(
                 messages=[
                     {
@@ -271,15 +492,18 @@ class WarmupAndRun(RequestProcessor):  # pylint: disable=too-few-public-methods,
             )
         else:
             assert len(request_records) == self.num_warmup_requests + self.num_benchmark_requests
-            benchmark_requests = request_records[: -self.num_warmup_requests]
-            warmup_requests = request_records[-self.num_warmup_requests :]
-        for request_record in warmup_requests:
-            request_record.timestamp = 0 if request_record.timestamp is not None else None
-        warmup_requests = self._process_warmup_requests(warmup_requests)
-        logger.info("Warmup with %d request(s)...", self.num_warmup_requests)
-        self.pipeline(warmup_requests)
+            benchmark_requests = request_records[: self.num_benchmark_requests]
+            warmup_requests = request_records[self.num_benchmark_requests :]
+        if len(warmup_requests) > 0:
+            for request_record in warmup_requests:
+                request_record.timestamp = 0 if request_record.timestamp is not None else None
+            warmup_requests = self._process_warmup_requests(warmup_requests)
+            logger.info("Warmup with %d request(s)...", self.num_warmup_requests)
+            self.pipeline.warmup(warmup_requests)
 
         # Then run benchmark
+        if self.flush_cache_urls is not None:
+            flush_prefix_cache(self.flush_cache_urls)
         if self.cuda_profile_url is not None:
             cuda_profiler_start_url = self.cuda_profile_url + "/debug/cuda_profiler_start"
             cuda_profiler_start_response = requests.post(cuda_profiler_start_url, timeout=60)
@@ -325,25 +549,143 @@ class SequentialProcessor(RequestProcessor):  # pylint: disable=too-few-public-m
 
 
 class Executor(RequestProcessor):  # pylint: disable=too-few-public-methods
-    """The executor base class, denoting the kind of benchmark mode."""
+    """The executor base class, denoting the kind of benchmark mode.
 
-    def __init__(
+    With `num_processes` 0, the requests are sent from a single event loop in the
+    benchmark process, sharing one connection pool. With `num_processes` None, the
+    executor starts in-process and switches to `num_fallback_processes` worker
+    processes once the event loop lag shows it is saturated. A saturated warmup
+    decides the benchmark to use the processes, and a saturated benchmark is rerun
+    over the processes, since its timings are distorted by the client.
+
+    With `duration`, the benchmark (but not the warmup) is bounded to the given
+    number of seconds instead of sending every given request.
+    """
+
+    # The p99 event loop lag in seconds, beyond which the request timings are
+    # considered distorted by the benchmark client itself.
+    max_event_loop_lag_s: float = 0.01
+
+    def __init__(  # pylint: disable=too-many-arguments
         self,
         f_create_api_endpoint: Callable[[], APIEndPoint],
-        num_processes: int,
+        num_processes: Optional[int],
         disable_tqdm: bool,
+        abort_error_rate: Optional[float] = None,
+        num_fallback_processes: int = 1,
+        duration: Optional[float] = None,
     ) -> None:
         self.f_create_api_endpoint = f_create_api_endpoint
         self.disable_tqdm = disable_tqdm
-        self.num_processes = num_processes
+        self.auto_num_processes = num_processes is None
+        self.num_processes = 0 if num_processes is None else num_processes
+        self.num_fallback_processes = num_fallback_processes
+        self.abort_error_rate = abort_error_rate
+        self.duration = duration
+        self.rerun_on_event_loop_lag = True
 
     def __call__(self, request_records: List[RequestRecord]) -> List[RequestRecord]:
+        if not (self.auto_num_processes and self.rerun_on_event_loop_lag) or self.num_processes > 0:
+            return self._execute(request_records)
+        # Keep untouched copies of the requests to rerun them over worker processes,
+        # in case sending them in-process saturates the event loop.
+        rerun_records = [_copy_request_record(request_record) for request_record in request_records]
+        updated_request_records = self._execute(request_records)
+        if self.num_processes == 0:
+            return updated_request_records
+        logger.warning("Rerunning the benchmark over %d worker processes...", self.num_processes)
+        return self._execute(rerun_records)
+
+    def _execute(self, request_records: List[RequestRecord]) -> List[RequestRecord]:
+        """Send the requests and return the updated request records."""
+        raise NotImplementedError()
+
+    def shard(
+        self, index: int, num_shards: int, request_records: List[RequestRecord]
+    ) -> Optional["Executor"]:
+        """Get the executor that sends the `index`-th of `num_shards` shards of the
+        requests, e.g., on one of the distributed agents, so that the shards together
+        apply the load of this executor. Return None if the shard has nothing to send.
+        """
         raise NotImplementedError()
 
+    def warmup(self, request_records: List[RequestRecord]) -> List[RequestRecord]:
+        """Send all the warmup requests regardless of the benchmark duration."""
+        duration, self.duration = self.duration, None
+        try:
+            return self._execute(request_records)
+        finally:
+            self.duration = duration
+
+    def _run_tasks(
+        self,
+        num_requests: Optional[int],
+        f_task: Callable[..., List[RequestRecord]],
+        task_args: List[Tuple[Any, ...]],
+    ) -> List[RequestRecord]:
+        """Run the tasks over the worker processes and gather the updated request records.
+        The workers report every request to the progress monitor as it finishes.
+        When running in-process, there is a single task taking an extra lag monitor.
+        """
+        if self.num_processes == 0:
+            assert len(task_args) == 1
+            lag_monitor = EventLoopLagMonitor()
+            with ProgressMonitor(
+                num_requests, self.disable_tqdm, self.abort_error_rate
+            ) as monitor:
+                init_worker_progress(*monitor.worker_initargs)
+                try:
+                    results = f_task(*task_args[0], lag_monitor)
+                finally:
+                    init_worker_progress(None, None)
+            self._check_event_loop_lag(lag_monitor)
+            return results
+
+        with ProgressMonitor(
+            num_requests, self.disable_tqdm, self.abort_error_rate
+        ) as monitor, concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.num_processes,
+            mp_context=monitor.mp_context,
+            initializer=init_worker_progress,
+            initargs=monitor.worker_initargs,
+        ) as pool:
+            futures = [pool.submit(f_task, *args) for args in task_args]
+            results: List[RequestRecord] = []
+            for future in concurrent.futures.as_completed(futures):
+                results.extend(future.result())
+        return results
+
+    @property
+    def num_partitions(self) -> int:
+        """The number of partitions of the requests, one for each event loop."""
+        return max(self.num_processes, 1)
+
+    def _check_event_loop_lag(self, lag_monitor: EventLoopLagMonitor) -> None:
+        lag_p99 = lag_monitor.percentile(99)
+        if lag_p99 <= self.max_event_loop_lag_s:
+            return
+        if not self.auto_num_processes:
+            logger.warning(
+                "The p99 event loop lag is %.1fms, so the measured latencies may include "
+                'the client overhead. Consider using "--num-process-workers".',
+                lag_p99 * 1000,
+            )
+            return
+        self.num_processes = max(self.num_fallback_processes, 2)
+        logger.warning(
+            "The p99 event loop lag is %.1fms, so the measured latencies of this run may "
+            "include the client overhead. Switching to %d worker processes.",
+            lag_p99 * 1000,
+            self.num_processes,
+        )
+
 
 class FixedConcurrentRequestExecutor(Executor):  # pylint: disable=too-few-public-methods
     """The benchmark executor of fixing the number of concurrent requests."""
 
+    # The highest concurrency to start sending the requests in-process with.
+    max_in_process_concurrency: int = 64
+
     def __init__(  # pylint: disable=too-many-arguments
         self,
         f_create_api_endpoint: Callable[[], APIEndPoint],
@@ -351,44 +693,79 @@ class FixedConcurrentRequestExecutor(Executor):  # pylint: disable=too-few-publi
         disable_tqdm: bool,
         num_concurrent_requests: int,
         multi_round: bool,
+        abort_error_rate: Optional[float] = None,
+        duration: Optional[float] = None,
+        think_time: Optional["ThinkTime"] = None,
     ) -> None:
-        if num_processes is None:
-            # We assign each process at most 32 concurrent requests to send
-            # so that the asyncio pressure will not be too much.
-            num_processes = min((num_concurrent_requests + 31) // 32, 10)
-        super().__init__(f_create_api_endpoint, num_processes, disable_tqdm)
+        self.requested_num_processes = num_processes
+        # We assign each process at most 32 concurrent requests to send
+        # so that the asyncio pressure will not be too much.
+        num_fallback_processes = min((num_concurrent_requests + 31) // 32, 10)
+        if num_processes is None and num_concurrent_requests > self.max_in_process_concurrency:
+            num_processes = num_fallback_processes
+        super().__init__(
+            f_create_api_endpoint,
+            num_processes,
+            disable_tqdm,
+            abort_error_rate,
+            num_fallback_processes,
+            duration,
+        )
         self.num_concurrent_requests = num_concurrent_requests
         self.multi_round = multi_round
+        self.think_time = think_time if think_time is not None else ThinkTime(0.0)
 
-    def __call__(self, request_records: List[RequestRecord]) -> List[RequestRecord]:
-        partitions: List[List[RequestRecord]] = [
-            request_records[slice(i, len(request_records), self.num_processes)]
-            for i in range(self.num_processes)
-        ]
+    def shard(
+        self, index: int, num_shards: int, request_records: List[RequestRecord]
+    ) -> Optional["FixedConcurrentRequestExecutor"]:
+        num_concurrent_requests = self.num_concurrent_requests // num_shards + int(
+            index < self.num_concurrent_requests % num_shards
+        )
+        if num_concurrent_requests == 0:
+            return None
+        executor = FixedConcurrentRequestExecutor(
+            self.f_create_api_endpoint,
+            (
+                min(self.requested_num_processes, num_concurrent_requests)
+                if self.requested_num_processes
+                else self.requested_num_processes
+            ),
+            self.disable_tqdm,
+            num_concurrent_requests,
+            self.multi_round,
+            self.abort_error_rate,
+            self.duration,
+            self.think_time,
+        )
+        # The shards run at the same time on the agents, so a shard is never rerun alone.
+        executor.rerun_on_event_loop_lag = False
+        return executor
+
+    def _execute(self, request_records: List[RequestRecord]) -> List[RequestRecord]:
+        partitions = partition_request_records(request_records, self.num_partitions)
         # Package "tokenizers" reports warnings with multiprocessing.
         # We disable "TOKENIZERS_PARALLELISM" to depress the warnings.
         os.environ["TOKENIZERS_PARALLELISM"] = "false"
-
-        pbar = None if self.disable_tqdm else tqdm(total=len(request_records))
-        with concurrent.futures.ProcessPoolExecutor(max_workers=self.num_processes) as pool:
-            futures = [
-                pool.submit(
-                    FixedConcurrentRequestExecutor._process_task,
+        # With the duration, the requests are sent over and over until the deadline,
+        # so the number of requests to send is not known in advance.
+        deadline = time.time() + self.duration if self.duration is not None else None
+
+        return self._run_tasks(
+            len(request_records) if deadline is None else None,
+            FixedConcurrentRequestExecutor._process_task,
+            [
+                (
                     self.f_create_api_endpoint,
                     partition,
-                    self.num_concurrent_requests // self.num_processes
-                    + int(i < self.num_concurrent_requests % self.num_processes),
+                    self.num_concurrent_requests // self.num_partitions
+                    + int(i < self.num_concurrent_requests % self.num_partitions),
                     self.multi_round,
+                    deadline,
+                    self.think_time,
                 )
                 for i, partition in enumerate(partitions)
-            ]
-            results: List[RequestRecord] = []
-            for i, future in enumerate(concurrent.futures.as_completed(futures)):
-                results.extend(future.result())
-                if pbar is not None:
-                    pbar.update(len(partitions[i]))
-
-        return results
+            ],
+        )
 
     @staticmethod
     def _process_task(
@@ -396,9 +773,23 @@ class FixedConcurrentRequestExecutor(Executor):  # pylint: disable=too-few-publi
         request_records: List[RequestRecord],
         num_concurrent_requests: int,
         multi_round: bool,
+        deadline: Optional[float] = None,
+        think_time: Optional["ThinkTime"] = None,
+        lag_monitor: Optional[EventLoopLagMonitor] = None,
     ) -> List[RequestRecord]:
         if len(request_records) == 0:
             return []
+        if request_records[0].session_id is not None:
+            return run_event_loop(
+                FixedConcurrentRequestExecutor._run_sessions(
+                    f_create_api_endpoint,
+                    request_records,
+                    num_concurrent_requests,
+                    deadline,
+                    think_time if think_time is not None else ThinkTime(0.0),
+                ),
+                lag_monitor,
+            )
         chat_history: List[List[ChatCompletionMessage]] = [
             [] for _ in range(num_concurrent_requests)
         ]
@@ -408,27 +799,44 @@ class FixedConcurrentRequestExecutor(Executor):  # pylint: disable=too-few-publi
             request_records: List[RequestRecord],
             num_concurrent_requests: int,
             multi_round: bool,
+            deadline: Optional[float],
         ) -> List[RequestRecord]:
             api_endpoint = f_create_api_endpoint()
-            updated_request_records: List[RequestRecord] = [None for _ in request_records]
+            updated_request_records: Dict[int, RequestRecord] = {}
             async with api_endpoint:
                 num_sent_request = 0
 
                 async def _task(i: int) -> None:
                     nonlocal num_sent_request
                     while True:
-                        if num_sent_request == len(request_records):
-                            break
-                        idx = num_sent_request
-                        num_sent_request += 1
-                        request = request_records[idx]
+                        if deadline is not None:
+                            # Cycle through the requests until the deadline, sending
+                            # copies so that the requests can be sent more than once.
+                            if is_aborted() or time.time() >= deadline:
+                                break
+                            idx = num_sent_request
+                            num_sent_request += 1
+                            request = _copy_request_record(
+                                request_records[idx % len(request_records)]
+                            )
+                        else:
+                            if num_sent_request == len(request_records):
+                                break
+                            idx = num_sent_request
+                            num_sent_request += 1
+                            request = request_records[idx]
+                        if is_aborted():
+                            updated_request_records[idx] = mark_aborted(request)
+                            continue
 
                         if multi_round:
                             request.chat_cmpl.messages = (
                                 chat_history[i] + request.chat_cmpl.messages
                             )
 
+                        report_request_start()
                         updated_request_records[idx] = await api_endpoint(request)
+                        report_request_finish(updated_request_records[idx])
 
                         if multi_round:
                             chat_history[i] = updated_request_records[idx].chat_cmpl.messages + [
@@ -441,16 +849,153 @@ class FixedConcurrentRequestExecutor(Executor):  # pylint: disable=too-few-publi
                 tasks = [asyncio.create_task(_task(i)) for i in range(num_concurrent_requests)]
                 await asyncio.gather(*tasks)
 
-            return updated_request_records
+            return [updated_request_records[idx] for idx in sorted(updated_request_records)]
 
-        return asyncio.run(
+        return run_event_loop(
             process_task_impl(
                 f_create_api_endpoint,
                 request_records,
                 num_concurrent_requests,
                 multi_round,
-            )
+                deadline,
+            ),
+            lag_monitor,
+        )
+
+    @staticmethod
+    async def _run_sessions(  # pylint: disable=too-many-locals
+        f_create_api_endpoint: Callable[[], APIEndPoint],
+        request_records: List[RequestRecord],
+        num_concurrent_requests: int,
+        deadline: Optional[float],
+        think_time: "ThinkTime",
+    ) -> List[RequestRecord]:
+        """Run the sessions with `num_concurrent_requests` simulated users. Each user
+        takes the next session, sends its turns in order with the history of the session
+        and a think time before each later turn, and leaves after the last turn.
+        With the deadline, the users cycle through the sessions until the deadline.
+        """
+        sessions: Dict[int, List[int]] = {}
+        for idx, request_record in enumerate(request_records):
+            sessions.setdefault(request_record.session_id, []).append(idx)
+        session_queue = list(sessions.values())
+        updated_request_records: Dict[int, RequestRecord] = {}
+        api_endpoint = f_create_api_endpoint()
+        async with api_endpoint:
+            num_started_sessions = 0
+            num_sent_requests = 0
+
+            async def _user() -> None:
+                nonlocal num_started_sessions, num_sent_requests
+                while deadline is not None or num_started_sessions < len(session_queue):
+                    if deadline is not None and (is_aborted() or time.time() >= deadline):
+                        break
+                    cycle, session = divmod(num_started_sessions, len(session_queue))
+                    num_started_sessions += 1
+                    history: List[ChatCompletionMessage] = []
+                    history_tokens = 0
+                    for turn, idx in enumerate(session_queue[session]):
+                        if deadline is None:
+                            key, request = idx, request_records[idx]
+                        else:
+                            # Send copies under fresh session ids, so that the sessions
+                            # can be sent more than once.
+                            key, request = num_sent_requests, _copy_request_record(
+                                request_records[idx]
+                            )
+                            num_sent_requests += 1
+                            request.session_id += cycle * _SESSION_ID_CYCLE_STRIDE
+                        if is_aborted():
+                            if deadline is None:
+                                updated_request_records[key] = mark_aborted(request)
+                            continue
+                        if turn > 0:
+                            await asyncio.sleep(think_time.sample())
+                            if deadline is not None and time.time() >= deadline:
+                                break
+                        request.chat_cmpl.messages = history + request.chat_cmpl.messages
+                        # The server usage replaces the estimate of the input tokens.
+                        request.metrics.input_tokens += history_tokens
+                        report_request_start()
+                        request = await api_endpoint(request)
+                        report_request_finish(request)
+                        updated_request_records[key] = request
+                        if not request.metrics.success:
+                            # The failed or cancelled turn has no complete answer, so the
+                            # next turn continues from the history before this turn.
+                            continue
+                        history = request.chat_cmpl.messages + [
+                            ChatCompletionMessage(content=request.output_str, role="assistant")
+                        ]
+                        history_tokens = (
+                            request.metrics.usage_input_tokens
+                            if request.metrics.usage_input_tokens is not None
+                            else request.metrics.input_tokens
+                        ) + (
+                            request.metrics.usage_output_tokens
+                            if request.metrics.usage_output_tokens is not None
+                            else request.chat_cmpl.max_tokens or 0
+                        )
+
+            await asyncio.gather(*[_user() for _ in range(num_concurrent_requests)])
+        return [updated_request_records[idx] for idx in sorted(updated_request_records)]
+
+
+SUPPORTED_THINK_TIME_DISTRIBUTIONS = ["exponential", "constant"]
+
+# The offset of the session ids of every later pass over the sessions in a
+# time-bounded run, so that the session ids of all passes are distinct.
+_SESSION_ID_CYCLE_STRIDE = 1 << 32
+
+
+class ThinkTime:  # pylint: disable=too-few-public-methods
+    """The think time of the simulated users between the turns of a session, with the
+    given mean in seconds, either exponentially distributed or constant.
+    """
+
+    def __init__(self, mean_s: float, distribution: str = "exponential") -> None:
+        if mean_s < 0:
+            raise ValueError(f"Invalid think time {mean_s}")
+        if distribution not in SUPPORTED_THINK_TIME_DISTRIBUTIONS:
+            raise ValueError(f'Unrecognized think time distribution "{distribution}"')
+        self.mean_s = mean_s
+        self.distribution = distribution
+
+    def sample(self) -> float:
+        """Sample a think time in seconds."""
+        if self.distribution == "exponential" and self.mean_s > 0:
+            return random.expovariate(1.0 / self.mean_s)
+        return self.mean_s
+
+
+def partition_request_records(
+    request_records: List[RequestRecord], num_partitions: int
+) -> List[List[RequestRecord]]:
+    """Partition the requests in turn, keeping the turns of each session together."""
+    if len(request_records) == 0 or request_records[0].session_id is None:
+        return [request_records[i::num_partitions] for i in range(num_partitions)]
+    partitions: List[List[RequestRecord]] = [[] for _ in range(num_partitions)]
+    session_partitions: Dict[int, int] = {}
+    for request_record in request_records:
+        partition = session_partitions.setdefault(
+            request_record.session_id, len(session_partitions) % num_partitions
         )
+        partitions[partition].append(request_record)
+    return partitions
+
+
+def _attach_schedule_lag(request_record: RequestRecord, schedule_lag_s: float) -> None:
+    """Attach the delay of sending the request behind its scheduled time to the metrics,
+    together with the latencies measured from the scheduled time.
+    """
+    metrics = request_record.metrics
+    if metrics is None:
+        return
+    metrics.schedule_lag_s = schedule_lag_s
+    metrics.scheduled_start_time = metrics.start_time - schedule_lag_s
+    metrics.corrected_end_to_end_latency_s = metrics.end_to_end_latency_s + schedule_lag_s
+    if metrics.time_to_first_token_s is not None:
+        metrics.corrected_time_to_first_token_s = metrics.time_to_first_token_s + schedule_lag_s
 
 
 class FixTimestampExecutor(Executor):  # pylint: disable=too-few-public-methods
@@ -464,36 +1009,86 @@ class FixTimestampExecutor(Executor):  # pylint: disable=too-few-public-methods
         max_schedule_gap: float,
         num_requests: int,
         request_rate: Optional[np.float32] = None,
+        abort_error_rate: Optional[float] = None,
+        fail_on_schedule_lag: bool = False,
+        duration: Optional[float] = None,
     ) -> None:
-        if num_processes is None:
+        super().__init__(
+            f_create_api_endpoint,
+            num_processes,
+            disable_tqdm,
+            abort_error_rate,
             # We assign each process at most 32 requests to send
             # so that the asyncio pressure will not be too much.
-            num_processes = min((num_requests + 31) // 32, 10)
-        super().__init__(f_create_api_endpoint, num_processes, disable_tqdm)
+            num_fallback_processes=min((num_requests + 31) // 32, 10),
+            duration=duration,
+        )
         self.max_schedule_gap = max_schedule_gap
         self.num_requests = num_requests
         self.request_rate = request_rate
+        self.fail_on_schedule_lag = fail_on_schedule_lag
+        # The timestamp to schedule the requests from, when the requests are a shard
+        # of the requests scheduled together. Default to the earliest timestamp.
+        self.base_timestamp: Optional[float] = None
+
+    def shard(
+        self, index: int, num_shards: int, request_records: List[RequestRecord]
+    ) -> Optional["FixTimestampExecutor"]:
+        num_requests = len(request_records[index::num_shards])
+        if num_requests == 0:
+            return None
+        executor = FixTimestampExecutor(
+            self.f_create_api_endpoint,
+            None if self.auto_num_processes else self.num_processes,
+            self.disable_tqdm,
+            self.max_schedule_gap,
+            num_requests,
+            self.request_rate,
+            self.abort_error_rate,
+            self.fail_on_schedule_lag,
+            self.duration,
+        )
+        executor.base_timestamp = min(request_record.timestamp for request_record in request_records)
+        # The shards run at the same time on the agents, so a shard is never rerun alone.
+        executor.rerun_on_event_loop_lag = False
+        return executor
 
-    def __call__(self, request_records: List[RequestRecord]) -> List[RequestRecord]:
+    def _execute(self, request_records: List[RequestRecord]) -> List[RequestRecord]:
         assert len(request_records) > 0
         assert all(request_record.timestamp is not None for request_record in request_records)
         # Sort the request records in timestamp ascending order before partitioning.
         request_records.sort(key=lambda request_record: request_record.timestamp)
-        base_timestamp = request_records[0].timestamp
+        base_timestamp = (
+            self.base_timestamp if self.base_timestamp is not None else request_records[0].timestamp
+        )
+        if self.duration is not None:
+            if request_records[-1].timestamp - base_timestamp < self.duration:
+                logger.warning(
+                    "The %d requests are scheduled within %.1fs, shorter than the duration "
+                    "%.1fs. Please sample more requests.",
+                    len(request_records),
+                    request_records[-1].timestamp - base_timestamp,
+                    self.duration,
+                )
+            request_records = [
+                request_record
+                for request_record in request_records
+                if request_record.timestamp - base_timestamp < self.duration
+            ]
         partitions: List[List[RequestRecord]] = [
-            request_records[slice(i, len(request_records), self.num_processes)]
-            for i in range(self.num_processes)
+            request_records[slice(i, len(request_records), self.num_partitions)]
+            for i in range(self.num_partitions)
         ]
         base_sys_time = time.time()
         # Package "tokenizers" reports warnings with multiprocessing.
         # We disable "TOKENIZERS_PARALLELISM" to depress the warnings.
         os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
-        pbar = None if self.disable_tqdm else tqdm(total=len(request_records))
-        with concurrent.futures.ProcessPoolExecutor(max_workers=self.num_processes) as pool:
-            futures = [
-                pool.submit(
-                    FixTimestampExecutor._process_task,
+        request_records = self._run_tasks(
+            len(request_records),
+            FixTimestampExecutor._process_task,
+            [
+                (
                     self.f_create_api_endpoint,
                     partition,
                     base_timestamp,
@@ -501,14 +1096,34 @@ class FixTimestampExecutor(Executor):  # pylint: disable=too-few-public-methods
                     self.max_schedule_gap,
                 )
                 for partition in partitions
-            ]
-            results: List[RequestRecord] = []
-            for i, future in enumerate(concurrent.futures.as_completed(futures)):
-                results.extend(future.result())
-                if pbar is not None:
-                    pbar.update(len(partitions[i]))
+            ],
+        )
+        self._check_schedule_lag(request_records)
+        return request_records
 
-        return results
+    def _check_schedule_lag(self, request_records: List[RequestRecord]) -> None:
+        """Warn (or fail) when requests are sent behind their schedule by more than
+        the max schedule gap, i.e., the client cannot keep up with the request rate.
+        """
+        schedule_lags = [
+            request_record.metrics.schedule_lag_s
+            for request_record in request_records
+            if request_record.metrics is not None
+            and request_record.metrics.schedule_lag_s is not None
+        ]
+        num_late_requests = sum(lag > self.max_schedule_gap for lag in schedule_lags)
+        if num_late_requests == 0:
+            return
+        message = (
+            f"{num_late_requests} of {len(schedule_lags)} requests were sent more than "
+            f"{self.max_schedule_gap}s behind their scheduled time "
+            f"(max lag {max(schedule_lags):.3f}s). The latencies from the actual send time "
+            "underestimate the ones the schedule implies, see the latencies from the "
+            "scheduled time instead."
+        )
+        if self.fail_on_schedule_lag:
+            raise RuntimeError(message)
+        logger.warning(message)
 
     @staticmethod
     def _process_task(
@@ -517,6 +1132,7 @@ class FixTimestampExecutor(Executor):  # pylint: disable=too-few-public-methods
         base_timestamp: float,
         base_sys_time: float,
         max_schedule_gap: float,
+        lag_monitor: Optional[EventLoopLagMonitor] = None,
     ) -> List[RequestRecord]:
         if len(request_records) == 0:
             return []
@@ -536,8 +1152,16 @@ class FixTimestampExecutor(Executor):  # pylint: disable=too-few-public-methods
             updated_request_records: List[RequestRecord] = []
             async with api_endpoint:
 
-                async def _task(request_record: RequestRecord) -> None:
-                    updated_request_records.append(await api_endpoint(request_record))
+                async def _task(request_record: RequestRecord, launch_time: float) -> None:
+                    if is_aborted():
+                        updated_request_records.append(mark_aborted(request_record))
+                        return
+                    schedule_lag_s = max(loop.time() - launch_time, 0.0)
+                    report_request_start()
+                    request_record = await api_endpoint(request_record)
+                    _attach_schedule_lag(request_record, schedule_lag_s)
+                    updated_request_records.append(request_record)
+                    report_request_finish(request_record)
 
                 tasks = []
                 for request_record in request_records:
@@ -548,8 +1172,11 @@ class FixTimestampExecutor(Executor):  # pylint: disable=too-few-public-methods
                     )
                     loop.call_at(
                         launch_time,
-                        lambda record: tasks.append(asyncio.create_task(_task(record))),
+                        lambda record, launch_time: tasks.append(
+                            asyncio.create_task(_task(record, launch_time))
+                        ),
                         request_record,
+                        launch_time,
                     )
                     # Sleep to allow runs of other scheduled tasks if any.
                     await asyncio.sleep(max(launch_time - loop.time() - max_schedule_gap, 0))
@@ -563,98 +1190,202 @@ class FixTimestampExecutor(Executor):  # pylint: disable=too-few-public-methods
             assert len(updated_request_records) == len(request_records)
             return updated_request_records
 
-        return asyncio.run(
+        return run_event_loop(
             process_task_impl(
                 f_create_api_endpoint,
                 request_records,
                 base_timestamp,
                 base_sys_time,
                 max_schedule_gap,
-            )
+            ),
+            lag_monitor,
         )
 
 
+def _create_replay_pipeline(
+    args: argparse.Namespace, f_create_api_endpoint: Callable[[], APIEndPoint], dataset: Dataset
+) -> RequestProcessor:
+    """Create the pipeline that sends the requests at their recorded timestamps."""
+    if args.num_concurrent_requests is not None or args.request_rate is not None:
+        raise ValueError(
+            f'Dataset "{args.dataset}" replays the recorded request timestamps. '
+            'Please do not specify "num_concurrent_requests" or "request_rate".'
+        )
+    if args.per_gpu_workload:
+        raise ValueError(f'Dataset "{args.dataset}" does not support "per_gpu_workload".')
+    cuda_profile_url = f"http://{args.host}:{args.port}" if args.cuda_profile else None
+    # The requests are sent at their recorded timestamps in the log order, so they
+    # are not sampled, and only fake warmup requests are sent.
+    return SequentialProcessor(
+        LogMessage(f"Replaying request log with time scale {args.replay_time_scale}"),
+        AttachModelName(args.model_name if args.model_name else args.tokenizer),
+        AttachStreamFlag(args.stream),
+        AttachSamplingOptions(args.temperature, args.top_p, args.ignore_eos),
+        AttachCancellation(
+            args.cancel_fraction, args.cancel_after_tokens, args.cancel_after_seconds
+        ),
+        AttachExecutionFeature({"replay_time_scale": args.replay_time_scale}),
+        WarmupAndRun(
+            num_warmup_requests=args.num_warmup_requests or 0,
+            num_benchmark_requests=args.num_requests,
+            pipeline=FixTimestampExecutor(
+                f_create_api_endpoint,
+                args.num_process_workers,
+                args.disable_tqdm,
+                args.max_schedule_gap,
+                args.num_requests,
+                abort_error_rate=args.abort_error_rate,
+                fail_on_schedule_lag=args.fail_on_schedule_lag,
+                duration=args.duration,
+            ),
+            cuda_profile_url=cuda_profile_url,
+            fake_warmup=dataset.require_fake_warmup,
+            flush_cache_urls=get_flush_cache_urls(args),
+        ),
+    )
+
+
+def create_fixed_concurrency_pipeline(
+    args: argparse.Namespace,
+    f_create_api_endpoint: Callable[[], APIEndPoint],
+    dataset: Dataset,
+    num_concurrent_requests: int,
+) -> RequestProcessor:
+    """Create the pipeline that benchmarks the given number of concurrent requests."""
+    cuda_profile_url = f"http://{args.host}:{args.port}" if args.cuda_profile else None
+    num_warmup_requests = (
+        args.num_warmup_requests
+        if args.num_warmup_requests is not None
+        else num_concurrent_requests
+    )
+    return SequentialProcessor(
+        LogMessage(f"Fixing number of concurrent requests: {num_concurrent_requests}"),
+        SampleRequests(args.num_requests + num_warmup_requests),
+        AttachModelName(args.model_name if args.model_name else args.tokenizer),
+        AttachStreamFlag(args.stream),
+        AttachSamplingOptions(args.temperature, args.top_p, args.ignore_eos),
+        AttachCancellation(
+            args.cancel_fraction, args.cancel_after_tokens, args.cancel_after_seconds
+        ),
+        AttachExecutionFeature({"num_concurrent_requests": num_concurrent_requests}),
+        WarmupAndRun(
+            num_warmup_requests=num_warmup_requests,
+            num_benchmark_requests=args.num_requests,
+            pipeline=FixedConcurrentRequestExecutor(
+                f_create_api_endpoint,
+                args.num_process_workers,
+                args.disable_tqdm,
+                num_concurrent_requests,
+                args.multi_round,
+                args.abort_error_rate,
+                args.duration,
+                ThinkTime(args.session_think_time, args.session_think_time_dist),
+            ),
+            cuda_profile_url=cuda_profile_url,
+            fake_warmup=dataset.require_fake_warmup,
+            flush_cache_urls=get_flush_cache_urls(args),
+        ),
+    )
+
+
+def create_fixed_request_rate_pipeline(
+    args: argparse.Namespace,
+    f_create_api_endpoint: Callable[[], APIEndPoint],
+    dataset: Dataset,
+    request_rate: np.float32,
+) -> RequestProcessor:
+    """Create the pipeline that benchmarks the given request rate."""
+    if dataset.has_sessions:
+        raise ValueError(
+            "The user sessions are sent by a fixed number of concurrent users. "
+            'Please specify the number of users via "--num-concurrent-requests".'
+        )
+    if args.num_warmup_requests is None:
+        raise ValueError(
+            "Please specify the number of warmup requests via "
+            '"--num-warmup-requests" when fixing request rate.'
+        )
+    cuda_profile_url = f"http://{args.host}:{args.port}" if args.cuda_profile else None
+    num_total_requests = int(
+        args.num_requests if not args.per_gpu_workload else args.num_requests * args.num_gpus
+    )
+    if args.duration is not None:
+        # Sample enough requests to keep sending throughout the duration,
+        # with a margin for the randomness of the arrivals.
+        num_total_requests = max(
+            num_total_requests,
+            int(
+                np.ceil(
+                    request_rate
+                    * (args.num_gpus if args.per_gpu_workload else 1)
+                    * args.duration
+                    * 1.5
+                )
+            ),
+        )
+    if dataset.require_fake_warmup:
+        num_samples = num_total_requests
+    else:
+        num_samples = num_total_requests + args.num_warmup_requests
+    exec_feature: Dict[str, Any] = {"request_rate": float(request_rate)}
+    if args.arrival_process != "poisson":
+        exec_feature["arrival_process"] = args.arrival_process
+    return SequentialProcessor(
+        LogMessage(f"Fixing request rate: {request_rate}"),
+        SampleRequests(num_samples),
+        AttachModelName(args.model_name if args.model_name else args.tokenizer),
+        AttachRequestRateTimestamp(
+            request_rate if not args.per_gpu_workload else request_rate * args.num_gpus,
+            create_arrival_process(args.arrival_process),
+        ),
+        AttachStreamFlag(args.stream),
+        AttachSamplingOptions(args.temperature, args.top_p, args.ignore_eos),
+        AttachCancellation(
+            args.cancel_fraction, args.cancel_after_tokens, args.cancel_after_seconds
+        ),
+        AttachExecutionFeature(exec_feature),
+        WarmupAndRun(
+            num_warmup_requests=args.num_warmup_requests,
+            num_benchmark_requests=num_total_requests,
+            pipeline=FixTimestampExecutor(
+                f_create_api_endpoint,
+                args.num_process_workers,
+                args.disable_tqdm,
+                args.max_schedule_gap,
+                args.num_requests,
+                request_rate,
+                args.abort_error_rate,
+                args.fail_on_schedule_lag,
+                args.duration,
+            ),
+            cuda_profile_url=cuda_profile_url,
+            fake_warmup=dataset.require_fake_warmup,
+            flush_cache_urls=get_flush_cache_urls(args),
+        ),
+    )
+
+
 def create_pipelines(
     args: argparse.Namespace, f_create_api_endpoint: Callable[[], APIEndPoint], dataset: Dataset
 ) -> List[RequestProcessor]:
     """Creating request processing pipelines with regard to the specified args."""
-    cuda_profile_url = f"http://{args.host}:{args.port}" if args.cuda_profile else None
-    pipelines: List[RequestProcessor] = []
+    if dataset.has_timestamps:
+        return [_create_replay_pipeline(args, f_create_api_endpoint, dataset)]
     if args.num_concurrent_requests is not None:
         if args.request_rate is not None:
             raise ValueError(
                 'Both "num_concurrent_requests" and "request_rate" are specified. '
                 "Please specify only one of them."
             )
-        for num_concurrent_requests in args.num_concurrent_requests:
-            num_warmup_requests = (
-                args.num_warmup_requests
-                if args.num_warmup_requests is not None
-                else num_concurrent_requests
-            )
-            pipelines.append(
-                SequentialProcessor(
-                    LogMessage(f"Fixing number of concurrent requests: {num_concurrent_requests}"),
-                    SampleRequests(args.num_requests + num_warmup_requests),
-                    AttachModelName(args.model_name if args.model_name else args.tokenizer),
-                    AttachStreamFlag(args.stream),
-                    AttachSamplingOptions(args.temperature, args.top_p, args.ignore_eos),
-                    AttachExecutionFeature({"num_concurrent_requests": num_concurrent_requests}),
-                    WarmupAndRun(
-                        num_warmup_requests=num_warmup_requests,
-                        num_benchmark_requests=args.num_requests,
-                        pipeline=FixedConcurrentRequestExecutor(
-                            f_create_api_endpoint,
-                            args.num_process_workers,
-                            args.disable_tqdm,
-                            num_concurrent_requests,
-                            args.multi_round,
-                        ),
-                        cuda_profile_url=cuda_profile_url,
-                        fake_warmup=dataset.require_fake_warmup,
-                    ),
-                )
+        return [
+            create_fixed_concurrency_pipeline(
+                args, f_create_api_endpoint, dataset, num_concurrent_requests
             )
-        return pipelines
+            for num_concurrent_requests in args.num_concurrent_requests
+        ]
     if args.request_rate is not None:
-        if args.num_warmup_requests is None:
-            raise ValueError(
-                "Please specify the number of warmup requests via "
-                '"--num-warmup-requests" when fixing request rate.'
-            )
-        num_total_requests = int(
-            args.num_requests if not args.per_gpu_workload else args.num_requests * args.num_gpus
-        )
-        if dataset.require_fake_warmup:
-            num_samples = num_total_requests
-        else:
-            num_samples = num_total_requests + args.num_warmup_requests
         return [
-            SequentialProcessor(
-                LogMessage(f"Fixing request rate: {request_rate}"),
-                SampleRequests(num_samples),
-                AttachModelName(args.model_name if args.model_name else args.tokenizer),
-                AttachRequestRateTimestamp(
-                    request_rate if not args.per_gpu_workload else request_rate * args.num_gpus
-                ),
-                AttachStreamFlag(args.stream),
-                AttachSamplingOptions(args.temperature, args.top_p, args.ignore_eos),
-                AttachExecutionFeature({"request_rate": float(request_rate)}),
-                WarmupAndRun(
-                    num_warmup_requests=args.num_warmup_requests,
-                    num_benchmark_requests=num_total_requests,
-                    pipeline=FixTimestampExecutor(
-                        f_create_api_endpoint,
-                        args.num_process_workers,
-                        args.disable_tqdm,
-                        args.max_schedule_gap,
-                        args.num_requests,
-                        request_rate,
-                    ),
-                    cuda_profile_url=cuda_profile_url,
-                    fake_warmup=dataset.require_fake_warmup,
-                ),
-            )
+            create_fixed_request_rate_pipeline(args, f_create_api_endpoint, dataset, request_rate)
             for request_rate in args.request_rate
         ]
     raise ValueError(
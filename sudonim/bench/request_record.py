@@ -1,9 +1,11 @@
 """MLC LLM Bench Request"""
 
-from typing import Any, Dict, List, Optional, Tuple, Union
+import base64
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
+import numpy as np
 import pandas as pd  # pylint: disable=import-error
-from pydantic import BaseModel
+from pydantic import BaseModel, field_serializer
 
 from mlc_llm.protocol.openai_api_protocol import ChatCompletionRequest
 from mlc_llm.support import logging
@@ -38,9 +40,36 @@ class Metrics(BaseModel):
     time_per_output_token_s: Optional[float] = None
     time_to_first_token_s: Optional[float] = None
     server_metrics: Optional[ServerMetrics] = None
+    # The token counts reported in the "usage" field of the server response.
+    usage_input_tokens: Optional[int] = None
+    usage_output_tokens: Optional[int] = None
+    # For requests sent at fixed timestamps, the delay of the actual send time
+    # ("start_time") behind the scheduled send time ("scheduled_start_time"), and
+    # the latencies measured from the scheduled send time, which are free from
+    # coordinated omission when the client falls behind the schedule.
+    scheduled_start_time: Optional[float] = None
+    schedule_lag_s: Optional[float] = None
+    corrected_time_to_first_token_s: Optional[float] = None
+    corrected_end_to_end_latency_s: Optional[float] = None
+    # The arrival times of the streamed output chunks, as the float32 intervals in
+    # seconds from the previous chunk (from the request start for the first chunk),
+    # and the int32 number of tokens of each chunk when the server reports it.
+    # They are kept as raw bytes for compactness, and dumped in base64.
+    chunk_intervals: Optional[bytes] = None
+    chunk_num_tokens: Optional[bytes] = None
+    # The longest interval between the output chunks after the first one, and the
+    # number of the intervals that are stalls of the decoding.
+    max_stall_s: Optional[float] = None
+    num_decode_stalls: Optional[int] = None
+    # Whether the request is cancelled by the client before the response finishes.
+    cancelled: bool = False
 
     exec_feature: Optional[Dict[str, Any]] = None
 
+    @field_serializer("chunk_intervals", "chunk_num_tokens")
+    def _serialize_chunk_arrays(self, value: Optional[bytes]) -> Optional[str]:
+        return base64.b64encode(value).decode("ascii") if value is not None else None
+
 
 class RequestRecord(BaseModel):
     """The request records collected from LLM inference requests."""
@@ -52,6 +81,63 @@ class RequestRecord(BaseModel):
     timestamp: Optional[float] = None
     metrics: Optional[Metrics] = None
     error_msg: Optional[str] = None
+    # The "host:port" of the endpoint the request is sent to, with multiple endpoints.
+    endpoint: Optional[str] = None
+    # For the shared-prefix dataset, the number of other prefixes used since the prefix
+    # of the request was last used, or -1 when the prefix is not used before.
+    prefix_reuse_distance: Optional[int] = None
+    # For the requests of simulated user sessions, the session of the request and
+    # the 0-based turn of the request in the session.
+    session_id: Optional[int] = None
+    turn_id: Optional[int] = None
+    # For simulating the clients that abandon the requests, the number of output tokens
+    # or the seconds after which the request is cancelled.
+    cancel_after_tokens: Optional[int] = None
+    cancel_after_s: Optional[float] = None
+
+
+def pack_chunk_arrivals(
+    start_time: float, arrival_times: List[float], num_tokens: Optional[List[int]]
+) -> Tuple[Optional[bytes], Optional[bytes]]:
+    """Pack the arrival times of the output chunks of a request that starts at
+    `start_time`, and the number of tokens of each chunk, into the compact arrays
+    of `Metrics.chunk_intervals` and `Metrics.chunk_num_tokens`.
+    """
+    if not arrival_times:
+        return None, None
+    intervals = np.diff(np.array([start_time] + arrival_times, dtype=np.float64))
+    return (
+        intervals.astype(np.float32).tobytes(),
+        np.array(num_tokens, dtype=np.int32).tobytes() if num_tokens is not None else None,
+    )
+
+
+def get_decode_intervals(metrics: Metrics) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the intervals in seconds between the consecutive output chunks of a request
+    after the first chunk, and the number of tokens of each of these chunks.
+    Each chunk is assumed to carry one token when the server does not report it.
+    """
+    if metrics.chunk_intervals is None:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int32)
+    intervals = np.frombuffer(metrics.chunk_intervals, dtype=np.float32)[1:]
+    if metrics.chunk_num_tokens is None:
+        return intervals, np.ones(len(intervals), dtype=np.int32)
+    return intervals, np.frombuffer(metrics.chunk_num_tokens, dtype=np.int32)[1:]
+
+
+def get_token_latencies(metrics: Metrics) -> np.ndarray:
+    """Get the latencies in seconds between the consecutive output tokens of a request.
+    The interval before a chunk of several tokens is split evenly over its tokens,
+    and the intervals before the chunks without tokens are carried to the next chunk.
+    """
+    intervals, num_tokens = get_decode_intervals(metrics)
+    if len(intervals) == 0:
+        return intervals
+    elapsed = np.cumsum(intervals, dtype=np.float64)
+    has_tokens = num_tokens > 0
+    elapsed, num_tokens = elapsed[has_tokens], num_tokens[has_tokens]
+    intervals = np.diff(np.concatenate([np.zeros(1), elapsed]))
+    return np.repeat(intervals / np.maximum(num_tokens, 1), num_tokens)
 
 
 class GroupedRequestRecord(RequestRecord):
@@ -64,23 +150,123 @@ class GroupedRequestRecord(RequestRecord):
     records: List[RequestRecord]
 
 
+class LazyRequestRecords:
+    """The request records of a dataset that are only built when they are sampled.
+    Datasets return this in place of a list of records, so that the setup cost and
+    memory scale with the number of requests that are actually sent rather than
+    with the size of the dataset. Each built record is a new object, so an index
+    can be built more than once.
+
+    For the datasets of sessions, each index is a session that builds `group_sizes[i]`
+    records of its turns in order.
+    """
+
+    def __init__(
+        self,
+        num_records: int,
+        f_build: Callable[[Sequence[int]], List[RequestRecord]],
+        group_sizes: Optional[np.ndarray] = None,
+    ) -> None:
+        self.num_records = num_records
+        self.f_build = f_build
+        self.group_sizes = group_sizes
+
+    def __len__(self) -> int:
+        return self.num_records
+
+    def build(self, indices: Sequence[int]) -> List[RequestRecord]:
+        """Build the request records of the given indices, in the given order."""
+        return self.f_build(indices)
+
+
+def get_steady_state_window(
+    request_records: List[RequestRecord],
+    trim_start: float = 0.0,
+    trim_end: float = 0.0,
+    target_in_flight: Optional[int] = None,
+) -> Tuple[float, float]:
+    """Get the steady-state window (begin, end) of the benchmark in the time of the
+    request metrics, which leaves out the ramp-up and the drain of the load.
+
+    The window begins `trim_start` seconds after the first request is sent and ends
+    `trim_end` seconds before the last request finishes. With `target_in_flight`,
+    the window is further narrowed to between the first time the number of in-flight
+    requests reaches the target and the last time it drops below the target.
+    """
+    # The requests that are never sent (e.g., when the benchmark is aborted)
+    # keep the zero times from the dataset.
+    request_metrics = [
+        record.metrics
+        for record in request_records
+        if record.metrics is not None and record.metrics.finish_time > 0
+    ]
+    if not request_metrics:
+        raise ValueError("No request is sent to get the steady-state window from.")
+    begin = min(metrics.start_time for metrics in request_metrics) + trim_start
+    end = max(metrics.finish_time for metrics in request_metrics) - trim_end
+    if target_in_flight is not None:
+        # Sort the finish events before the start events at the same time.
+        events = sorted(
+            [(metrics.start_time, 1) for metrics in request_metrics]
+            + [(metrics.finish_time, -1) for metrics in request_metrics]
+        )
+        in_flight = np.cumsum([delta for _, delta in events])
+        at_target = np.nonzero(in_flight >= target_in_flight)[0]
+        if len(at_target) == 0:
+            raise ValueError(
+                f"The number of in-flight requests never reaches the target {target_in_flight}."
+            )
+        begin = max(begin, events[at_target[0]][0])
+        end = min(end, events[at_target[-1] + 1][0])
+    if end <= begin:
+        raise ValueError(
+            "The steady-state window is empty. Please trim less or benchmark for longer."
+        )
+    return begin, end
+
+
+def select_requests_in_window(
+    request_records: List[RequestRecord], window: Tuple[float, float]
+) -> List[RequestRecord]:
+    """Select the requests that are sent within the window."""
+    begin, end = window
+    return [
+        record
+        for record in request_records
+        if record.metrics is not None
+        and record.metrics.finish_time > 0
+        and begin <= record.metrics.start_time < end
+    ]
+
+
 def generate_metrics_summary(
     request_records: List[RequestRecord],
     num_total_requests: int,
     num_gpus: int,
+    window: Optional[Tuple[float, float]] = None,
+    cancelled_records: Optional[List[RequestRecord]] = None,
+    cancel_window_s: float = 1.0,
 ) -> Dict[str, Any]:
     """Computes summary statistics across all metrics collected.
     Return a dictionary as the report.
+    When the steady-state window is given, the requests are expected to be the ones
+    sent within the window, and the throughput is computed over the window.
+    The requests cancelled by the client are reported separately, together with the
+    token rate of the other requests in the `cancel_window_s` seconds around the
+    cancellations.
     """
     num_completed_requests = len(request_records)
     assert num_completed_requests <= num_total_requests
     request_metrics = [record.metrics for record in request_records]
-    duration = (
-        max(metrics.finish_time for metrics in request_metrics)
-        - min(metrics.start_time for metrics in request_metrics)
-        if num_completed_requests > 0
-        else 1e-5
-    )
+    if window is not None:
+        duration = window[1] - window[0]
+    else:
+        duration = (
+            max(metrics.finish_time for metrics in request_metrics)
+            - min(metrics.start_time for metrics in request_metrics)
+            if num_completed_requests > 0
+            else 1e-5
+        )
 
     report = _compute_metrics_statistics(request_metrics)
     report["num_gpus"] = num_gpus
@@ -98,12 +284,46 @@ def generate_metrics_summary(
     report["output_token_throughput"] = total_output_tokens / duration
     report["output_token_throughput_per_gpu"] = report["output_token_throughput"] / num_gpus
 
+    # Generate the inter-token latency statistics over all the output tokens,
+    # when the arrival times of the streamed chunks are recorded.
+    token_latencies = [get_token_latencies(metric) for metric in request_metrics]
+    token_latencies = np.concatenate(token_latencies) if token_latencies else np.zeros(0)
+    if len(token_latencies) > 0:
+        report["token_inter_token_latency_s"] = _compute_series_statistics(
+            pd.Series(token_latencies, dtype=np.float64)
+        )
+        report["num_decode_stalls"] = sum(
+            metric.num_decode_stalls or 0 for metric in request_metrics
+        )
+        report["num_stalled_requests"] = sum(
+            bool(metric.num_decode_stalls) for metric in request_metrics
+        )
+
     # Generate the server metrics statistics
     server_metrics = [metric.server_metrics for metric in request_metrics if metric.server_metrics]
     server_report = _compute_metrics_statistics(server_metrics)
     if server_report is not None and len(server_report) > 0:
         report["server_metrics"] = server_report
 
+    # Generate the per-endpoint statistics, when the requests are sent to multiple endpoints.
+    if any(record.endpoint is not None for record in request_records):
+        report["endpoints"] = _compute_endpoint_statistics(request_records, duration)
+
+    # Generate the statistics of the requests cancelled by the client.
+    if cancelled_records:
+        report["num_cancelled_requests"] = len(cancelled_records)
+        report["cancelled"] = _compute_cancellation_statistics(
+            request_records, cancelled_records, cancel_window_s
+        )
+
+    # Generate the TTFT statistics of the prefix cache hits and misses.
+    if any(record.prefix_reuse_distance is not None for record in request_records):
+        report["prefix_cache"] = _compute_prefix_cache_statistics(request_records)
+
+    # Generate the statistics of the user sessions by turn, for the context growth.
+    if any(record.session_id is not None for record in request_records):
+        report["sessions"] = _compute_session_statistics(request_records)
+
     report = {
         "exec_feature": (
             request_records[0].metrics.exec_feature if num_completed_requests > 0 else None
@@ -113,6 +333,193 @@ def generate_metrics_summary(
     return report
 
 
+def _compute_endpoint_statistics(
+    request_records: List[RequestRecord], duration: float
+) -> Dict[str, Dict[str, Any]]:
+    """Compute the throughput and the latency statistics of each endpoint.
+    The throughput is over the duration of the whole benchmark, so that the throughput
+    of all endpoints adds up to the aggregate throughput.
+    """
+    records_by_endpoint: Dict[str, List[RequestRecord]] = {}
+    for record in request_records:
+        records_by_endpoint.setdefault(record.endpoint, []).append(record)
+    endpoint_reports = {}
+    for endpoint, records in sorted(records_by_endpoint.items()):
+        request_metrics = [record.metrics for record in records]
+        stats = _compute_metrics_statistics(request_metrics)
+        endpoint_report: Dict[str, Any] = {
+            "num_completed_requests": len(records),
+            "request_throughput": len(records) / duration,
+            "input_token_throughput": sum(m.input_tokens for m in request_metrics) / duration,
+            "output_token_throughput": sum(m.output_tokens for m in request_metrics) / duration,
+        }
+        for key in ["time_to_first_token_s", "time_per_output_token_s", "end_to_end_latency_s"]:
+            if key in stats:
+                endpoint_report[key] = {
+                    "mean": stats[key]["mean"],
+                    "p50": stats[key]["quantiles"]["p50"],
+                    "p99": stats[key]["quantiles"]["p99"],
+                }
+        endpoint_reports[endpoint] = endpoint_report
+    return endpoint_reports
+
+
+def _get_chunk_arrival_times(metrics: Metrics) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the arrival times of the output chunks of a request, in the time of the
+    request metrics, and the number of tokens of each chunk.
+    """
+    if metrics.chunk_intervals is None:
+        return np.zeros(0), np.zeros(0, dtype=np.int32)
+    intervals = np.frombuffer(metrics.chunk_intervals, dtype=np.float32)
+    arrival_times = metrics.start_time + np.cumsum(intervals, dtype=np.float64)
+    if metrics.chunk_num_tokens is None:
+        return arrival_times, np.ones(len(arrival_times), dtype=np.int32)
+    return arrival_times, np.frombuffer(metrics.chunk_num_tokens, dtype=np.int32)
+
+
+def _compute_cancellation_statistics(
+    request_records: List[RequestRecord],
+    cancelled_records: List[RequestRecord],
+    window_s: float = 1.0,
+) -> Dict[str, Any]:
+    """Compute the statistics of the cancelled requests, and the token rate per request
+    of the surviving requests in the `window_s` seconds before and after each
+    cancellation. The surviving requests speed up after the cancellations when the
+    server stops decoding the cancelled requests promptly.
+    """
+    cancelled_metrics = [record.metrics for record in cancelled_records]
+    cancelled_report: Dict[str, Any] = {
+        "time_to_cancel_s": _compute_series_statistics(
+            pd.Series([metrics.end_to_end_latency_s for metrics in cancelled_metrics])
+        ),
+        "output_chunks_mean": float(
+            np.mean([len(_get_chunk_arrival_times(metrics)[0]) for metrics in cancelled_metrics])
+        ),
+    }
+
+    # Only the requests that are decoding throughout both windows are counted.
+    survivors = [
+        _get_chunk_arrival_times(record.metrics)
+        for record in request_records
+        if record.metrics.chunk_intervals is not None and len(record.metrics.chunk_intervals) > 0
+    ]
+    num_tokens_before = num_tokens_after = 0
+    num_windows = 0
+    if survivors:
+        # Sort the survivors by their first arrival time, so that the survivors decoding
+        # since before a window are a prefix of them.
+        survivors.sort(key=lambda survivor: survivor[0][0])
+        first_times = np.array([arrival_times[0] for arrival_times, _ in survivors])
+        last_times = np.array([arrival_times[-1] for arrival_times, _ in survivors])
+        # Lay the arrival times of the survivors one after another on a single axis, with
+        # the i-th survivor shifted by i * span, so that the windows of all the survivors
+        # are looked up with one search.
+        base_time = first_times[0]
+        span = last_times.max() - base_time + 1.0
+        arrival_times = np.concatenate(
+            [times - base_time + i * span for i, (times, _) in enumerate(survivors)]
+        )
+        cumulative_tokens = np.concatenate(
+            [np.zeros(1), np.cumsum(np.concatenate([num_tokens for _, num_tokens in survivors]))]
+        )
+        for cancel_time in (metrics.finish_time for metrics in cancelled_metrics):
+            window_begin, window_end = cancel_time - window_s, cancel_time + window_s
+            num_started = np.searchsorted(first_times, window_begin, "right")
+            (indices,) = np.nonzero(last_times[:num_started] >= window_end)
+            if len(indices) == 0:
+                continue
+            shifts = indices * span - base_time
+            begin, middle, end = (
+                np.searchsorted(arrival_times, shifts + time, "right")
+                for time in (window_begin, cancel_time, window_end)
+            )
+            num_tokens_before += np.sum(cumulative_tokens[middle] - cumulative_tokens[begin])
+            num_tokens_after += np.sum(cumulative_tokens[end] - cumulative_tokens[middle])
+            num_windows += len(indices)
+    if num_windows > 0:
+        cancelled_report["survivor_token_rate"] = {
+            "window_s": window_s,
+            "num_windows": num_windows,
+            "before": float(num_tokens_before) / (num_windows * window_s),
+            "after": float(num_tokens_after) / (num_windows * window_s),
+        }
+    return cancelled_report
+
+
+def _compute_prefix_cache_statistics(request_records: List[RequestRecord]) -> Dict[str, Any]:
+    """Compute the TTFT statistics of the requests whose prefix is used for the first time
+    (cold) and of the requests that reuse a prefix, and of the reuses by the reuse
+    distance in power-of-two buckets, so that the distance where the TTFT climbs back
+    to the cold one tells the number of prefixes the server cache holds.
+    """
+
+    def _ttft_statistics(records: List[RequestRecord]) -> Dict[str, Any]:
+        ttfts = pd.Series([record.metrics.time_to_first_token_s for record in records])
+        return {
+            "num_requests": len(records),
+            "mean": ttfts.mean(),
+            "p50": ttfts.quantile(0.5),
+            "p99": ttfts.quantile(0.99),
+        }
+
+    cold = [record for record in request_records if record.prefix_reuse_distance == -1]
+    reused = [
+        record
+        for record in request_records
+        if record.prefix_reuse_distance is not None and record.prefix_reuse_distance >= 0
+    ]
+    # The bucket of distances [2^k - 1, 2^(k+1) - 2] hits with a cache of 2^k prefixes.
+    buckets: Dict[int, List[RequestRecord]] = {}
+    for record in reused:
+        bucket_begin = (1 << ((record.prefix_reuse_distance + 1).bit_length() - 1)) - 1
+        buckets.setdefault(bucket_begin, []).append(record)
+
+    prefix_report: Dict[str, Any] = {}
+    if cold:
+        prefix_report["cold"] = _ttft_statistics(cold)
+    if reused:
+        prefix_report["reused"] = _ttft_statistics(reused)
+        prefix_report["reuse_distance"] = {
+            (f"{begin}-{2 * begin}" if begin > 0 else "0"): _ttft_statistics(records)
+            for begin, records in sorted(buckets.items())
+        }
+    if cold and reused:
+        prefix_report["ttft_p50_speedup"] = (
+            prefix_report["cold"]["p50"] / prefix_report["reused"]["p50"]
+        )
+    return prefix_report
+
+
+def _compute_session_statistics(request_records: List[RequestRecord]) -> Dict[str, Any]:
+    """Compute the number of sessions and turns, and the input tokens (i.e., the context
+    with the history) and the TTFT of the requests by the turn in the session.
+    """
+    records_by_turn: Dict[int, List[RequestRecord]] = {}
+    for record in request_records:
+        if record.session_id is not None:
+            records_by_turn.setdefault(record.turn_id, []).append(record)
+    num_session_requests = sum(len(records) for records in records_by_turn.values())
+    num_sessions = len(
+        {record.session_id for record in request_records if record.session_id is not None}
+    )
+    turns: Dict[str, Dict[str, Any]] = {}
+    for turn_id, records in sorted(records_by_turn.items()):
+        ttfts = pd.Series([record.metrics.time_to_first_token_s for record in records])
+        turns[str(turn_id + 1)] = {
+            "num_requests": len(records),
+            "input_tokens_mean": float(
+                np.mean([record.metrics.input_tokens for record in records])
+            ),
+            "ttft_p50": ttfts.quantile(0.5),
+            "ttft_p99": ttfts.quantile(0.99),
+        }
+    return {
+        "num_sessions": num_sessions,
+        "mean_turns": num_session_requests / num_sessions,
+        "turns": turns,
+    }
+
+
 def _compute_metrics_statistics(metrics: List[Union[Metrics, ServerMetrics]]) -> Dict[str, Any]:
     """
     Compute the statistics of the metrics.
@@ -133,23 +540,42 @@ def _compute_metrics_statistics(metrics: List[Union[Metrics, ServerMetrics]]) ->
     report: Dict = {}
     df = pd.DataFrame([metric.model_dump() for metric in metrics])
     for key, _ in metrics[0].model_fields.items():
-        if key in ["success", "start_time", "finish_time", "server_metrics", "exec_feature"]:
+        if key in [
+            "success",
+            "cancelled",
+            "start_time",
+            "finish_time",
+            "server_metrics",
+            "usage_input_tokens",
+            "usage_output_tokens",
+            "scheduled_start_time",
+            "chunk_intervals",
+            "chunk_num_tokens",
+            "num_decode_stalls",
+            "exec_feature",
+        ]:
             continue
         if key in df.columns:
             series = df[key].dropna()
-            report[key] = {
-                "quantiles": {
-                    f"p{int(q * 100)}": v
-                    for q, v in series.quantile([0.25, 0.5, 0.75, 0.9, 0.95, 0.99]).items()
-                },
-                "mean": series.mean(),
-                "min": series.min(),
-                "max": series.max(),
-                "stddev": series.std(),
-            }
+            if series.empty:
+                continue
+            report[key] = _compute_series_statistics(series)
     return report
 
 
+def _compute_series_statistics(series: pd.Series) -> Dict[str, Any]:
+    return {
+        "quantiles": {
+            f"p{int(q * 100)}": v
+            for q, v in series.quantile([0.25, 0.5, 0.75, 0.9, 0.95, 0.99]).items()
+        },
+        "mean": series.mean(),
+        "min": series.min(),
+        "max": series.max(),
+        "stddev": series.std(),
+    }
+
+
 def convert_reports_to_df(reports: List[Dict[str, Any]]) -> pd.DataFrame:
     """Convert benchmark reports to pandas DataFrame."""
 
@@ -243,6 +669,37 @@ def pretty_print_report(report: Dict[str, Any]) -> None:  # pylint: disable=too-
         print(f"{'Min:':<40} {e2e_latency['min'] * 1000:<10.2f}")
         print(f"{'Max:':<40} {e2e_latency['max'] * 1000:<10.2f}")
 
+        if "schedule_lag_s" in report:
+            schedule_lag = report["schedule_lag_s"]
+            print(" Schedule Lag (ms) ".center(50, "-"))
+            print(f"{'Mean:':<40} {schedule_lag['mean'] * 1000:<10.2f}")
+            print(f"{'P50:':<40} {schedule_lag['quantiles']['p50'] * 1000:<10.2f}")
+            print(f"{'P99:':<40} {schedule_lag['quantiles']['p99'] * 1000:<10.2f}")
+            print(f"{'Max:':<40} {schedule_lag['max'] * 1000:<10.2f}")
+            corrected_e2e = report["corrected_end_to_end_latency_s"]
+            print(" Latency from Scheduled Time (ms) ".center(50, "-"))
+            if "corrected_time_to_first_token_s" in report:
+                corrected_ttft = report["corrected_time_to_first_token_s"]
+                print(f"{'TTFT P50:':<40} {corrected_ttft['quantiles']['p50'] * 1000:<10.2f}")
+                print(f"{'TTFT P99:':<40} {corrected_ttft['quantiles']['p99'] * 1000:<10.2f}")
+            print(f"{'End-to-End P50:':<40} {corrected_e2e['quantiles']['p50'] * 1000:<10.2f}")
+            print(f"{'End-to-End P99:':<40} {corrected_e2e['quantiles']['p99'] * 1000:<10.2f}")
+
+        if "token_inter_token_latency_s" in report:
+            token_itl = report["token_inter_token_latency_s"]
+            print(" Per-Token Inter-Token Latency (ms) ".center(50, "-"))
+            print(f"{'Mean:':<40} {token_itl['mean'] * 1000:<10.2f}")
+            print(f"{'P50:':<40} {token_itl['quantiles']['p50'] * 1000:<10.2f}")
+            print(f"{'P90:':<40} {token_itl['quantiles']['p90'] * 1000:<10.2f}")
+            print(f"{'P99:':<40} {token_itl['quantiles']['p99'] * 1000:<10.2f}")
+            print(f"{'Max:':<40} {token_itl['max'] * 1000:<10.2f}")
+            if "max_stall_s" in report:
+                max_stall = report["max_stall_s"]
+                print(f"{'Max stall per request P50 (ms):':<40} {max_stall['quantiles']['p50'] * 1000:<10.2f}")
+                print(f"{'Max stall per request P99 (ms):':<40} {max_stall['quantiles']['p99'] * 1000:<10.2f}")
+            print(f"{'Decode stalls:':<40} {report['num_decode_stalls']:<10}")
+            print(f"{'Requests with decode stalls:':<40} {report['num_stalled_requests']:<10}")
+
         input_tokens = report["input_tokens"]
         print(" Input Tokens ".center(50, "-"))
         print(f"{'Mean:':<40} {input_tokens['mean']:<1}")
@@ -265,8 +722,63 @@ def pretty_print_report(report: Dict[str, Any]) -> None:  # pylint: disable=too-
 
         print("=" * 50)
 
+    def _print_endpoints(endpoint_reports: Dict[str, Dict[str, Any]]) -> None:
+        print(" Per-Endpoint Results ".center(50, "="))
+        for endpoint, endpoint_report in endpoint_reports.items():
+            print(f" {endpoint} ".center(50, "-"))
+            print(f"{'Completed requests:':<40} {endpoint_report['num_completed_requests']:<10}")
+            print(f"{'Request throughput (req/s):':<40} {endpoint_report['request_throughput']:<10.2f}")
+            print(f"{'Output token throughput (tok/s):':<40} {endpoint_report['output_token_throughput']:<10.2f}")
+            for key, name in [
+                ("time_to_first_token_s", "TTFT"),
+                ("time_per_output_token_s", "TPOT"),
+                ("end_to_end_latency_s", "End-to-End"),
+            ]:
+                if key in endpoint_report:
+                    print(f"{name + ' P50/P99 (ms):':<40} {endpoint_report[key]['p50'] * 1000:.2f}/{endpoint_report[key]['p99'] * 1000:.2f}")
+        print("=" * 50)
+
+    def _print_prefix_cache(prefix_report: Dict[str, Any]) -> None:
+        print(" Prefix Cache TTFT (ms) ".center(50, "="))
+        groups = [(name.capitalize(), prefix_report[name]) for name in ["cold", "reused"] if name in prefix_report]
+        groups += [(f"Reuse distance {bucket}", stats) for bucket, stats in prefix_report.get("reuse_distance", {}).items()]
+        for name, stats in groups:
+            print(f"{name + ' (' + str(stats['num_requests']) + ' req) P50/P99:':<40} {stats['p50'] * 1000:.2f}/{stats['p99'] * 1000:.2f}")
+        if "ttft_p50_speedup" in prefix_report:
+            print(f"{'TTFT P50 speedup of reuse over cold:':<40} {prefix_report['ttft_p50_speedup']:<10.2f}")
+        print("=" * 50)
+
+    def _print_cancelled(cancelled_report: Dict[str, Any], num_cancelled_requests: int) -> None:
+        print(" Cancelled Requests ".center(50, "="))
+        print(f"{'Cancelled requests:':<40} {num_cancelled_requests:<10}")
+        time_to_cancel = cancelled_report["time_to_cancel_s"]
+        print(f"{'Time to cancel P50/P99 (ms):':<40} {time_to_cancel['quantiles']['p50'] * 1000:.2f}/{time_to_cancel['quantiles']['p99'] * 1000:.2f}")
+        print(f"{'Mean output chunks received:':<40} {cancelled_report['output_chunks_mean']:<10.2f}")
+        if "survivor_token_rate" in cancelled_report:
+            rate = cancelled_report["survivor_token_rate"]
+            print(f"{'Survivor tok/s per request before:':<40} {rate['before']:<10.2f}")
+            print(f"{'Survivor tok/s per request after:':<40} {rate['after']:<10.2f}")
+        print("=" * 50)
+
+    def _print_sessions(session_report: Dict[str, Any]) -> None:
+        print(" User Sessions ".center(50, "="))
+        print(f"{'Sessions:':<40} {session_report['num_sessions']:<10}")
+        print(f"{'Mean turns per session:':<40} {session_report['mean_turns']:<10.2f}")
+        print(f"{'Turn':<8} {'Requests':>10} {'Input tok':>10} {'TTFT P50 ms':>12} {'P99 ms':>8}")
+        for turn, stats in session_report["turns"].items():
+            print(f"{turn:<8} {stats['num_requests']:>10} {stats['input_tokens_mean']:>10.1f} {stats['ttft_p50'] * 1000:>12.2f} {stats['ttft_p99'] * 1000:>8.2f}")
+        print("=" * 50)
+
     # fmt: on
     # pylint: enable=line-too-long
     _print(report, server_metrics=False)
+    if "endpoints" in report:
+        _print_endpoints(report["endpoints"])
+    if "cancelled" in report:
+        _print_cancelled(report["cancelled"], report["num_cancelled_requests"])
+    if "prefix_cache" in report:
+        _print_prefix_cache(report["prefix_cache"])
+    if "sessions" in report:
+        _print_sessions(report["sessions"])
     if "server_metrics" in report:
         _print(report["server_metrics"], server_metrics=True)
@@ -22,11 +22,19 @@ def run_benchmark( model: str=None, dataset: str=None, tokenizer: str=None, host
     if not dataset:
         dataset = 'anon8231489123/ShareGPT_Vicuna_unfiltered/ShareGPT_V3_unfiltered_cleaned_split.json'
 
-    dataset_path = download_dataset(dataset, **kwargs)
+    # the synthetic dataset runs offline, without a dataset download or a tokenizer
+    # (unless one is given), and the token counts then come from the server's usage
+    synthetic = (dataset == 'synthetic')
 
-    tokenizer_path = download_model(tokenizer if tokenizer else model, 
-                                    download_kwargs={} if tokenizer else {'local_files_only': True}, 
-                                    **kwargs) 
+    if synthetic:
+        dataset_path = None
+        tokenizer_path = download_model(tokenizer, **kwargs) if tokenizer else None
+    else:
+        dataset_path = download_dataset(dataset, **kwargs)
+
+        tokenizer_path = download_model(tokenizer if tokenizer else model, 
+                                        download_kwargs={} if tokenizer else {'local_files_only': True}, 
+                                        **kwargs) 
 
     output_path = resolve_path(kwargs.get('cache_benchmarks'))
     output_file = os.path.join(output_path, str(Path(model).name).replace('.', '_').lower() + f'_{env.get("SYSTEM_ID", "UNKNOWN_SYSTEM")}_{cudaShortVersion()}')
@@ -36,9 +44,16 @@ def run_benchmark( model: str=None, dataset: str=None, tokenizer: str=None, host
 
     cmd = ['python3 -m sudonim.bench']
 
-    cmd += [f'--dataset sharegpt']
-    cmd += [f'--dataset-path {dataset_path}']
-    cmd += [f'--tokenizer {tokenizer_path}']
+    if synthetic:
+        cmd += [f'--dataset synthetic']
+    else:
+        cmd += [f'--dataset sharegpt']
+        cmd += [f'--dataset-path {dataset_path}']
+        cmd += [f'--dataset-cache {os.path.join(output_path, "datasets")}']
+
+    if tokenizer_path:
+        cmd += [f'--tokenizer {tokenizer_path}']
+
     cmd += [f'--model-name {model}']
     cmd += [f'--api-endpoint openai']  # openai-chat
     cmd += [f'--num-requests {kwargs.get("max_requests", 25)}']